@@ -0,0 +1,107 @@
+from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
+
+from .models import Profile, SlowQuery
+
+
+class ProfileAdmin(admin.ModelAdmin):
+    list_display = (
+        'created',
+        'view_name',
+        'path',
+        'user',
+        'status',
+        'duration',
+        'sampled',
+        'downloads',
+    )
+    list_filter = ('view_name', 'sampled')
+    search_fields = ('path',)
+    exclude = ('stats', 'stacks')
+    readonly_fields = (
+        'created', 'path', 'view_name', 'user', 'status', 'duration',
+        'sampled', 'downloads', 'report',
+    )
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        return [
+            path('<int:pk>/stats/',
+                 self.admin_site.admin_view(self.download_stats),
+                 name='core_profile_stats'),
+            path('<int:pk>/stacks/',
+                 self.admin_site.admin_view(self.download_stacks),
+                 name='core_profile_stacks'),
+        ] + super().get_urls()
+
+    def downloads(self, obj):
+        return format_html(
+            '<a href="{}">pstats</a> / <a href="{}">flamegraph</a>',
+            reverse('admin:core_profile_stats', args=[obj.pk]),
+            reverse('admin:core_profile_stacks', args=[obj.pk]))
+    downloads.short_description = 'Файлы'
+
+    def report(self, obj):
+        return format_html('<pre>{}</pre>', obj.report())
+    report.short_description = 'Самые дорогие функции'
+
+    def _download(self, request, pk, content, content_type, extension):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        profile = get_object_or_404(Profile, pk=pk)
+        response = HttpResponse(content(profile), content_type=content_type)
+        response['Content-Disposition'] = (
+            f'attachment; filename="profile-{pk}.{extension}"')
+        return response
+
+    def download_stats(self, request, pk):
+        return self._download(
+            request, pk, lambda profile: bytes(profile.stats),
+            'application/octet-stream', 'prof')
+
+    def download_stacks(self, request, pk):
+        return self._download(
+            request, pk, lambda profile: profile.stacks,
+            'text/plain; charset=utf-8', 'collapsed')
+
+
+class SlowQueryAdmin(admin.ModelAdmin):
+    list_display = (
+        'shape',
+        'view_name',
+        'count',
+        'total_ms',
+        'average_ms',
+        'max_ms',
+        'last_seen',
+    )
+    list_filter = ('view_name',)
+    search_fields = ('shape',)
+    exclude = ('plan',)
+    readonly_fields = (
+        'fingerprint', 'shape', 'count', 'total_ms', 'max_ms', 'last_seen',
+        'sql', 'params', 'view_name', 'query_plan',
+    )
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def query_plan(self, obj):
+        return format_html('<pre>{}</pre>', obj.plan)
+    query_plan.short_description = 'План запроса'
+
+
+admin.site.register(Profile, ProfileAdmin)
+admin.site.register(SlowQuery, SlowQueryAdmin)
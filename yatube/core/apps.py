@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        from . import page_cache
+        page_cache.register_hole('header_user', 'includes/header_user.html')
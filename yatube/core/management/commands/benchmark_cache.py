@@ -0,0 +1,100 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from core.sqlite_cache import SQLiteCache
+
+BACKENDS = ('locmem', 'filebased', 'sqlite')
+OPERATIONS = ('set', 'get', 'get_many', 'incr')
+BATCH = 10
+
+
+def _create(backend, directory, entries):
+    params = {'OPTIONS': {'MAX_ENTRIES': entries}}
+    if backend == 'locmem':
+        return LocMemCache('benchmark', params)
+    if backend == 'filebased':
+        return FileBasedCache(os.path.join(directory, 'files'), params)
+    return SQLiteCache(os.path.join(directory, 'cache.sqlite3'), params)
+
+
+def _run(cache, operation, operations, value, worker):
+    """Секунды на operations операций одного процесса."""
+    keys = [f'bench:{worker}:{i}' for i in range(operations)]
+    start = time.perf_counter()
+    if operation == 'set':
+        for key in keys:
+            cache.set(key, value)
+    elif operation == 'get':
+        for key in keys:
+            cache.get(key)
+    elif operation == 'get_many':
+        for i in range(0, operations, BATCH):
+            cache.get_many(keys[i:i + BATCH])
+    elif operation == 'incr':
+        cache.set('bench:counter', 0)
+        for _ in keys:
+            cache.incr('bench:counter')
+    return time.perf_counter() - start
+
+
+def _worker(args):
+    backend, directory, operations, value_size, worker, processes = args
+    cache = _create(backend, directory, operations * processes * 2)
+    value = os.urandom(value_size)
+    return [
+        _run(cache, operation, operations, value, worker)
+        for operation in OPERATIONS
+    ]
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает скорость кэша SQLite с locmem и файловым кэшем. '
+            'С --processes процессы работают с кэшем одновременно; '
+            'у locmem при этом у каждого процесса свой кэш.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--operations', type=int, default=5000,
+            help='Операций каждого вида на процесс.')
+        parser.add_argument(
+            '--processes', type=int, default=1,
+            help='Сколько процессов работают одновременно.')
+        parser.add_argument(
+            '--value-size', type=int, default=1024,
+            help='Размер значения в байтах.')
+
+    def handle(self, *args, **options):
+        directory = tempfile.mkdtemp(prefix='benchmark-cache-')
+        operations = options['operations']
+        processes = options['processes']
+        self.stdout.write(
+            f'{"":<10}' + ''.join(f'{name:>12}' for name in OPERATIONS)
+            + '  (операций в секунду)')
+        try:
+            for name in BACKENDS:
+                tasks = [
+                    (name, directory, operations, options['value_size'],
+                     worker, processes)
+                    for worker in range(processes)
+                ]
+                if processes == 1:
+                    results = [_worker(tasks[0])]
+                else:
+                    with multiprocessing.Pool(processes) as pool:
+                        results = pool.map(_worker, tasks)
+                rates = [
+                    operations * processes / max(times)
+                    for times in zip(*results)
+                ]
+                self.stdout.write(
+                    f'{name:<10}'
+                    + ''.join(f'{rate:>12.0f}' for rate in rates))
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+
+from core.models import SlowQuery
+
+ORDERS = {
+    'total': '-total_ms',
+    'max': '-max_ms',
+    'count': '-count',
+    'recent': '-last_seen',
+}
+
+
+class Command(BaseCommand):
+    help = ('Выводит журнал медленных запросов, сгруппированный по форме '
+            'запроса, с планом самого медленного случая.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit', type=int, default=20,
+            help='Сколько форм запросов вывести.')
+        parser.add_argument(
+            '--order', choices=ORDERS, default='total',
+            help='Сортировка: по общему, наибольшему времени, числу '
+                 'или по свежести.')
+        parser.add_argument(
+            '--view', help='Только запросы этого представления.')
+        parser.add_argument(
+            '--clear', action='store_true',
+            help='Очистить журнал после вывода; с --view - только '
+                 'записи этого представления.')
+
+    def handle(self, *args, **options):
+        queries = SlowQuery.objects.order_by(ORDERS[options['order']])
+        if options['view']:
+            queries = queries.filter(view_name=options['view'])
+        for query in queries[:options['limit']]:
+            self.stdout.write(
+                f'{query.count} раз, всего {query.total_ms:.0f} мс, '
+                f'в среднем {query.average_ms:.1f} мс, '
+                f'дольше всего {query.max_ms:.1f} мс '
+                f'({query.view_name or "-"})')
+            self.stdout.write(f'  {" ".join(query.shape.split())}')
+            if query.params:
+                self.stdout.write(f'  параметры: {query.params}')
+            for line in query.plan.splitlines():
+                self.stdout.write(f'  | {line}')
+            self.stdout.write('')
+        if options['clear']:
+            queries.delete()
@@ -0,0 +1,355 @@
+"""Метрики в текстовом формате Prometheus, общие для всех процессов.
+
+Каждый процесс сервера пишет свои значения в файл METRICS_DIR/<pid>.db,
+отображенный в память: запись - это сложение числа по известному
+смещению, без системных вызовов. Представление metrics читает файлы
+всех процессов, в том числе завершившихся, и складывает значения.
+Новый процесс переносит значения завершившихся в свой файл, а их файлы
+удаляет: файлы не копятся, а суммы счетчиков не уменьшаются. Без
+METRICS_DIR метрики не собираются.
+
+Формат файла: 8 байт заголовка (занятая длина), затем записи
+[длина ключа: 4 байта][ключ UTF-8, выровненный до 8 байт][double].
+"""
+import glob
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.template.backends import django as django_backend
+
+from .query_budget import counting
+
+HEADER = 8
+INITIAL_SIZE = 64 * 1024
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+
+_registry = {}
+_keys = {}
+_file = None
+_lock = threading.Lock()
+
+
+def _padding(length):
+    return (8 - (4 + length) % 8) % 8
+
+
+def _records(data, used):
+    """(ключ, значение, смещение значения) записей файла."""
+    position = HEADER
+    while position + 4 <= used:
+        length, = struct.unpack_from('i', data, position)
+        position += 4
+        key = bytes(data[position:position + length]).decode()
+        position += length + _padding(length)
+        if position + 8 > used:
+            return
+        value, = struct.unpack_from('d', data, position)
+        yield key, value, position
+        position += 8
+
+
+class _ValuesFile:
+    def __init__(self, path):
+        self.path = path
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT)
+        size = os.fstat(self._fd).st_size
+        if size == 0:
+            os.ftruncate(self._fd, INITIAL_SIZE)
+            size = INITIAL_SIZE
+        self._map = mmap.mmap(self._fd, size)
+        self._used = struct.unpack_from('i', self._map, 0)[0] or HEADER
+        self._positions = {
+            key: position
+            for key, _, position in _records(self._map, self._used)
+        }
+
+    def add(self, key, amount):
+        position = self._positions.get(key)
+        if position is None:
+            position = self._append(key)
+        value, = struct.unpack_from('d', self._map, position)
+        struct.pack_into('d', self._map, position, value + amount)
+
+    def _append(self, key):
+        encoded = key.encode()
+        record = struct.pack(
+            f'i{len(encoded) + _padding(len(encoded))}sd',
+            len(encoded), encoded, 0.0)
+        size = len(self._map)
+        while self._used + len(record) > size:
+            size *= 2
+        if size != len(self._map):
+            self._map.close()
+            os.ftruncate(self._fd, size)
+            self._map = mmap.mmap(self._fd, size)
+        self._map[self._used:self._used + len(record)] = record
+        self._used += len(record)
+        # длина пишется последней: читатель не увидит недописанную запись
+        struct.pack_into('i', self._map, 0, self._used)
+        position = self._used - 8
+        self._positions[key] = position
+        return position
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
+
+
+def _read(path):
+    """(ключ, значение) записей файла, который пишет другой процесс."""
+    with open(path, 'rb') as values_file:
+        data = values_file.read()
+    if len(data) < HEADER:
+        return
+    used = min(struct.unpack_from('i', data, 0)[0], len(data))
+    for key, value, _ in _records(data, used):
+        yield key, value
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _adopt_dead(values):
+    """Переносит в values файлы завершившихся процессов и удаляет их."""
+    for path in glob.glob(os.path.join(settings.METRICS_DIR, '*.db')):
+        name = os.path.basename(path)[:-len('.db')]
+        if not name.isdigit() or _alive(int(name)):
+            continue
+        claimed = f'{path}.{os.getpid()}'
+        try:
+            os.rename(path, claimed)
+        except FileNotFoundError:
+            # файл уже забрал другой новый процесс
+            continue
+        for key, value in _read(claimed):
+            values.add(key, value)
+        os.remove(claimed)
+
+
+def _values_file():
+    global _file
+    if not settings.METRICS_DIR:
+        return None
+    pid = os.getpid()
+    if _file is None or _file.pid != pid:
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        _file = _ValuesFile(os.path.join(settings.METRICS_DIR, f'{pid}.db'))
+        _file.pid = pid
+        _adopt_dead(_file)
+    return _file
+
+
+def _add(key, amount):
+    with _lock:
+        values = _values_file()
+        if values is not None:
+            values.add(key, amount)
+
+
+def _key(sample, labels):
+    name = (sample, tuple(sorted(labels.items())))
+    key = _keys.get(name)
+    if key is None:
+        key = _keys[name] = json.dumps(name, ensure_ascii=False)
+    return key
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        _registry[name] = self
+
+    def inc(self, amount=1, **labels):
+        _add(_key(f'{self.name}_total', labels), amount)
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets) + (float('inf'),)
+        _registry[name] = self
+
+    def observe(self, value, **labels):
+        # в файле счетчики корзин не накопительные: одна запись
+        # на наблюдение, накопление - при выводе
+        bucket = next(le for le in self.buckets if value <= le)
+        _add(_key(f'{self.name}_bucket', dict(labels, le=bucket)), 1)
+        _add(_key(f'{self.name}_sum', labels), value)
+
+
+REQUEST_SECONDS = Histogram(
+    'yatube_request_duration_seconds', 'Время ответа по представлениям.')
+REQUESTS = Counter(
+    'yatube_requests', 'Ответы по представлениям и кодам статуса.')
+DB_QUERIES = Counter(
+    'yatube_db_queries', 'Запросы к базе по представлениям.')
+DB_SECONDS = Counter(
+    'yatube_db_query_seconds', 'Время в базе по представлениям.')
+CACHE_REQUESTS = Counter(
+    'yatube_cache_requests', 'Чтения кэша: попадания и промахи.')
+TEMPLATE_SECONDS = Histogram(
+    'yatube_template_render_seconds', 'Время отрисовки шаблонов.')
+THUMBNAIL_SECONDS = Histogram(
+    'yatube_thumbnail_seconds', 'Время построения миниатюр.',
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+
+
+def record_cache(cache, hits, misses):
+    """Попадания и промахи чтения кэша с меткой cache, если она задана."""
+    if cache is None:
+        return
+    if hits:
+        CACHE_REQUESTS.inc(hits, cache=cache, result='hit')
+    if misses:
+        CACHE_REQUESTS.inc(misses, cache=cache, result='miss')
+
+
+def collect():
+    """Сумма значений по файлам всех процессов: {ключ: значение}."""
+    totals = {}
+    if not settings.METRICS_DIR:
+        return totals
+    for path in glob.glob(os.path.join(settings.METRICS_DIR, '*.db')):
+        try:
+            records = list(_read(path))
+        except FileNotFoundError:
+            # файл завершившегося процесса только что перенесен
+            continue
+        for key, value in records:
+            totals[key] = totals.get(key, 0) + value
+    return totals
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(
+        f'{name}="{_escape(value)}"' for name, value in labels)
+    return '{' + pairs + '}'
+
+
+def _escape(value):
+    if value == float('inf'):
+        return '+Inf'
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace(
+        '"', r'\"')
+
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+def exposition():
+    """Все метрики в текстовом формате Prometheus 0.0.4."""
+    samples = {}
+    for key, value in collect().items():
+        sample, labels = json.loads(key)
+        samples.setdefault(sample, []).append(
+            ([tuple(label) for label in labels], value))
+    lines = []
+    for name, metric in sorted(_registry.items()):
+        lines.append(f'# HELP {name} {metric.documentation}')
+        lines.append(f'# TYPE {name} {metric.kind}')
+        if metric.kind == 'counter':
+            for labels, value in sorted(samples.get(f'{name}_total', [])):
+                lines.append(f'{name}_total{_format_labels(labels)} '
+                             f'{_format_value(value)}')
+            continue
+        buckets = {}
+        for labels, value in samples.get(f'{name}_bucket', []):
+            le = dict(labels)['le']
+            rest = tuple(label for label in labels if label[0] != 'le')
+            buckets.setdefault(rest, {})[le] = value
+        sums = dict(
+            (tuple(labels), value)
+            for labels, value in samples.get(f'{name}_sum', []))
+        for labels in sorted(buckets):
+            total = 0
+            for le in metric.buckets:
+                total += buckets[labels].get(le, 0)
+                lines.append(
+                    f'{name}_bucket'
+                    f'{_format_labels(labels + (("le", le),))} '
+                    f'{_format_value(total)}')
+            lines.append(f'{name}_sum{_format_labels(labels)} '
+                         f'{_format_value(sums.get(labels, 0))}')
+            lines.append(f'{name}_count{_format_labels(labels)} '
+                         f'{_format_value(total)}')
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsMiddleware:
+    """Время ответа и запросы к базе по имени представления."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        with counting() as counter:
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+        match = request.resolver_match
+        view = match.view_name if match is not None else 'unresolved'
+        REQUEST_SECONDS.observe(duration, view=view)
+        REQUESTS.inc(view=view, status=response.status_code)
+        if counter.count:
+            DB_QUERIES.inc(counter.count, view=view)
+            DB_SECONDS.inc(counter.duration, view=view)
+        return response
+
+
+class Template(django_backend.Template):
+    def render(self, context=None, request=None):
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            TEMPLATE_SECONDS.observe(
+                time.perf_counter() - start,
+                template=self.template.origin.template_name or 'string')
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """Бэкенд шаблонов django, который замеряет время отрисовки."""
+
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return Template(self.engine.get_template(template_name), self)
+        except django_backend.TemplateDoesNotExist as exc:
+            django_backend.reraise(exc, self)
+
+
+@receiver(setting_changed)
+def _reset(setting, **kwargs):
+    global _file
+    if setting == 'METRICS_DIR':
+        with _lock:
+            if _file is not None:
+                _file.close()
+            _file = None
@@ -0,0 +1,34 @@
+# Generated by Django 2.2.6 on 2026-10-18 05:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_profile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(max_length=40, unique=True, verbose_name='Отпечаток')),
+                ('shape', models.TextField(verbose_name='Форма запроса')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Раз')),
+                ('total_ms', models.FloatField(default=0, verbose_name='Всего, мс')),
+                ('max_ms', models.FloatField(default=0, verbose_name='Дольше всего, мс')),
+                ('last_seen', models.DateTimeField(verbose_name='Последний раз')),
+                ('sql', models.TextField(blank=True, verbose_name='Запрос')),
+                ('params', models.TextField(blank=True, verbose_name='Параметры')),
+                ('view_name', models.CharField(blank=True, max_length=200, verbose_name='Представление')),
+                ('plan', models.TextField(blank=True, verbose_name='План запроса')),
+            ],
+            options={
+                'verbose_name': 'Медленный запрос',
+                'verbose_name_plural': 'Медленные запросы',
+                'ordering': ('-total_ms',),
+            },
+        ),
+    ]
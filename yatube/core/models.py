@@ -0,0 +1,95 @@
+import io
+import marshal
+import pstats
+
+from django.contrib.auth import get_user_model
+from django.db import models
+
+User = get_user_model()
+
+
+class ProfileQuerySet(models.QuerySet):
+    def forget_old(self, keep):
+        """Удаляет все профили, кроме keep последних."""
+        border = self.order_by('-pk').values_list('pk', flat=True)[keep:]
+        border = border.first()
+        if border is not None:
+            self.filter(pk__lte=border).delete()
+
+
+class Profile(models.Model):
+    """Профиль одного запроса, см. core.profiling."""
+
+    PATH_LENGTH = 500
+
+    created = models.DateTimeField(
+        auto_now_add=True, db_index=True, verbose_name='Время')
+    path = models.CharField(max_length=PATH_LENGTH, verbose_name='Адрес')
+    view_name = models.CharField(
+        max_length=200, blank=True, verbose_name='Представление')
+    user = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='+', verbose_name='Пользователь')
+    status = models.PositiveSmallIntegerField(verbose_name='Код ответа')
+    duration = models.FloatField(verbose_name='Время ответа, с')
+    sampled = models.BooleanField(
+        default=False, verbose_name='Случайная выборка')
+    stats = models.BinaryField(verbose_name='Статистика pstats')
+    stacks = models.TextField(verbose_name='Свернутые стеки')
+
+    objects = ProfileQuerySet.as_manager()
+
+    class Meta:
+        ordering = ('-created',)
+        verbose_name = 'Профиль запроса'
+        verbose_name_plural = 'Профили запросов'
+
+    def __str__(self):
+        return f'{self.path} ({self.duration * 1000:.0f} мс)'
+
+    def report(self, limit=40):
+        """Самые дорогие функции по общему времени, как print_stats."""
+        output = io.StringIO()
+        stats = pstats.Stats(_Loaded(self.stats), stream=output)
+        stats.sort_stats('cumulative').print_stats(limit)
+        return output.getvalue()
+
+
+class SlowQuery(models.Model):
+    """Медленные запросы с одной формой SQL, см. core.slow_queries."""
+
+    fingerprint = models.CharField(
+        max_length=40, unique=True, verbose_name='Отпечаток')
+    shape = models.TextField(verbose_name='Форма запроса')
+    count = models.PositiveIntegerField(default=0, verbose_name='Раз')
+    total_ms = models.FloatField(default=0, verbose_name='Всего, мс')
+    max_ms = models.FloatField(default=0, verbose_name='Дольше всего, мс')
+    last_seen = models.DateTimeField(verbose_name='Последний раз')
+    # самый медленный случай
+    sql = models.TextField(blank=True, verbose_name='Запрос')
+    params = models.TextField(blank=True, verbose_name='Параметры')
+    view_name = models.CharField(
+        max_length=200, blank=True, verbose_name='Представление')
+    plan = models.TextField(blank=True, verbose_name='План запроса')
+
+    class Meta:
+        ordering = ('-total_ms',)
+        verbose_name = 'Медленный запрос'
+        verbose_name_plural = 'Медленные запросы'
+
+    def __str__(self):
+        return self.shape[:100]
+
+    @property
+    def average_ms(self):
+        return self.total_ms / self.count if self.count else 0
+
+
+class _Loaded:
+    """Объект для pstats.Stats со статистикой, прочитанной из базы."""
+
+    def __init__(self, data):
+        self.stats = marshal.loads(bytes(data))
+
+    def create_stats(self):
+        pass
@@ -0,0 +1,103 @@
+"""Кэш целых страниц с пробитыми в них персональными фрагментами.
+
+Страница рендерится один раз от имени гостя, и вместо персональных
+частей (блок пользователя в шапке, кнопка подписки) в ней остаются
+метки-дыры. Тело с метками хранится в кэше, а на каждый запрос - и
+гостя, и пользователя - дыры заполняются маленькими шаблонами,
+зарегистрированными через register_hole.
+"""
+import hashlib
+import re
+from functools import wraps
+from urllib.parse import parse_qsl, urlencode
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+HOLE = re.compile(r'<!--hole:(\w+)\?([^>]*)-->')
+
+_holes = {}
+
+
+def register_hole(name, template_name, context=None):
+    """Регистрирует персональный фрагмент.
+
+    context(request, **params) возвращает дополнительный контекст
+    фрагмента для текущего пользователя.
+    """
+    _holes[name] = (template_name, context)
+
+
+def render_hole(request, name, params):
+    template_name, context_func = _holes[name]
+    context = dict(params)
+    if context_func is not None and request is not None:
+        context.update(context_func(request, **params))
+    return mark_safe(render_to_string(template_name, context, request))
+
+
+def marker(name, params):
+    return mark_safe(f'<!--hole:{name}?{urlencode(params)}-->')
+
+
+def punching(request):
+    """Рендерится ли сейчас страница для кэша, то есть с дырами."""
+    return getattr(request, '_punch_holes', False)
+
+
+def fill(request, body):
+    return HOLE.sub(
+        lambda match: render_hole(
+            request, match.group(1), dict(parse_qsl(match.group(2)))),
+        body)
+
+
+def _render_for_cache(view, request, *args, **kwargs):
+    user = request.user
+    request.user = AnonymousUser()
+    request._punch_holes = True
+    try:
+        return view(request, *args, **kwargs)
+    finally:
+        request.user = user
+        request._punch_holes = False
+
+
+def cache_page(key_func, timeout=None):
+    """Кэширует GET-ответы представления, общие для всех посетителей.
+
+    key_func(request, *args, **kwargs) возвращает ключ страницы или
+    None, если ее не нужно кэшировать. Ключ должен меняться, когда
+    меняются данные страницы: сбрасывать записи не нужно.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            key = key_func(request, *args, **kwargs)
+            if key is None:
+                return view(request, *args, **kwargs)
+            key = 'page:' + hashlib.sha1(key.encode()).hexdigest()
+            cached = cache.get(key)
+            if cached is not None:
+                body, content_type = cached
+                return HttpResponse(
+                    fill(request, body), content_type=content_type)
+            response = _render_for_cache(view, request, *args, **kwargs)
+            if response.streaming:
+                return response
+            body = response.content.decode(response.charset)
+            if response.status_code == 200:
+                cache.set(
+                    key, (body, response['Content-Type']),
+                    settings.PAGE_CACHE_TIMEOUT if timeout is None
+                    else timeout)
+            response.content = fill(request, body)
+            return response
+        return wrapper
+    return decorator
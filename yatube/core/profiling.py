@@ -0,0 +1,128 @@
+"""Профилирование отдельных запросов на боевом сервере.
+
+Сотрудник включает профилирование своего запроса заголовком X-Profile
+или параметром ?_profile=1; кроме того, случайная доля
+PROFILING_SAMPLE_RATE всех запросов профилируется сама. Представление
+вместе с отрисовкой шаблонов выполняется под cProfile, а отдельный
+поток раз в PROFILING_INTERVAL секунд снимает стек запроса. Результат -
+модель Profile: статистика pstats и стеки в свернутом формате
+(collapsed stacks), которые принимают flamegraph.pl и speedscope. Оба
+файла скачиваются из админки. Профиль сохраняется, когда ответ уже
+отправлен, чтобы его запись не попала во время ответа и бюджет запросов.
+Хранятся последние PROFILING_KEEP профилей.
+"""
+import cProfile
+import marshal
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+
+from .models import Profile
+
+HEADER = 'HTTP_X_PROFILE'
+PARAM = '_profile'
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return (f'{code.co_name} '
+            f'({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+
+
+class StackSampler(threading.Thread):
+    """Снимает стек потока ниже кадра root, пока не вызван stop()."""
+
+    def __init__(self, thread_id, root, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.root = root
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None and frame is not self.root:
+                names.append(_frame_name(frame))
+                frame = frame.f_back
+            # стек вне root - запрос еще не начался или уже закончился
+            if frame is not None and names:
+                self.stacks[';'.join(reversed(names))] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+    def collapsed(self):
+        return ''.join(
+            f'{stack} {count}\n' for stack, count in self.stacks.items())
+
+
+class ProfilingMiddleware:
+    """Ставится после AuthenticationMiddleware: нужен request.user."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sampled = random.random() < settings.PROFILING_SAMPLE_RATE
+        if not (sampled or self._requested(request)):
+            return self.get_response(request)
+        return self._profile(request, sampled)
+
+    @staticmethod
+    def _requested(request):
+        if not (request.META.get(HEADER) or request.GET.get(PARAM)):
+            return False
+        user = getattr(request, 'user', None)
+        return user is not None and user.is_staff
+
+    def _profile(self, request, sampled):
+        sampler = StackSampler(
+            threading.get_ident(), sys._getframe(),
+            settings.PROFILING_INTERVAL)
+        profiler = cProfile.Profile()
+        sampler.start()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+            duration = time.perf_counter() - start
+            sampler.stop()
+        profiler.create_stats()
+        response._closable_objects.append(_Saver(
+            request, response, sampled, duration, profiler, sampler))
+        return response
+
+
+class _Saver:
+    """Сохраняет профиль, когда сервер закрывает ответ."""
+
+    def __init__(self, request, response, sampled, duration, profiler,
+                 sampler):
+        match = request.resolver_match
+        user = request.user
+        self.fields = dict(
+            path=request.get_full_path(),
+            view_name=match.view_name if match is not None else '',
+            user=user if user.is_authenticated else None,
+            status=response.status_code,
+            duration=duration,
+            sampled=sampled,
+            stats=marshal.dumps(profiler.stats),
+            stacks=sampler.collapsed(),
+        )
+
+    def close(self):
+        self.fields['path'] = self.fields['path'][:Profile.PATH_LENGTH]
+        Profile.objects.create(**self.fields)
+        Profile.objects.forget_old(settings.PROFILING_KEEP)
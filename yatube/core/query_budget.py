@@ -0,0 +1,160 @@
+"""Бюджет запросов к базе на запрос к сайту и поиск N+1.
+
+QueryBudgetMiddleware считает запросы и время в базе на каждый запрос
+и одинаковые по форме SQL. Если представление вышло за бюджет или один
+и тот же запрос повторился QUERY_REPEAT_THRESHOLD раз (признак N+1),
+в лог core.query_budget пишется предупреждение с именем представления.
+
+Бюджет по умолчанию - QUERY_BUDGET_QUERIES запросов и QUERY_BUDGET_MS
+миллисекунд; у представления его можно задать декоратором
+query_budget. Загрузка сессии и пользователя в бюджет не входит: это
+общая цена всех страниц, поэтому middleware стоит после
+AuthenticationMiddleware. В тестах assert_within_budget проверяет
+представление по адресу, для pytest и unittest одинаково.
+"""
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.contrib.auth.middleware import get_user
+from django.db import connections
+from django.urls import resolve
+from django.utils.functional import SimpleLazyObject
+
+logger = logging.getLogger(__name__)
+
+_placeholders = re.compile(r'\(\s*%s(?:\s*,\s*%s)*\s*\)')
+_literals = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+
+
+def shape(sql):
+    """Форма запроса: без литералов и с любым числом элементов IN."""
+    return _placeholders.sub('(...)', _literals.sub('?', sql))
+
+
+class QueryCounter:
+    """execute_wrapper, который считает запросы, их время и формы."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+        self.paused = False
+
+    def __call__(self, execute, sql, params, many, context):
+        if self.paused:
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.statements[sql] += 1
+
+    def excluding(self, func, *args):
+        """Вызывает func, не считая ее запросов."""
+        paused, self.paused = self.paused, True
+        try:
+            return func(*args)
+        finally:
+            self.paused = paused
+
+    def repeated(self, threshold=None):
+        """Формы, повторенные не меньше threshold раз, с числом повторов."""
+        if threshold is None:
+            threshold = settings.QUERY_REPEAT_THRESHOLD
+        shapes = Counter()
+        for sql, count in self.statements.items():
+            shapes[shape(sql)] += count
+        return [
+            (sql, count) for sql, count in shapes.most_common()
+            if count >= threshold
+        ]
+
+
+@contextmanager
+def counting():
+    """Считает запросы ко всем базам внутри блока."""
+    counter = QueryCounter()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(counter))
+        yield counter
+
+
+class Budget:
+    def __init__(self, queries=None, ms=None):
+        self.queries = (settings.QUERY_BUDGET_QUERIES
+                        if queries is None else queries)
+        self.ms = settings.QUERY_BUDGET_MS if ms is None else ms
+
+    def problems(self, counter):
+        """Описание нарушений бюджета, пустое - бюджет соблюден."""
+        problems = []
+        if counter.count > self.queries:
+            problems.append(
+                f'{counter.count} запросов при бюджете {self.queries}')
+        if counter.duration * 1000 > self.ms:
+            problems.append(
+                f'{counter.duration * 1000:.1f} мс в базе '
+                f'при бюджете {self.ms} мс')
+        for sql, count in counter.repeated():
+            problems.append(f'N+1: {count} раз {sql}')
+        return problems
+
+
+def query_budget(queries=None, ms=None):
+    """Бюджет запросов представления вместо бюджета по умолчанию."""
+    def decorator(view):
+        view.query_budget = Budget(queries, ms)
+        return view
+    return decorator
+
+
+def budget_of(view):
+    return getattr(view, 'query_budget', None) or Budget()
+
+
+class QueryBudgetMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with counting() as counter:
+            if hasattr(request, 'user'):
+                # пользователь загружается лениво, уже внутри представления
+                request.user = SimpleLazyObject(
+                    lambda: counter.excluding(get_user, request))
+            response = self.get_response(request)
+        request.query_counter = counter
+        match = request.resolver_match
+        if match is not None:
+            problems = budget_of(match.func).problems(counter)
+            if problems:
+                logger.warning(
+                    '%s %s: %s', match.view_name, request.path,
+                    '; '.join(problems))
+        return response
+
+
+def assert_within_budget(client, path, data=None, **extra):
+    """Запрашивает path тестовым клиентом и падает, если бюджет нарушен.
+
+    С data отправляется POST. Запросы считает QueryBudgetMiddleware, так
+    что проверяется ровно то, что попало бы в лог. Возвращает ответ,
+    чтобы тест мог проверить и его.
+    """
+    if data is None:
+        response = client.get(path, **extra)
+    else:
+        response = client.post(path, data, **extra)
+    counter = response.wsgi_request.query_counter
+    view = resolve(path.split('?')[0]).func
+    problems = budget_of(view).problems(counter)
+    if problems:
+        raise AssertionError(f'{path}: ' + '; '.join(problems))
+    return response
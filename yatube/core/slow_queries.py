@@ -0,0 +1,134 @@
+"""Журнал медленных запросов к базе с планом выполнения.
+
+SlowQueryMiddleware засекает каждый запрос к базе за время запроса к
+сайту. Запросы дольше SLOW_QUERY_MS миллисекунд складываются в модель
+SlowQuery по отпечатку - хэшу формы запроса (query_budget.shape): число,
+общее и наибольшее время. Для самого медленного случая сохраняются
+параметры, представление и план EXPLAIN QUERY PLAN (только для SQLite).
+Записывается это, когда ответ уже отправлен. Смотреть - в админке или
+командой slow_queries. SLOW_QUERY_MS = None выключает журнал.
+"""
+import hashlib
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import SlowQuery
+from .query_budget import shape
+
+PARAMS_LENGTH = 1000
+
+
+def fingerprint(sql):
+    return hashlib.sha1(shape(sql).encode()).hexdigest()
+
+
+def explain(alias, sql, params):
+    """План запроса деревом, как его выводит консоль sqlite3."""
+    connection = connections[alias]
+    if connection.vendor != 'sqlite':
+        return ''
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        rows = cursor.fetchall()
+    depth = {0: -1}
+    lines = []
+    for node, parent, _, detail in rows:
+        depth[node] = depth.get(parent, -1) + 1
+        lines.append('  ' * depth[node] + detail)
+    return '\n'.join(lines)
+
+
+class SlowQueryCollector:
+    """execute_wrapper, который запоминает запросы дольше порога."""
+
+    def __init__(self, alias, threshold_ms):
+        self.alias = alias
+        self.threshold = threshold_ms / 1000
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            if duration >= self.threshold:
+                self.queries.append(
+                    (self.alias, sql, None if many else params, duration))
+
+
+def record(queries, view_name):
+    """Добавляет медленные запросы к записям журнала по их отпечаткам."""
+    now = timezone.now()
+    for alias, sql, params, duration in queries:
+        ms = duration * 1000
+        key = fingerprint(sql)
+        updated = SlowQuery.objects.filter(fingerprint=key).update(
+            count=F('count') + 1, total_ms=F('total_ms') + ms,
+            last_seen=now)
+        if not updated:
+            try:
+                with transaction.atomic():
+                    SlowQuery.objects.create(
+                        fingerprint=key, shape=shape(sql), count=1,
+                        total_ms=ms, last_seen=now)
+            except IntegrityError:
+                # запись создал параллельный запрос
+                SlowQuery.objects.filter(fingerprint=key).update(
+                    count=F('count') + 1, total_ms=F('total_ms') + ms,
+                    last_seen=now)
+        slowest = SlowQuery.objects.filter(fingerprint=key, max_ms__lt=ms)
+        if not slowest.exists():
+            continue
+        if params is None:
+            # executemany или запрос без параметров
+            shown, plan = '', ''
+        else:
+            shown = repr(params)[:PARAMS_LENGTH]
+            try:
+                plan = explain(alias, sql, params)
+            except Exception as exc:
+                plan = f'EXPLAIN не удался: {exc}'
+        slowest.update(
+            max_ms=ms, sql=sql, params=shown, view_name=view_name,
+            plan=plan)
+
+
+class _Recorder:
+    """Пишет журнал, когда сервер закрывает ответ."""
+
+    def __init__(self, collectors, request):
+        self.collectors = collectors
+        self.request = request
+
+    def close(self):
+        match = self.request.resolver_match
+        view_name = match.view_name if match is not None else ''
+        for collector in self.collectors:
+            record(collector.queries, view_name)
+
+
+class SlowQueryMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        threshold = settings.SLOW_QUERY_MS
+        if threshold is None:
+            return self.get_response(request)
+        collectors = [
+            SlowQueryCollector(connection.alias, threshold)
+            for connection in connections.all()
+        ]
+        with ExitStack() as stack:
+            for connection, collector in zip(connections.all(), collectors):
+                stack.enter_context(connection.execute_wrapper(collector))
+            response = self.get_response(request)
+        if any(collector.queries for collector in collectors):
+            response._closable_objects.append(_Recorder(collectors, request))
+        return response
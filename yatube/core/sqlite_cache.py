@@ -0,0 +1,317 @@
+"""Кэш в файле SQLite, общий для всех процессов на одной машине.
+
+У каждого процесса gunicorn свой LocMemCache: фрагменты лент строятся в
+каждом заново, а сброс поколений в одном процессе не виден другим. Этот
+бэкенд хранит записи в одном файле SQLite в режиме WAL: читатели не
+ждут писателя, файл отображается в память (mmap), и внешний сервис не
+нужен.
+
+Нужен SQLite 3.35 или новее: запись - это UPSERT, а incr - UPDATE с
+RETURNING. Целые числа хранятся как INTEGER, поэтому incr - один
+атомарный UPDATE.
+Остальные значения хранятся в pickle. Число записей и их общий размер
+ведут триггеры в таблице stats. Когда MAX_ENTRIES или MAX_SIZE
+превышены, сначала удаляются просроченные записи, затем давно не
+читавшиеся (LRU). Время чтения обновляется не чаще раза в
+TOUCH_INTERVAL секунд, чтобы горячие ключи не превращали чтения в
+записи.
+
+С OPTIONS['METRICS_LABEL'] попадания и промахи чтений пишутся в
+метрики с этой меткой.
+
+Пример настройки:
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.sqlite_cache.SQLiteCache',
+            'LOCATION': '/var/tmp/yatube-cache.sqlite3',
+            'OPTIONS': {'MAX_ENTRIES': 100_000, 'MAX_SIZE': 256 * 2**20},
+        }
+    }
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.exceptions import ImproperlyConfigured
+
+from . import metrics
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires REAL,
+    accessed REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed);
+CREATE TABLE IF NOT EXISTS stats (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    entries INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO stats VALUES (0, 0, 0);
+CREATE TRIGGER IF NOT EXISTS cache_insert AFTER INSERT ON cache BEGIN
+    UPDATE stats SET entries = entries + 1, size = size + new.size;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_delete AFTER DELETE ON cache BEGIN
+    UPDATE stats SET entries = entries - 1, size = size - old.size;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_update AFTER UPDATE OF size ON cache BEGIN
+    UPDATE stats SET size = size - old.size + new.size;
+END;
+'''
+
+UPSERT = '''
+INSERT INTO cache (key, value, expires, accessed, size)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (key) DO UPDATE SET
+    value = excluded.value, expires = excluded.expires,
+    accessed = excluded.accessed, size = excluded.size
+'''
+
+ALIVE = '(expires IS NULL OR expires > ?)'
+
+# RETURNING появился в SQLite 3.35
+MIN_SQLITE_VERSION = (3, 35)
+
+# SQLite ограничивает число параметров запроса
+CHUNK = 500
+
+
+def _chunks(items):
+    items = list(items)
+    for start in range(0, len(items), CHUNK):
+        yield items[start:start + CHUNK]
+
+
+class SQLiteCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        if sqlite3.sqlite_version_info < MIN_SQLITE_VERSION:
+            minimum = '.'.join(map(str, MIN_SQLITE_VERSION))
+            raise ImproperlyConfigured(
+                f'SQLiteCache нужен SQLite {minimum} или новее, '
+                f'установлен {sqlite3.sqlite_version}')
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = location
+        self._max_size = int(options.get('MAX_SIZE', 64 * 2**20))
+        self._mmap_size = int(options.get('MMAP_SIZE', self._max_size * 2))
+        self._busy_timeout = float(options.get('BUSY_TIMEOUT', 5))
+        self._touch_interval = float(options.get('TOUCH_INTERVAL', 1))
+        self._metrics_label = options.get('METRICS_LABEL')
+        self._local = threading.local()
+
+    def _connect(self):
+        directory = os.path.dirname(self._path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(
+            self._path, timeout=self._busy_timeout, isolation_level=None,
+            check_same_thread=False)
+        connection.execute('PRAGMA journal_mode = WAL')
+        connection.execute('PRAGMA synchronous = NORMAL')
+        connection.execute(f'PRAGMA mmap_size = {self._mmap_size}')
+        connection.executescript(f'BEGIN IMMEDIATE; {SCHEMA} COMMIT;')
+        return connection
+
+    @property
+    def _db(self):
+        # соединение на поток; после fork наследованное не используется
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.connection = self._connect()
+            local.pid = os.getpid()
+        return local.connection
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _encode(self, value):
+        if type(value) is int and -2**63 <= value < 2**63:
+            return value, 8
+        data = pickle.dumps(value, self.pickle_protocol)
+        return data, len(data)
+
+    @staticmethod
+    def _decode(value):
+        if isinstance(value, int):
+            return value
+        return pickle.loads(value)
+
+    def _row(self, key, value, timeout, now):
+        value, size = self._encode(value)
+        expires = self.get_backend_timeout(timeout)
+        return key, value, expires, now, size + len(key)
+
+    def _touch_accessed(self, keys, accessed, now):
+        stale = [
+            key for key, when in zip(keys, accessed)
+            if now - when > self._touch_interval
+        ]
+        for chunk in _chunks(stale):
+            self._db.execute(
+                f'UPDATE cache SET accessed = ? WHERE key IN '
+                f'({", ".join("?" * len(chunk))})', [now, *chunk])
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        row = self._db.execute(
+            f'SELECT value, accessed FROM cache WHERE key = ? AND {ALIVE}',
+            (key, now)).fetchone()
+        metrics.record_cache(self._metrics_label, row is not None, row is None)
+        if row is None:
+            return default
+        self._touch_accessed([key], [row[1]], now)
+        return self._decode(row[0])
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        now = time.time()
+        found = {}
+        accessed = {}
+        for chunk in _chunks(keys):
+            rows = self._db.execute(
+                f'SELECT key, value, accessed FROM cache WHERE key IN '
+                f'({", ".join("?" * len(chunk))}) AND {ALIVE}',
+                [*chunk, now])
+            for key, value, when in rows:
+                found[keys[key]] = self._decode(value)
+                accessed[key] = when
+        self._touch_accessed(accessed, accessed.values(), now)
+        metrics.record_cache(
+            self._metrics_label, len(found), len(keys) - len(found))
+        return found
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        return self._db.execute(
+            f'SELECT 1 FROM cache WHERE key = ? AND {ALIVE}',
+            (key, time.time())).fetchone() is not None
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        row = self._row(self._key(key, version), value, timeout, time.time())
+        self._db.execute(UPSERT, row)
+        self._cull()
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        now = time.time()
+        rows = [
+            self._row(self._key(key, version), value, timeout, now)
+            for key, value in data.items()
+        ]
+        db = self._db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            db.executemany(UPSERT, rows)
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+        self._cull()
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        now = time.time()
+        row = self._row(self._key(key, version), value, timeout, now)
+        # занятый живой записью ключ не перезаписывается
+        cursor = self._db.execute(
+            UPSERT + ' WHERE cache.expires IS NOT NULL '
+                     'AND cache.expires <= ?', (*row, now))
+        if cursor.rowcount:
+            self._cull()
+        return cursor.rowcount == 1
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        cursor = self._db.execute(
+            f'UPDATE cache SET expires = ?, accessed = ? '
+            f'WHERE key = ? AND {ALIVE}',
+            (self.get_backend_timeout(timeout), now, key, now))
+        return cursor.rowcount == 1
+
+    def incr(self, key, delta=1, version=None):
+        db_key = self._key(key, version)
+        now = time.time()
+        # fetchall: пока RETURNING не дочитан, запись не завершена
+        rows = self._db.execute(
+            f'UPDATE cache SET value = value + ?, accessed = ? '
+            f'WHERE key = ? AND typeof(value) = \'integer\' AND {ALIVE} '
+            f'RETURNING value', (delta, now, db_key, now)).fetchall()
+        if rows:
+            return rows[0][0]
+        # нет ключа или в нем не целое число - как у остальных бэкендов;
+        # срок записи остается прежним
+        row = self._db.execute(
+            f'SELECT value FROM cache WHERE key = ? AND {ALIVE}',
+            (db_key, now)).fetchone()
+        if row is None:
+            raise ValueError("Key '%s' not found" % key)
+        new_value = self._decode(row[0]) + delta
+        value, size = self._encode(new_value)
+        self._db.execute(
+            'UPDATE cache SET value = ?, size = ?, accessed = ? WHERE key = ?',
+            (value, size + len(db_key), now, db_key))
+        self._cull()
+        return new_value
+
+    def delete(self, key, version=None):
+        self._db.execute(
+            'DELETE FROM cache WHERE key = ?', (self._key(key, version),))
+
+    def delete_many(self, keys, version=None):
+        keys = [self._key(key, version) for key in keys]
+        for chunk in _chunks(keys):
+            self._db.execute(
+                f'DELETE FROM cache WHERE key IN '
+                f'({", ".join("?" * len(chunk))})', chunk)
+
+    def clear(self):
+        self._db.execute('DELETE FROM cache')
+
+    def stats(self):
+        """Число записей и их общий размер в байтах."""
+        return self._db.execute(
+            'SELECT entries, size FROM stats').fetchone()
+
+    def _cull(self):
+        entries, size = self.stats()
+        if entries <= self._max_entries and size <= self._max_size:
+            return
+        db = self._db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            db.execute(
+                'DELETE FROM cache WHERE expires <= ?', (time.time(),))
+            entries, size = self.stats()
+            if entries > self._max_entries:
+                db.execute(
+                    'DELETE FROM cache WHERE key IN (SELECT key FROM cache '
+                    'ORDER BY accessed LIMIT ?)',
+                    (entries - self._max_entries
+                     + self._max_entries // self._cull_frequency,))
+            entries, size = self.stats()
+            if size > self._max_size:
+                # самые старые записи, пока не освободится лишнее
+                # и еще доля MAX_SIZE про запас
+                excess = (size - self._max_size
+                          + self._max_size // self._cull_frequency)
+                db.execute(
+                    'DELETE FROM cache WHERE key IN ('
+                    'SELECT key FROM (SELECT key, SUM(size) OVER ('
+                    'ORDER BY accessed ROWS UNBOUNDED PRECEDING) - size '
+                    'AS freed FROM cache) WHERE freed < ?)', (excess,))
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
@@ -0,0 +1,90 @@
+"""Кэширование дорогих вычислений без лавины промахов.
+
+Когда запись истекает, все одновременные запросы промахиваются вместе
+и считают одно и то же. get_or_compute этого не допускает:
+
+- пересчитывает тот, кто взял аренду ключа (cache.add с коротким
+  сроком), остальные отдают прежнее значение, пока оно не старше
+  CACHE_STALE_TIMEOUT после истечения;
+- если прежнего значения нет, остальные до CACHE_LEASE_WAIT секунд ждут
+  результата того, кто считает;
+- запись пересчитывается заранее с вероятностью, растущей к концу срока
+  и пропорциональной времени вычисления (XFetch), так что горячий ключ
+  обычно обновляется раньше, чем истечет.
+"""
+import math
+import random
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+LEASE_POLL = 0.05
+
+
+def _lease_key(key):
+    return f'{key}:lease'
+
+
+def _early(delta, expires, now, beta):
+    """Пора ли пересчитать запись, которая истекает в expires."""
+    if expires is None:
+        return False
+    return now - delta * beta * math.log(1 - random.random()) >= expires
+
+
+def _store(cache, key, compute, timeout):
+    start = time.monotonic()
+    value = compute()
+    delta = time.monotonic() - start
+    if timeout is None:
+        cache.set(key, (value, delta, None), None)
+    else:
+        cache.set(key, (value, delta, time.time() + timeout),
+                  timeout + settings.CACHE_STALE_TIMEOUT)
+    return value
+
+
+def _compute_leased(cache, key, compute, timeout, lease):
+    try:
+        return _store(cache, key, compute, timeout)
+    finally:
+        if cache.get(_lease_key(key)) == lease:
+            cache.delete(_lease_key(key))
+
+
+def _acquire(cache, key):
+    lease = uuid.uuid4().hex
+    if cache.add(_lease_key(key), lease, settings.CACHE_LEASE_TIMEOUT):
+        return lease
+
+
+def get_or_compute(key, compute, timeout, using='default', beta=None):
+    """Значение ключа из кэша или compute(), посчитанное одним процессом.
+
+    timeout - сколько секунд значение свежее, None - бессрочно. beta
+    больше 1 пересчитывает раньше, меньше 1 - позже.
+    """
+    cache = caches[using]
+    beta = settings.CACHE_EARLY_BETA if beta is None else beta
+    entry = cache.get(key)
+    if entry is not None:
+        value, delta, expires = entry
+        if not _early(delta, expires, time.time(), beta):
+            return value
+        lease = _acquire(cache, key)
+        if lease is None:
+            return value
+        return _compute_leased(cache, key, compute, timeout, lease)
+    lease = _acquire(cache, key)
+    if lease is not None:
+        return _compute_leased(cache, key, compute, timeout, lease)
+    deadline = time.monotonic() + settings.CACHE_LEASE_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(LEASE_POLL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[0]
+    # тот, кто считает, не успел: считаем сами, но без аренды
+    return _store(cache, key, compute, timeout)
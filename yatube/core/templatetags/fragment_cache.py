@@ -0,0 +1,61 @@
+"""Тег {% cache %} с защитой от лавины промахов.
+
+Синтаксис тот же, что у {% cache %} из django: достаточно загрузить
+fragment_cache вместо cache. Фрагмент пересчитывает один запрос,
+остальные отдают прежнюю версию или ждут его (core.stampede).
+"""
+from django.conf import settings
+from django.core.cache.utils import make_template_fragment_key
+from django.template import (
+    Library, Node, TemplateSyntaxError, VariableDoesNotExist,
+)
+from django.templatetags.cache import do_cache
+
+from core.stampede import get_or_compute
+
+register = Library()
+
+
+class FragmentCacheNode(Node):
+    def __init__(self, node):
+        self.nodelist = node.nodelist
+        self.expire_time_var = node.expire_time_var
+        self.fragment_name = node.fragment_name
+        self.vary_on = node.vary_on
+        self.cache_name = node.cache_name
+
+    def _resolve(self, var, context):
+        try:
+            return var.resolve(context)
+        except VariableDoesNotExist:
+            raise TemplateSyntaxError(
+                f'"cache" tag got an unknown variable: {var.var!r}')
+
+    def render(self, context):
+        expire_time = self._resolve(self.expire_time_var, context)
+        if expire_time is not None:
+            try:
+                expire_time = int(expire_time)
+            except (ValueError, TypeError):
+                raise TemplateSyntaxError(
+                    f'"cache" tag got a non-integer timeout value: '
+                    f'{expire_time!r}')
+        if self.cache_name:
+            using = self._resolve(self.cache_name, context)
+            if using not in settings.CACHES:
+                raise TemplateSyntaxError(
+                    f'Invalid cache name specified for cache tag: {using!r}')
+        elif 'template_fragments' in settings.CACHES:
+            using = 'template_fragments'
+        else:
+            using = 'default'
+        vary_on = [var.resolve(context) for var in self.vary_on]
+        key = make_template_fragment_key(self.fragment_name, vary_on)
+        return get_or_compute(
+            key, lambda: self.nodelist.render(context), expire_time, using)
+
+
+@register.tag('cache')
+def do_fragment_cache(parser, token):
+    """{% cache [expire_time] [fragment_name] [var1] .. [using="name"] %}"""
+    return FragmentCacheNode(do_cache(parser, token))
@@ -0,0 +1,19 @@
+from django import template
+
+from core import page_cache
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def hole(context, name, **params):
+    """Персональный фрагмент страницы.
+
+    Когда страница рендерится для общего кэша, вместо фрагмента
+    выводится метка, которую заполнит page_cache.fill.
+    """
+    params = {key: str(value) for key, value in params.items() if value}
+    request = context.get('request')
+    if page_cache.punching(request):
+        return page_cache.marker(name, params)
+    return page_cache.render_hole(request, name, params)
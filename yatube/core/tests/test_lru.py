@@ -0,0 +1,26 @@
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from core.lru import LRUCache
+
+
+class LRUCacheTests(SimpleTestCase):
+    def test_evicts_least_recently_used(self):
+        """Вытесняется запись, к которой дольше всего не обращались."""
+        lru = LRUCache(max_size=2, ttl=60)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+        self.assertEqual((lru.get('a'), lru.get('b'), lru.get('c')),
+                         (1, None, 3))
+
+    def test_expires_after_ttl(self):
+        """Запись живет не дольше ttl."""
+        lru = LRUCache(max_size=2, ttl=60)
+        lru.set('a', 1)
+        with mock.patch('core.lru.time.monotonic',
+                        return_value=time.monotonic() + 61):
+            self.assertIsNone(lru.get('a'))
@@ -0,0 +1,114 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from core import metrics
+from posts.models import Group
+
+TEMP_METRICS_DIR = tempfile.mkdtemp()
+
+
+@override_settings(METRICS_DIR=TEMP_METRICS_DIR, METRICS_TOKEN='secret')
+class MetricsTest(TestCase):
+    def setUp(self):
+        # файлы прошлого теста уже открыты, их нужно забыть
+        metrics._reset('METRICS_DIR')
+        shutil.rmtree(TEMP_METRICS_DIR, ignore_errors=True)
+        cache.clear()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        metrics._reset('METRICS_DIR')
+        shutil.rmtree(TEMP_METRICS_DIR, ignore_errors=True)
+
+    def test_endpoint_reports_views_db_and_templates(self):
+        """После запроса к странице /metrics видит его время и запросы."""
+        Group.objects.create(title='Группа', slug='group', description='')
+        self.client.get('/group/group/')
+        response = self.client.get(
+            '/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('# TYPE yatube_request_duration_seconds histogram',
+                      body)
+        self.assertIn(
+            'yatube_request_duration_seconds_count'
+            '{view="posts:group_list"} 1\n', body)
+        self.assertIn(
+            'yatube_requests_total{status="200",view="posts:group_list"} 1\n',
+            body)
+        self.assertIn('yatube_db_queries_total{view="posts:group_list"}',
+                      body)
+        self.assertIn('template="posts/group_list.html"', body)
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Корзины гистограммы накапливают меньшие значения."""
+        metrics.REQUEST_SECONDS.observe(0.003, view='v')
+        metrics.REQUEST_SECONDS.observe(0.3, view='v')
+        body = metrics.exposition()
+        self.assertIn(
+            'yatube_request_duration_seconds_bucket{view="v",le="0.005"} 1',
+            body)
+        self.assertIn(
+            'yatube_request_duration_seconds_bucket{view="v",le="0.5"} 2',
+            body)
+        self.assertIn(
+            'yatube_request_duration_seconds_bucket{view="v",le="+Inf"} 2',
+            body)
+        self.assertIn('yatube_request_duration_seconds_count{view="v"} 2\n',
+                      body)
+
+    def test_values_of_all_processes_are_summed(self):
+        """Значения из файлов разных процессов складываются."""
+        metrics.CACHE_REQUESTS.inc(cache='c', result='hit')
+        # файл другого процесса сервера
+        other = metrics._ValuesFile(os.path.join(TEMP_METRICS_DIR, '1.db'))
+        other.add(metrics._key('yatube_cache_requests_total',
+                               {'cache': 'c', 'result': 'hit'}), 2)
+        other.close()
+        self.assertIn(
+            'yatube_cache_requests_total{cache="c",result="hit"} 3\n',
+            metrics.exposition())
+
+    def test_file_grows_past_initial_size(self):
+        """Записи, не влезшие в начальный размер файла, не теряются."""
+        for number in range(3000):
+            metrics.REQUESTS.inc(view=f'view{number}', status=200)
+        values = metrics.collect()
+        self.assertEqual(len(values), 3000)
+        self.assertEqual(sum(values.values()), 3000)
+
+    def test_dead_processes_are_folded_into_live_file(self):
+        """Файл завершившегося процесса переносится в файл нового."""
+        process = subprocess.Popen([sys.executable, '-c', ''])
+        process.wait()
+        dead = os.path.join(TEMP_METRICS_DIR, f'{process.pid}.db')
+        os.makedirs(TEMP_METRICS_DIR, exist_ok=True)
+        values = metrics._ValuesFile(dead)
+        values.add(metrics._key('yatube_cache_requests_total',
+                                {'cache': 'c', 'result': 'hit'}), 2)
+        values.close()
+        metrics.CACHE_REQUESTS.inc(cache='c', result='hit')
+        self.assertEqual(
+            os.listdir(TEMP_METRICS_DIR), [f'{os.getpid()}.db'])
+        self.assertIn(
+            'yatube_cache_requests_total{cache="c",result="hit"} 3\n',
+            metrics.exposition())
+
+    def test_endpoint_requires_token(self):
+        """Без верного токена /metrics отвечает 404 и с локального адреса."""
+        for headers in ({}, {'HTTP_AUTHORIZATION': 'Bearer wrong'}):
+            with self.subTest(headers=headers):
+                response = self.client.get(
+                    '/metrics', REMOTE_ADDR='127.0.0.1', **headers)
+                self.assertEqual(response.status_code, 404)
+        with override_settings(METRICS_TOKEN=None):
+            response = self.client.get(
+                '/metrics', HTTP_AUTHORIZATION='Bearer None')
+            self.assertEqual(response.status_code, 404)
@@ -0,0 +1,96 @@
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from core.models import Profile
+from core.profiling import StackSampler
+
+User = get_user_model()
+
+
+def busy(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+class ProfilingTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.staff = User.objects.create_superuser(
+            'staff', 'staff@example.com', 'password')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_staff_request_is_profiled(self):
+        """Сотрудник с заголовком X-Profile получает профиль запроса."""
+        self.client.force_login(self.staff)
+        self.client.get('/profile/author/', HTTP_X_PROFILE='1')
+        profile = Profile.objects.get()
+        self.assertEqual(profile.view_name, 'posts:profile')
+        self.assertEqual(profile.user, self.staff)
+        self.assertFalse(profile.sampled)
+        self.assertIn('render', profile.report())
+
+    def test_other_users_cannot_profile(self):
+        """Флаг от обычного пользователя игнорируется."""
+        self.client.force_login(self.author)
+        self.client.get('/profile/author/?_profile=1')
+        self.assertFalse(Profile.objects.exists())
+
+    @override_settings(PROFILING_SAMPLE_RATE=1)
+    def test_sampled_requests_are_profiled(self):
+        """Случайная выборка профилирует и запросы гостей."""
+        self.client.get('/')
+        profile = Profile.objects.get()
+        self.assertTrue(profile.sampled)
+        self.assertIsNone(profile.user)
+
+    @override_settings(PROFILING_KEEP=2)
+    def test_only_latest_profiles_are_kept(self):
+        """Старые профили удаляются."""
+        self.client.force_login(self.staff)
+        for _ in range(3):
+            self.client.get('/', HTTP_X_PROFILE='1')
+        self.assertEqual(Profile.objects.count(), 2)
+
+    def test_admin_downloads(self):
+        """pstats из админки читается модулем pstats."""
+        self.client.force_login(self.staff)
+        self.client.get('/', HTTP_X_PROFILE='1')
+        pk = Profile.objects.get().pk
+        response = self.client.get(f'/admin/core/profile/{pk}/stats/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('attachment', response['Content-Disposition'])
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'profile.prof')
+            with open(path, 'wb') as stats_file:
+                stats_file.write(response.content)
+            self.assertTrue(pstats.Stats(path).total_calls)
+        response = self.client.get(f'/admin/core/profile/{pk}/stacks/')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(f'/admin/core/profile/{pk}/change/')
+        self.assertContains(response, 'Самые дорогие функции')
+
+    def test_sampler_collapses_stacks_below_root(self):
+        """Стеки начинаются от корневого кадра, кадры выше не видны."""
+        sampler = StackSampler(
+            threading.get_ident(), sys._getframe(), 0.001)
+        sampler.start()
+        busy(0.05)
+        sampler.stop()
+        stacks = dict(
+            line.rsplit(' ', 1) for line in sampler.collapsed().splitlines())
+        self.assertTrue(
+            any(stack.startswith('busy (') for stack in stacks))
+        for stack in stacks:
+            self.assertNotIn('test_sampler_collapses_stacks', stack)
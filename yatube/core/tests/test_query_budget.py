@@ -0,0 +1,56 @@
+from django.contrib.auth import get_user_model
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
+from django.urls import ResolverMatch
+
+from core.query_budget import (
+    QueryBudgetMiddleware, counting, query_budget, shape,
+)
+
+User = get_user_model()
+
+
+class QueryBudgetTest(TestCase):
+    def test_shape_ignores_literals_and_in_lists(self):
+        """Запросы, отличающиеся литералами и длиной IN, - одна форма."""
+        self.assertEqual(
+            shape('SELECT * FROM t WHERE id IN (%s, %s) AND a = 10'),
+            shape("SELECT * FROM t WHERE id IN (%s) AND a = 'x'"))
+
+    def test_counting_finds_repeated_queries(self):
+        """Один и тот же запрос в цикле виден как N+1."""
+        users = [User.objects.create_user(f'user{i}') for i in range(5)]
+        with counting() as counter:
+            for user in users:
+                User.objects.get(pk=user.pk)
+        self.assertEqual(counter.count, 5)
+        self.assertEqual(len(counter.repeated()), 1)
+
+    def test_middleware_logs_over_budget(self):
+        """Превышение бюджета пишется в лог с именем представления."""
+        @query_budget(queries=1)
+        def view(request):
+            User.objects.count()
+            User.objects.exists()
+            return HttpResponse()
+
+        def get_response(request):
+            request.resolver_match = ResolverMatch(
+                view, (), {}, url_name='view', namespaces=['test'])
+            return view(request)
+
+        middleware = QueryBudgetMiddleware(get_response)
+        with self.assertLogs('core.query_budget', 'WARNING') as logs:
+            middleware(RequestFactory().get('/'))
+        self.assertIn('test:view', logs.output[0])
+        self.assertIn('2 запросов при бюджете 1', logs.output[0])
+
+    def test_session_and_user_not_counted(self):
+        """Загрузка сессии и пользователя не входит в бюджет страницы."""
+        self.client.force_login(User.objects.create_user('reader'))
+        response = self.client.get('/follow/')
+        self.assertTrue(response.wsgi_request.user.is_authenticated)
+        statements = response.wsgi_request.query_counter.statements
+        for sql in statements:
+            self.assertNotIn('django_session', sql)
+            self.assertNotIn('FROM "auth_user"', sql)
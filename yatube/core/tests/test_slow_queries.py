@@ -0,0 +1,71 @@
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from core.models import SlowQuery
+from core.slow_queries import fingerprint
+from posts.models import Group
+
+
+@override_settings(SLOW_QUERY_MS=0)
+class SlowQueryTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Group.objects.create(title='Группа', slug='group', description='')
+
+    def setUp(self):
+        cache.clear()
+
+    def group_query(self):
+        return SlowQuery.objects.get(
+            view_name='posts:group_list',
+            shape__startswith='SELECT "posts_group"."id" FROM')
+
+    def test_queries_over_threshold_are_logged_with_plan(self):
+        """Запрос дольше порога попадает в журнал с планом и параметрами."""
+        self.client.get('/group/group/')
+        query = self.group_query()
+        self.assertEqual(query.count, 1)
+        self.assertIn("'group'", query.params)
+        self.assertIn('posts_group', query.plan)
+
+    def test_queries_are_grouped_by_fingerprint(self):
+        """Один запрос с разными параметрами - одна запись журнала."""
+        self.assertEqual(
+            fingerprint('SELECT * FROM t WHERE id IN (%s, %s) AND a = 1'),
+            fingerprint('SELECT * FROM t WHERE id IN (%s) AND a = 2'))
+        Group.objects.create(title='Другая', slug='other', description='')
+        self.client.get('/group/group/')
+        cache.clear()
+        self.client.get('/group/other/')
+        query = self.group_query()
+        self.assertEqual(query.count, 2)
+        self.assertGreaterEqual(query.total_ms, query.max_ms)
+
+    @override_settings(SLOW_QUERY_MS=None)
+    def test_disabled_log_records_nothing(self):
+        """Без порога журнал не ведется."""
+        self.client.get('/group/group/')
+        self.assertFalse(SlowQuery.objects.exists())
+
+    def test_command_prints_log(self):
+        """Команда выводит форму запроса и его план."""
+        self.client.get('/group/group/')
+        out = StringIO()
+        call_command('slow_queries', view='posts:group_list', stdout=out)
+        self.assertIn('"posts_group"', out.getvalue())
+        self.assertIn('| ', out.getvalue())
+
+    def test_clear_respects_view(self):
+        """--clear с --view удаляет только записи этого представления."""
+        self.client.get('/group/group/')
+        other = SlowQuery.objects.create(
+            fingerprint='other', shape='SELECT 1', count=1, total_ms=1,
+            max_ms=1, last_seen=timezone.now(), view_name='posts:index')
+        call_command(
+            'slow_queries', view='posts:group_list', clear=True,
+            limit=1, stdout=StringIO())
+        self.assertEqual(list(SlowQuery.objects.all()), [other])
@@ -0,0 +1,105 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase
+
+from core.sqlite_cache import SQLiteCache
+
+
+def _incr_many(path, times):
+    cache = SQLiteCache(path, {})
+    for _ in range(times):
+        cache.incr('counter')
+
+
+class SQLiteCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.path = os.path.join(self.directory, 'cache.sqlite3')
+        self.cache = self.create()
+
+    def create(self, **options):
+        return SQLiteCache(self.path, {'OPTIONS': options})
+
+    def test_set_get_delete(self):
+        """Значения переживают pickle, удаление и срок жизни работают."""
+        self.cache.set('post', {'text': 'Пост', 'id': 1})
+        self.assertEqual(self.cache.get('post'), {'text': 'Пост', 'id': 1})
+        self.assertTrue(self.cache.has_key('post'))
+        self.cache.delete('post')
+        self.assertEqual(self.cache.get('post', 'нет'), 'нет')
+        self.cache.set('expired', 1, 0)
+        self.assertIsNone(self.cache.get('expired'))
+        self.assertTrue(self.cache.add('expired', 2))
+        self.assertFalse(self.cache.add('expired', 3))
+        self.assertEqual(self.cache.get('expired'), 2)
+
+    def test_shared_between_instances(self):
+        """Запись одного процесса сразу видна другому."""
+        self.cache.set_many({'a': 1, 'b': [2], 'c': 'три'})
+        other = self.create()
+        self.assertEqual(
+            other.get_many(['a', 'b', 'c', 'd']),
+            {'a': 1, 'b': [2], 'c': 'три'})
+        other.delete_many(['a', 'b'])
+        self.assertEqual(self.cache.get_many(['a', 'b', 'c']), {'c': 'три'})
+
+    def test_incr_is_atomic(self):
+        """Одновременные incr из разных процессов не теряются."""
+        self.cache.set('counter', 0)
+        context = multiprocessing.get_context('fork')
+        processes = [
+            context.Process(target=_incr_many, args=(self.path, 100))
+            for _ in range(4)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.assertEqual(self.cache.get('counter'), 400)
+        self.assertEqual(self.cache.decr('counter', 50), 350)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_incr_of_pickled_number_keeps_timeout(self):
+        """incr числа, которое хранится в pickle, не продлевает запись."""
+        self.cache.set('big', 2**70, 60)
+        expires = self.cache._db.execute(
+            "SELECT expires FROM cache WHERE key = ':1:big'").fetchone()
+        self.assertEqual(self.cache.incr('big'), 2**70 + 1)
+        self.assertEqual(self.cache.get('big'), 2**70 + 1)
+        self.assertEqual(self.cache._db.execute(
+            "SELECT expires FROM cache WHERE key = ':1:big'").fetchone(),
+            expires)
+
+    def test_old_sqlite_rejected(self):
+        """На SQLite без UPSERT и RETURNING кэш не создается."""
+        with mock.patch('sqlite3.sqlite_version_info', (3, 31, 1)):
+            with self.assertRaisesMessage(ImproperlyConfigured, '3.35'):
+                self.create()
+
+    def test_lru_eviction_by_size(self):
+        """При превышении MAX_SIZE вытесняются давно не читавшиеся."""
+        cache = self.create(MAX_SIZE=6000, TOUCH_INTERVAL=0)
+        value = 'x' * 1000
+        for key in 'abcde':
+            cache.set(key, value)
+        cache.get('a')
+        cache.set('f', value)
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('f'))
+        self.assertLessEqual(cache.stats()[1], 6000)
+
+    def test_max_entries(self):
+        """Число записей не превышает MAX_ENTRIES."""
+        cache = self.create(MAX_ENTRIES=10)
+        for i in range(25):
+            cache.set(f'key{i}', i)
+        self.assertLessEqual(cache.stats()[0], 10)
+        self.assertEqual(cache.get('key24'), 24)
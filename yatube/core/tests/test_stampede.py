@@ -0,0 +1,64 @@
+import threading
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.template import Context, Template
+from django.test import SimpleTestCase
+
+from core.stampede import get_or_compute
+
+
+class GetOrComputeTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    def compute(self, delay=0):
+        self.calls += 1
+        time.sleep(delay)
+        return f'value {self.calls}'
+
+    def test_concurrent_misses_compute_once(self):
+        """Одновременные промахи ждут одного вычисления."""
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(get_or_compute(
+                'key', lambda: self.compute(0.2), 60)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, ['value 1'] * 5)
+
+    def test_stale_served_while_recomputing(self):
+        """Пока другой пересчитывает, отдается истекшее значение."""
+        cache.set('key', ('old', 0.1, time.time() - 1))
+        cache.add('key:lease', 'other', 30)
+        self.assertEqual(get_or_compute('key', self.compute, 60), 'old')
+        self.assertEqual(self.calls, 0)
+        cache.delete('key:lease')
+        self.assertEqual(get_or_compute('key', self.compute, 60), 'value 1')
+        self.assertEqual(get_or_compute('key', self.compute, 60), 'value 1')
+
+    def test_early_recomputation(self):
+        """Дорогая запись пересчитывается незадолго до истечения."""
+        cache.set('key', ('old', 2, time.time() + 1))
+        with mock.patch('core.stampede.random.random', return_value=0.1):
+            self.assertEqual(get_or_compute('key', self.compute, 60), 'old')
+        with mock.patch('core.stampede.random.random', return_value=0.9):
+            self.assertEqual(
+                get_or_compute('key', self.compute, 60), 'value 1')
+
+    def test_template_tag(self):
+        """{% cache %} из fragment_cache - замена тегу django."""
+        template = Template(
+            '{% load fragment_cache %}'
+            '{% cache 60 fragment name %}{{ compute }}{% endcache %}')
+        for _ in range(2):
+            rendered = template.render(Context(
+                {'compute': self.compute, 'name': 'a'}))
+            self.assertEqual(rendered, 'value 1')
@@ -0,0 +1,56 @@
+from django.core.cache import caches
+from django.test import SimpleTestCase
+
+from core.tiered_cache import LOG_SIZE, TieredCache
+
+
+def worker(name):
+    """Кэш отдельного процесса сервера поверх общего L2."""
+    cache = TieredCache(name, {'OPTIONS': {
+        'L2': 'shared', 'L1_PREFIXES': ('hot:',), 'POLL_INTERVAL': 0,
+    }})
+    cache.local.clear()
+    return cache
+
+
+class TieredCacheTest(SimpleTestCase):
+    def setUp(self):
+        caches['shared'].clear()
+        self.first = worker('first')
+        self.second = worker('second')
+
+    def test_hot_keys_served_from_l1(self):
+        """Горячий ключ читается из памяти процесса, остальные - из L2."""
+        self.first.set('hot:gen', 1)
+        self.first.set('cold', 1)
+        shared = caches['shared']
+        shared.delete_many(['hot:gen', 'cold'])
+        self.assertEqual(self.first.get('hot:gen'), 1)
+        self.assertIsNone(self.first.get('cold'))
+        self.assertIsNone(self.second.get('hot:gen'))
+
+    def test_write_invalidates_other_workers(self):
+        """Запись одного процесса сбрасывает L1 остальных."""
+        self.first.set('hot:gen', 1)
+        self.assertEqual(self.second.get('hot:gen'), 1)
+        self.first.incr('hot:gen')
+        self.assertEqual(self.second.get('hot:gen'), 2)
+        self.second.set_many({'hot:gen': 5, 'hot:other': 1})
+        self.assertEqual(
+            self.first.get_many(['hot:gen', 'hot:other']),
+            {'hot:gen': 5, 'hot:other': 1})
+        self.first.delete('hot:other')
+        self.assertIsNone(self.second.get('hot:other'))
+
+    def test_lost_log_clears_l1(self):
+        """Если журнал сбросов потерян, L1 очищается целиком."""
+        self.first.set('hot:a', 1)
+        self.second.get('hot:a')
+        self.first.clear()
+        self.first.set('hot:a', 2)
+        self.assertEqual(self.second.get('hot:a'), 2)
+        self.second.get('hot:a')
+        for i in range(LOG_SIZE + 1):
+            self.first.set(f'hot:{i}', i)
+        caches['shared'].set('hot:a', 3)
+        self.assertEqual(self.second.get('hot:a'), 3)
@@ -0,0 +1,266 @@
+"""Двухуровневый кэш: LRU в памяти процесса перед общим кэшем.
+
+Горячие ключи (поколения лент, поиск группы по slug) читаются на каждом
+запросе, и даже общий кэш на той же машине - лишнее обращение. Ключи с
+префиксами из L1_PREFIXES хранятся еще и в памяти процесса (L1), все
+остальные идут прямо в общий кэш (L2).
+
+Запись в L1-ключ попадает в журнал сбросов в L2: счетчик SEQ и кольцо
+из LOG_SIZE записей (номер, ключ). Раз в POLL_INTERVAL секунд процесс
+читает счетчик и выбрасывает из L1 ключи, записанные другими
+процессами. Если журнал не удается прочитать целиком - отстали больше
+чем на LOG_SIZE, запись еще не дописана или L2 очищен, - L1 очищается
+полностью. L1_TTL ограничивает устаревание в остальных случаях.
+
+С OPTIONS['METRICS_LABEL'] в метрики пишется, нашлось ли значение на
+любом из уровней; попадания в L2 общий кэш считает под своей меткой.
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.tiered_cache.TieredCache',
+            'OPTIONS': {'L2': 'shared', 'L1_PREFIXES': ('posts:gen:',)},
+        },
+        'shared': {...},
+    }
+"""
+import os
+import threading
+import time
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from . import metrics
+from .lru import LRUCache
+
+SEQ = 'tiered:seq'
+LOG_SIZE = 1024
+
+_missing = object()
+_tiers = {}
+_tiers_lock = threading.Lock()
+
+
+def _slot(number):
+    return f'tiered:log:{number % LOG_SIZE}'
+
+
+class _Tier:
+    """L1 и состояние журнала, общие для всех потоков процесса."""
+
+    def __init__(self, options):
+        self.local = LRUCache(
+            int(options.get('L1_SIZE', 1024)),
+            float(options.get('L1_TTL', 60)))
+        self.lock = threading.Lock()
+        self.next_poll = 0
+        # номер последней прочитанной записи журнала; None - счетчика
+        # в L2 нет
+        self.seen = _missing
+        # сколько раз L1 терял записи; чтение, начатое до сброса,
+        # не кладет в L1 прочитанное из L2
+        self.epoch = 0
+
+
+class TieredCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._l2_alias = options['L2']
+        self._prefixes = tuple(options.get('L1_PREFIXES', ()))
+        self._interval = float(options.get('POLL_INTERVAL', 0.5))
+        self._metrics_label = options.get('METRICS_LABEL')
+        # django.core.cache.caches создает бэкенд на каждый поток,
+        # а L1 должен быть один на процесс
+        name = (self._l2_alias, location)
+        with _tiers_lock:
+            if name not in _tiers:
+                _tiers[name] = _Tier(options)
+        self._tier = _tiers[name]
+        self.local = self._tier.local
+        self._name = name
+
+    @property
+    def _token(self):
+        return os.getpid(), self._name
+
+    @property
+    def l2(self):
+        return caches[self._l2_alias]
+
+    def _local(self, key):
+        return key.startswith(self._prefixes) if self._prefixes else False
+
+    def _l1_key(self, key, version):
+        return self.l2.make_key(key, version=version)
+
+    def _l1_timeout(self, timeout):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.l2.default_timeout
+        return timeout
+
+    def _invalidate(self):
+        self._tier.epoch += 1
+
+    def poll(self):
+        """Выбрасывает из L1 ключи, измененные другими процессами."""
+        tier = self._tier
+        now = time.monotonic()
+        with tier.lock:
+            if now < tier.next_poll:
+                return
+            tier.next_poll = now + self._interval
+            seen = tier.seen
+        seq = self.l2.get(SEQ)
+        if seq == seen:
+            return
+        self._invalidate()
+        if (seen is _missing or seen is None or seq is None
+                or not 0 < seq - seen <= LOG_SIZE):
+            self.local.clear()
+            tier.seen = seq
+            return
+        numbers = range(seen + 1, seq + 1)
+        entries = self.l2.get_many([_slot(number) for number in numbers])
+        for number in numbers:
+            entry = entries.get(_slot(number))
+            if entry is None or entry[0] != number:
+                self.local.clear()
+                break
+            _, key, token = entry
+            if token != self._token:
+                self.local.delete(key)
+        tier.seen = seq
+
+    def _publish(self, keys):
+        if not keys:
+            return
+        previous = self._tier.seen
+        try:
+            last = self.l2.incr(SEQ, len(keys))
+        except ValueError:
+            # счетчик, созданный заново, уходит далеко от прежнего,
+            # и отставшие процессы очистят L1 целиком
+            start = time.time_ns()
+            if self.l2.add(SEQ, start, None) and previous is None:
+                previous = start
+            last = self.l2.incr(SEQ, len(keys))
+        first = last - len(keys) + 1
+        self.l2.set_many({
+            _slot(number): (number, key, self._token)
+            for number, key in zip(range(first, last + 1), keys)
+        }, None)
+        if previous == first - 1:
+            # после опроса журнал писали только мы
+            self._tier.seen = last
+
+    def get(self, key, default=None, version=None):
+        value = self._get(key, version)
+        metrics.record_cache(
+            self._metrics_label, value is not _missing, value is _missing)
+        return default if value is _missing else value
+
+    def _get(self, key, version):
+        if not self._local(key):
+            return self.l2.get(key, _missing, version)
+        self.poll()
+        l1_key = self._l1_key(key, version)
+        value = self.local.get(l1_key, _missing)
+        if value is not _missing:
+            return value
+        epoch = self._tier.epoch
+        value = self.l2.get(key, _missing, version)
+        if value is not _missing and epoch == self._tier.epoch:
+            self.local.set(l1_key, value)
+        return value
+
+    def get_many(self, keys, version=None):
+        found = {}
+        rest = []
+        if any(self._local(key) for key in keys):
+            self.poll()
+        for key in keys:
+            value = _missing
+            if self._local(key):
+                value = self.local.get(self._l1_key(key, version), _missing)
+            if value is _missing:
+                rest.append(key)
+            else:
+                found[key] = value
+        if rest:
+            epoch = self._tier.epoch
+            fetched = self.l2.get_many(rest, version)
+            if epoch == self._tier.epoch:
+                for key, value in fetched.items():
+                    if self._local(key):
+                        self.local.set(self._l1_key(key, version), value)
+            found.update(fetched)
+        metrics.record_cache(
+            self._metrics_label, len(found), len(keys) - len(found))
+        return found
+
+    def has_key(self, key, version=None):
+        return self.get(key, _missing, version) is not _missing
+
+    def _stored(self, items, timeout, version):
+        """Кладет записанные в L2 значения в L1 и публикует сброс."""
+        self.poll()
+        l1_keys = []
+        for key, value in items:
+            if self._local(key):
+                if not l1_keys:
+                    self._invalidate()
+                l1_key = self._l1_key(key, version)
+                self.local.set(l1_key, value, self._l1_timeout(timeout))
+                l1_keys.append(l1_key)
+        self._publish(l1_keys)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.l2.set(key, value, timeout, version)
+        self._stored([(key, value)], timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.l2.set_many(data, timeout, version)
+        self._stored(
+            [(key, value) for key, value in data.items()
+             if key not in failed], timeout, version)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.l2.add(key, value, timeout, version)
+        if added:
+            self._stored([(key, value)], timeout, version)
+        return added
+
+    def incr(self, key, delta=1, version=None):
+        value = self.l2.incr(key, delta, version)
+        self._stored([(key, value)], None, version)
+        return value
+
+    def decr(self, key, delta=1, version=None):
+        return self.incr(key, -delta, version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.l2.touch(key, timeout, version)
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version)
+
+    def delete_many(self, keys, version=None):
+        self.poll()
+        self.l2.delete_many(keys, version)
+        l1_keys = [
+            self._l1_key(key, version) for key in keys if self._local(key)
+        ]
+        if l1_keys:
+            self._invalidate()
+        for l1_key in l1_keys:
+            self.local.delete(l1_key)
+        self._publish(l1_keys)
+
+    def clear(self):
+        # без счетчика в L2 остальные процессы очистят свой L1 сами
+        self.l2.clear()
+        self.local.clear()
+        self._invalidate()
+        self._tier.seen = _missing
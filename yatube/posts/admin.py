@@ -1,4 +1,5 @@
 from django.contrib import admin
+from . import search
 from .models import Post, Group, Comment, Follow
 
 
@@ -16,6 +17,17 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).for_feed()
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search.enabled():
+            return super().get_search_results(
+                request, queryset, search_term)
+        if not search.terms(search_term):
+            return queryset, False
+        return search.filter_posts(queryset, search_term), False
+
 
 class GroupAdmin(admin.ModelAdmin):
     list_display = (
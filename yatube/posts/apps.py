@@ -3,3 +3,12 @@ from django.apps import AppConfig
 
 class PostsConfig(AppConfig):
     name = 'posts'
+
+    def ready(self):
+        from core import page_cache
+        from . import signals  # noqa: F401
+        from .views import follow_button
+        page_cache.register_hole('switcher', 'posts/includes/switcher.html')
+        page_cache.register_hole(
+            'follow_button', 'posts/includes/follow_button.html',
+            follow_button)
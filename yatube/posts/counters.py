@@ -0,0 +1,155 @@
+"""Денормализованные счетчики постов, комментариев и подписок.
+
+Счетчики меняются атомарными UPDATE ... SET x = x + 1 в путях записи
+(см. signals.py), а reconcile_* пересчитывают их по данным и чинят
+расхождения. Строка UserStats создается вместе с пользователем, для
+старых данных ее и остальные счетчики заполняет миграция 0018.
+"""
+from django.apps import apps
+from django.conf import settings
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+
+from .models import Group, Post, UserStats
+
+USER_COUNTERS = {
+    'posts_count': ('posts.Post', 'author_id'),
+    'followers_count': ('posts.Follow', 'author_id'),
+    'following_count': ('posts.Follow', 'user_id'),
+}
+GROUP_COUNTERS = {
+    'posts_count': ('posts.Post', 'group_id'),
+}
+POST_COUNTERS = {
+    'comments_count': ('posts.Comment', 'post_id'),
+}
+
+
+def _change(queryset, field, delta):
+    value = F(field) + delta
+    if delta < 0:
+        value = Greatest(value, 0)
+    return queryset.update(**{field: value})
+
+
+def change_user(user_id, field, delta):
+    updated = _change(UserStats.objects.filter(user_id=user_id), field, delta)
+    if not updated and delta > 0:
+        # строки счетчиков еще нет: считаем ее целиком по данным,
+        # при уменьшении ее создаст первое чтение
+        reconcile_users([user_id])
+
+
+def change_group(group_id, delta):
+    if group_id is not None:
+        _change(Group.objects.filter(pk=group_id), 'posts_count', delta)
+
+
+def change_post(post_id, delta):
+    _change(Post.objects.filter(pk=post_id), 'comments_count', delta)
+
+
+def user_stats(user_id):
+    """Счетчики пользователя.
+
+    Строки нет, только если пользователя создали в обход сигналов;
+    тогда счетчики считаются по данным, но в базу не пишутся: это путь
+    чтения.
+    """
+    stats = UserStats.objects.filter(user_id=user_id).first()
+    if stats is None:
+        actual = _actual(USER_COUNTERS, [user_id])
+        stats = UserStats(user_id=user_id, **{
+            field: actual[field].get(user_id, 0) for field in USER_COUNTERS})
+    return stats
+
+
+def _actual(counters, ids):
+    actual = {}
+    for field, (model, key) in counters.items():
+        rows = (
+            apps.get_model(model).objects.filter(**{f'{key}__in': ids})
+            .order_by()
+            .values(key)
+            .annotate(total=Count('pk'))
+            .values_list(key, 'total')
+        )
+        actual[field] = dict(rows)
+    return actual
+
+
+def _reconcile(model, counters, ids):
+    model = apps.get_model(model)
+    actual = _actual(counters, ids)
+    changed = []
+    for obj in model.objects.filter(pk__in=ids).only(*counters):
+        dirty = False
+        for field in counters:
+            value = actual[field].get(obj.pk, 0)
+            if getattr(obj, field) != value:
+                setattr(obj, field, value)
+                dirty = True
+        if dirty:
+            changed.append(obj)
+    model.objects.bulk_update(changed, list(counters))
+    return len(changed)
+
+
+def reconcile_users(user_ids):
+    """Пересчитывает счетчики пользователей, возвращает число исправлений.
+
+    Недостающие строки UserStats создаются.
+    """
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    stats_model = apps.get_model('posts.UserStats')
+    user_ids = list(
+        User.objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+    existing = set(stats_model.objects.filter(
+        user_id__in=user_ids).values_list('user_id', flat=True))
+    missing = [pk for pk in user_ids if pk not in existing]
+    actual = _actual(USER_COUNTERS, missing)
+    stats_model.objects.bulk_create([
+        stats_model(user_id=pk, **{
+            field: actual[field].get(pk, 0) for field in USER_COUNTERS})
+        for pk in missing
+    ], ignore_conflicts=True)
+    fixed = _reconcile('posts.UserStats', USER_COUNTERS, list(existing))
+    return len(missing) + fixed
+
+
+def reconcile_groups(group_ids):
+    return _reconcile('posts.Group', GROUP_COUNTERS, group_ids)
+
+
+def reconcile_posts(post_ids):
+    return _reconcile('posts.Post', POST_COUNTERS, post_ids)
+
+
+def batches(model, batch_size):
+    """pk строк модели пачками по batch_size, по возрастанию."""
+    last_pk = 0
+    while True:
+        ids = list(
+            model.objects.filter(pk__gt=last_pk)
+            .order_by('pk')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return
+        yield ids
+        last_pk = ids[-1]
+
+
+def reconcile_all(batch_size=1000):
+    """Пересчитывает все счетчики: {'users': исправлено, ...}."""
+    targets = (
+        ('users', settings.AUTH_USER_MODEL, reconcile_users),
+        ('groups', 'posts.Group', reconcile_groups),
+        ('posts', 'posts.Post', reconcile_posts),
+    )
+    fixed = {}
+    for label, model, reconcile in targets:
+        fixed[label] = sum(
+            reconcile(ids)
+            for ids in batches(apps.get_model(model), batch_size))
+    return fixed
@@ -0,0 +1,200 @@
+"""Ключи кэша фрагментов лент с инвалидацией при записи.
+
+У каждой ленты ('index', 'group:<id>', 'profile:<id>') есть номер
+поколения в кэше. Сигналы Post и Group увеличивают его, поэтому
+фрагменты можно хранить долго: после записи ключ меняется сразу.
+Поколение ALL относится ко всем лентам и меняется при правке групп.
+
+Те же поколения служат валидаторами условных GET-запросов: ETag
+страницы собирается из них без отрисовки, а время последнего сброса
+ленты, округленное вверх до секунды, отдается как Last-Modified. Из них
+же собирается ключ целой страницы в core.page_cache.
+"""
+import hashlib
+import math
+import time
+from datetime import datetime, timezone
+
+from django.core.cache import cache
+from django.db import transaction
+from django.middleware.csrf import get_token
+from django.views.decorators.http import condition
+
+from core import page_cache
+
+from .models import Group
+
+ALL = 'all'
+
+
+def _key(feed):
+    return f'posts:gen:{feed}'
+
+
+def _modified_key(feed):
+    return f'posts:modified:{feed}'
+
+
+def _initial():
+    # поколение, созданное заново после вытеснения ключа,
+    # не совпадет ни с одним из прежних
+    return int(time.time() * 1000)
+
+
+def generations(*feeds):
+    keys = [_key(feed) for feed in (ALL,) + feeds]
+    values = cache.get_many(keys)
+    for key in keys:
+        if key not in values:
+            cache.add(key, _initial(), None)
+            values[key] = cache.get(key)
+    return [values[key] for key in keys]
+
+
+def bump(*feeds):
+    """Сбрасывает кэш лент: их фрагменты получат новые ключи.
+
+    Внутри транзакции поколение меняется еще раз после коммита, чтобы
+    фрагмент, отрисованный по старым данным до коммита, не остался в
+    кэше под новым ключом.
+    """
+    _bump(feeds)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _bump(feeds))
+
+
+def _bump(feeds):
+    for feed in feeds:
+        key = _key(feed)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _initial(), None)
+    now = time.time()
+    cache.set_many({_modified_key(feed): now for feed in feeds}, None)
+
+
+def bump_post(post, previous_group_id=None, previous_author_id=None):
+    feeds = ['index', f'post:{post.pk}']
+    for author_id in {post.author_id, previous_author_id} - {None}:
+        feeds.append(f'profile:{author_id}')
+    for group_id in {post.group_id, previous_group_id} - {None}:
+        feeds.append(f'group:{group_id}')
+    bump(*feeds)
+
+
+def _group_key(slug):
+    return f'posts:group:{slug}'
+
+
+def group_id(slug):
+    """pk группы по slug без запроса к базе, или None, если группы нет."""
+    key = _group_key(slug)
+    found = cache.get(key)
+    if found is None:
+        found = Group.objects.filter(
+            slug=slug).values_list('pk', flat=True).first()
+        if found is not None:
+            cache.set(key, found, None)
+    return found
+
+
+def forget_group(*slugs):
+    """Сбрасывает поиск групп по slug, как bump - после коммита еще раз."""
+    keys = [_group_key(slug) for slug in slugs if slug]
+    cache.delete_many(keys)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def fragment_key(request, *feeds):
+    """Часть ключа фрагмента ленты: ленты, их поколения и адрес страницы.
+
+    Поколения разных лент могут совпасть, поэтому в ключе и имена лент.
+    """
+    parts = list(feeds)
+    parts.extend(str(value) for value in generations(*feeds))
+    parts.append(request.GET.get('page', ''))
+    parts.append(request.GET.get('cursor', ''))
+    return ':'.join(parts)
+
+
+def etag(request, *feeds):
+    """ETag страницы: поколения ее лент, адрес и пользователь.
+
+    Для пользователя в ETag входит и CSRF-токен: после нового входа
+    токен другой, и форма из сохраненной страницы уже не отправится.
+    """
+    parts = [str(value) for value in generations(*feeds)]
+    parts.append(request.get_full_path())
+    parts.append(str(request.user.pk or ''))
+    if request.user.is_authenticated:
+        # get_token заводит секрет, если его еще нет: им подпишут форму
+        get_token(request)
+        parts.append(request.META['CSRF_COOKIE'])
+    return hashlib.sha1(':'.join(parts).encode()).hexdigest()
+
+
+def last_modified(*feeds):
+    """Время последнего сброса лент страницы, округленное вверх до секунды.
+
+    Last-Modified точен до секунды, поэтому, пока секунда последнего
+    сброса не прошла, возвращается None: вторая запись в ту же секунду
+    не изменила бы дату, и клиент получил бы 304 на устаревшую страницу.
+    Если времени какой-то ленты нет в кэше, им становится текущее.
+    """
+    keys = [_modified_key(feed) for feed in (ALL,) + feeds]
+    values = cache.get_many(keys)
+    for key in keys:
+        if key not in values:
+            cache.add(key, time.time(), None)
+            values[key] = cache.get(key)
+    modified = math.ceil(max(values.values()))
+    if modified > time.time():
+        return None
+    return datetime.fromtimestamp(modified, timezone.utc)
+
+
+def page_key(request, *feeds):
+    """Ключ страницы в общем кэше: поколения и адрес, без пользователя."""
+    parts = [str(value) for value in generations(*feeds)]
+    parts.append(request.get_full_path())
+    return ':'.join(parts)
+
+
+def _resolve(feeds, request, *args, **kwargs):
+    # ленты страницы нужны и ETag, и ключу кэша: ищутся один раз
+    if not hasattr(request, '_page_feeds'):
+        request._page_feeds = feeds(request, *args, **kwargs)
+    return request._page_feeds
+
+
+def conditional(feeds):
+    """condition() с валидаторами из поколений лент страницы.
+
+    feeds(request, *args, **kwargs) возвращает ленты, из которых
+    собрана страница, или None, если страницы нет. Last-Modified
+    отдается только гостям: он не различает пользователей.
+    """
+    def etag_func(request, *args, **kwargs):
+        page_feeds = _resolve(feeds, request, *args, **kwargs)
+        if page_feeds is not None:
+            return etag(request, *page_feeds)
+
+    def last_modified_func(request, *args, **kwargs):
+        page_feeds = _resolve(feeds, request, *args, **kwargs)
+        if page_feeds is not None and not request.user.is_authenticated:
+            return last_modified(*page_feeds)
+
+    return condition(
+        etag_func=etag_func, last_modified_func=last_modified_func)
+
+
+def cache_page(feeds):
+    """page_cache.cache_page с ключом из поколений лент страницы."""
+    def key_func(request, *args, **kwargs):
+        page_feeds = _resolve(feeds, request, *args, **kwargs)
+        if page_feeds is not None:
+            return page_key(request, *page_feeds)
+
+    return page_cache.cache_page(key_func)
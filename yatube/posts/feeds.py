@@ -0,0 +1,88 @@
+"""Ленты постов, которые не сводятся к одному QuerySet модели Post."""
+import heapq
+from itertools import islice
+
+from django.conf import settings
+from django.utils.functional import cached_property
+
+from . import timeline
+from .models import Post, TimelineEntry
+from .paginators import seek
+
+
+class FollowFeed:
+    """Лента подписок пользователя.
+
+    Посты обычных авторов читаются из материализованной таблицы
+    TimelineEntry одним индексным диапазоном (user, pub_date, post).
+    Посты авторов с большим числом подписчиков в таблицу не попадают:
+    они берутся из списков последних постов каждого такого автора и
+    сливаются с лентой k-путевым слиянием на куче.
+
+    Ведет себя как последовательность постов: поддерживает count(),
+    срезы и seek() для курсорной пагинации.
+    """
+
+    def __init__(self, user, position=None, backwards=False):
+        self.user = user
+        self.position = position
+        self.backwards = backwards
+
+    @cached_property
+    def pulled_author_ids(self):
+        return list(timeline.celebrities(self.user))
+
+    def _pushed(self):
+        entries = TimelineEntry.objects.filter(user=self.user)
+        if self.pulled_author_ids:
+            entries = entries.exclude(author_id__in=self.pulled_author_ids)
+        return seek(entries, self.position, self.backwards,
+                    key=('pub_date', 'post_id'))
+
+    def _pulled(self, author_id, stop):
+        if not self.backwards:
+            recent = timeline.recent_posts(author_id)
+            keys = [
+                key for key in recent
+                if self.position is None or key < self.position
+            ]
+            complete = len(recent) < settings.FEED_AUTHOR_RECENT_POSTS
+            if len(keys) >= stop or complete:
+                return keys[:stop]
+        posts = seek(Post.objects.filter(author_id=author_id),
+                     self.position, self.backwards)
+        return list(posts.values_list('pub_date', 'pk')[:stop])
+
+    def _keys(self, start, stop):
+        sources = [
+            list(self._pushed().values_list('pub_date', 'post_id')[:stop])
+        ]
+        for author_id in self.pulled_author_ids:
+            sources.append(self._pulled(author_id, stop))
+        merged = heapq.merge(*sources, reverse=not self.backwards)
+        return list(islice(merged, start, stop))
+
+    def count(self):
+        pulled = Post.objects.filter(author_id__in=self.pulled_author_ids)
+        return self._pushed().count() + pulled.count()
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            posts = self[key:key + 1]
+            if not posts:
+                raise IndexError('Индекс за пределами ленты')
+            return posts[0]
+        start = key.start or 0
+        stop = self.count() if key.stop is None else key.stop
+        keys = self._keys(start, stop)
+        posts = Post.objects.for_feed().in_bulk([pk for _, pk in keys])
+        return [posts[pk] for _, pk in keys if pk in posts]
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def seek(self, position, backwards=False):
+        return FollowFeed(self.user, position, backwards)
@@ -0,0 +1,199 @@
+"""Прием загруженных изображений постов.
+
+Заголовок файла читается лениво, до декодирования пикселей, поэтому
+слишком большие изображения отклоняются сразу. JPEG декодируется в
+режиме draft сразу в уменьшенном масштабе. Оригинал больше
+POST_IMAGE_MAX_SIDE уменьшается, поворот из EXIF применяется к
+пикселям, а сами метаданные EXIF не сохраняются. Форматы, которые не
+годятся для веба (BMP, TIFF и другие), всегда переводятся в PNG или
+JPEG. Пересжатие идет в пуле процессов posts.processing.
+
+Там же один раз считаются размеры картинки, ее основной цвет и
+крошечная заглушка, которая показывается, пока картинка грузится.
+"""
+import base64
+import logging
+import os
+import tempfile
+from concurrent import futures
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation, ValidationError
+from django.core.files.uploadedfile import UploadedFile
+from PIL import Image, ImageOps, ImageSequence
+
+from . import processing
+
+logger = logging.getLogger(__name__)
+
+# форматы, которые пересохраняются в себя же, с анимацией и прозрачностью
+KEPT_FORMATS = {'JPEG', 'PNG', 'WEBP', 'GIF'}
+EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png'}
+EXIF_ORIENTATION = 0x0112
+EMPTY_METADATA = {
+    'image_width': None,
+    'image_height': None,
+    'image_color': '',
+    'image_placeholder': '',
+}
+
+
+def _needs_processing(image):
+    # getexif() у PNG декодирует весь файл, поэтому смотрим только
+    # на EXIF, найденный при разборе заголовка
+    return (max(image.size) > settings.POST_IMAGE_MAX_SIDE
+            or 'exif' in image.info)
+
+
+def _target_size(size, max_side):
+    width, height = size
+    scale = min(1, max_side / max(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def _output_format(image):
+    if image.format in KEPT_FORMATS:
+        return image.format
+    transparent = (image.mode in ('RGBA', 'LA', 'PA')
+                   or 'transparency' in image.info)
+    return 'PNG' if transparent else 'JPEG'
+
+
+def reencode(source, target, max_side, quality):
+    """Уменьшает и поворачивает изображение в пуле процессов.
+
+    source - путь к файлу или его байты, результат пишется в файл target.
+    EXIF не сохраняется ни в одном формате, анимация - со всеми кадрами.
+    Возвращает формат, в котором записан результат.
+    """
+    if isinstance(source, bytes):
+        source = BytesIO(source)
+    with Image.open(source) as image:
+        format_ = _output_format(image)
+        options = {'quality': quality, 'optimize': True, 'exif': b''}
+        if getattr(image, 'is_animated', False) and format_ == image.format:
+            frames = []
+            durations = []
+            for frame in ImageSequence.Iterator(image):
+                durations.append(frame.info.get('duration', 0))
+                frame = frame.copy()
+                frame.thumbnail((max_side, max_side), Image.LANCZOS)
+                frames.append(frame)
+            processed = frames[0]
+            options.update(
+                save_all=True, append_images=frames[1:],
+                duration=durations, loop=image.info.get('loop', 0))
+        else:
+            if image.format == 'JPEG':
+                # декодер JPEG сам уменьшает изображение в 2, 4 или 8 раз
+                image.draft('RGB', _target_size(image.size, max_side))
+                options['progressive'] = True
+            processed = ImageOps.exif_transpose(image)
+            processed.thumbnail((max_side, max_side), Image.LANCZOS)
+            if format_ != image.format:
+                processed = processed.convert(
+                    'RGBA' if format_ == 'PNG' else 'RGB')
+        processed.info.pop('exif', None)
+        processed.save(target, format_, **options)
+    return format_
+
+
+def ingest(upload):
+    """Проверяет загрузку и возвращает файл, который нужно сохранить.
+
+    Небольшие изображения без EXIF в форматах KEPT_FORMATS возвращаются
+    без изменений.
+    """
+    upload.seek(0)
+    try:
+        image = Image.open(upload)
+    except (OSError, Image.DecompressionBombError):
+        raise ValidationError(
+            'Загрузите правильное изображение.', code='invalid_image')
+    with image:
+        width, height = image.size
+        if width * height > settings.POST_IMAGE_MAX_PIXELS:
+            raise ValidationError(
+                'Изображение слишком большое: %(width)s×%(height)s.',
+                code='image_too_large',
+                params={'width': width, 'height': height})
+        format_ = image.format
+        if format_ in KEPT_FORMATS and not _needs_processing(image):
+            upload.seek(0)
+            return upload
+    if hasattr(upload, 'temporary_file_path'):
+        source = upload.temporary_file_path()
+    else:
+        upload.seek(0)
+        source = upload.read()
+    # результат пишется на диск, а не в память процесса
+    output = tempfile.NamedTemporaryFile(
+        suffix=os.path.splitext(upload.name)[1])
+    try:
+        saved_format = processing.run(
+            reencode, source, output.name, settings.POST_IMAGE_MAX_SIDE,
+            settings.POST_IMAGE_QUALITY, wait=True)
+    except (processing.Busy, futures.TimeoutError):
+        output.close()
+        raise ValidationError(
+            'Не удалось обработать изображение, попробуйте позже.',
+            code='image_busy')
+    name = os.path.basename(upload.name)
+    content_type = upload.content_type
+    if saved_format != format_:
+        name = os.path.splitext(name)[0] + EXTENSIONS[saved_format]
+        content_type = Image.MIME[saved_format]
+    return UploadedFile(
+        output, name=name, content_type=content_type,
+        size=os.path.getsize(output.name))
+
+
+def describe(data, placeholder_size):
+    """Размеры, основной цвет и заглушка изображения в пуле процессов."""
+    with Image.open(BytesIO(data)) as image:
+        width, height = image.size
+        if image.getexif().get(EXIF_ORIENTATION, 1) in (5, 6, 7, 8):
+            width, height = height, width
+        if image.format == 'JPEG':
+            image.draft('RGB', (placeholder_size, placeholder_size))
+        small = ImageOps.exif_transpose(image).convert('RGB')
+    small.thumbnail((placeholder_size, placeholder_size), Image.BOX)
+    color = '#%02x%02x%02x' % small.resize((1, 1), Image.BOX).getpixel((0, 0))
+    format_ = 'WEBP' if 'WEBP' in Image.SAVE else 'PNG'
+    output = BytesIO()
+    small.save(output, format_, quality=40)
+    placeholder = base64.b64encode(output.getvalue()).decode()
+    return {
+        'image_width': width,
+        'image_height': height,
+        'image_color': color,
+        'image_placeholder':
+            f'data:image/{format_.lower()};base64,{placeholder}',
+    }
+
+
+def metadata(image):
+    """Поля метаданных картинки поста.
+
+    Если файл не читается или не является изображением, поля пустые:
+    их можно заполнить позже командой backfill_image_metadata.
+    """
+    if not image:
+        return dict(EMPTY_METADATA)
+    try:
+        image.open('rb')
+        try:
+            data = image.read()
+        finally:
+            if image._committed:
+                image.close()
+            else:
+                # загрузка еще будет сохранена в хранилище
+                image.seek(0)
+        return processing.run(
+            describe, data, settings.POST_IMAGE_PLACEHOLDER_SIZE, wait=True)
+    except (OSError, SuspiciousFileOperation, ValueError,
+            processing.Busy, futures.TimeoutError) as error:
+        logger.info('Нет метаданных картинки %s: %s', image.name, error)
+        return dict(EMPTY_METADATA)
@@ -0,0 +1,128 @@
+"""Хранилище ключей sorl с локальным LRU-уровнем в процессе.
+
+Перед общим кэшем и таблицей sorl стоит небольшой словарь в памяти
+процесса с ограничением по числу записей и временем жизни. Промахи
+запоминаются локально только на MISS_TTL секунд и только из prefetch():
+миниатюра, построенная другим процессом, появится почти сразу. prefetch()
+получает записи для целой страницы ленты одним get_many вместо запроса
+на каждую карточку, а batch() копит записи построения миниатюр и пишет
+их в таблицу одной вставкой.
+"""
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.kvstores import cached_db_kvstore
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from core.lru import LRUCache
+
+# сколько секунд помнить, что prefetch() не нашел запись
+MISS_TTL = 1
+
+
+class KVStore(cached_db_kvstore.KVStore):
+    def __init__(self):
+        super().__init__()
+        self.local = LRUCache(
+            settings.THUMBNAIL_LOCAL_CACHE_SIZE,
+            settings.THUMBNAIL_LOCAL_CACHE_TTL)
+        self._batch = threading.local()
+
+    def _pending(self):
+        return getattr(self._batch, 'pending', None)
+
+    def _get_raw(self, key):
+        pending = self._pending()
+        if pending and key in pending:
+            return pending[key]
+        value = self.local.get(key)
+        if value is cached_db_kvstore.EMPTY_VALUE:
+            return None
+        if value is None:
+            value = super()._get_raw(key)
+            if value is not None:
+                self.local.set(key, value)
+        return value
+
+    def _set_raw(self, key, value):
+        pending = self._pending()
+        if pending is not None:
+            pending[key] = value
+        else:
+            super()._set_raw(key, value)
+        self.local.set(key, value)
+
+    def _delete_raw(self, *keys):
+        pending = self._pending()
+        for key in keys:
+            if pending:
+                pending.pop(key, None)
+            self.local.delete(key)
+        super()._delete_raw(*keys)
+
+    def prefetch(self, image_files, sources=()):
+        """Загружает записи файлов в локальный уровень за один проход.
+
+        Для sources загружаются и сами файлы, и списки их миниатюр. Сначала
+        один get_many к общему кэшу, затем один запрос к таблице для
+        ключей, которых нет и там.
+        """
+        keys = {add_prefix(image_file.key) for image_file in image_files}
+        for source in sources:
+            keys.add(add_prefix(source.key))
+            keys.add(add_prefix(source.key, 'thumbnails'))
+        keys = [key for key in keys if self.local.get(key) is None]
+        if not keys:
+            return
+        found = self.cache.get_many(keys)
+        missing = [key for key in keys if key not in found]
+        if missing:
+            stored = dict(KVStoreModel.objects.filter(
+                key__in=missing).values_list('key', 'value'))
+            self.cache.set_many(
+                {key: stored.get(key, cached_db_kvstore.EMPTY_VALUE)
+                 for key in missing},
+                thumbnail_settings.THUMBNAIL_CACHE_TIMEOUT)
+            found.update(stored)
+        for key in keys:
+            value = found.get(key, cached_db_kvstore.EMPTY_VALUE)
+            if value == cached_db_kvstore.EMPTY_VALUE:
+                self.local.set(key, cached_db_kvstore.EMPTY_VALUE, MISS_TTL)
+            else:
+                self.local.set(key, value)
+
+    @contextmanager
+    def batch(self):
+        """Копит записи потока и сохраняет их при выходе из блока.
+
+        Новые ключи вставляются одним запросом, существующие обновляются
+        по одному. Записи сохраняются и при исключении: файлы миниатюр,
+        построенных до него, уже лежат в хранилище.
+        """
+        if self._pending() is not None:
+            yield
+            return
+        self._batch.pending = {}
+        try:
+            yield
+        finally:
+            pending = self._batch.pending
+            self._batch.pending = None
+            self._flush(pending)
+
+    def _flush(self, pending):
+        if not pending:
+            return
+        existing = set(KVStoreModel.objects.filter(
+            key__in=pending).values_list('key', flat=True))
+        KVStoreModel.objects.bulk_create(
+            [KVStoreModel(key=key, value=value)
+             for key, value in pending.items() if key not in existing],
+            ignore_conflicts=True)
+        for key in existing:
+            KVStoreModel.objects.filter(key=key).update(value=pending[key])
+        self.cache.set_many(
+            pending, thumbnail_settings.THUMBNAIL_CACHE_TIMEOUT)
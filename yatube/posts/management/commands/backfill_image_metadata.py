@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from posts import images
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = ('Заполняет размеры, цвет и заглушку картинок постов, '
+            'загруженных до появления этих полей.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Сколько постов сохранять одним запросом.')
+
+    def handle(self, *args, **options):
+        fields = list(images.EMPTY_METADATA)
+        posts = Post.objects.exclude(image='').filter(
+            image_width__isnull=True).only('image').iterator()
+        batch = []
+        filled = 0
+        for post in posts:
+            metadata = images.metadata(post.image)
+            if metadata['image_width'] is None:
+                continue
+            for field, value in metadata.items():
+                setattr(post, field, value)
+            batch.append(post)
+            if len(batch) >= options['batch_size']:
+                filled += self.save(batch, fields)
+        filled += self.save(batch, fields)
+        self.stdout.write(f'Заполнено постов: {filled}')
+
+    @staticmethod
+    def save(batch, fields):
+        Post.objects.bulk_update(batch, fields)
+        saved = len(batch)
+        batch.clear()
+        return saved
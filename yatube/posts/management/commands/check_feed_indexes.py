@@ -0,0 +1,65 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from posts import timeline
+from posts.feeds import FollowFeed
+from posts.models import Follow, Group, Post, User
+from posts.paginators import seek
+
+# полный проход таблицы без индекса или сортировка во временном B-дереве
+BAD_PLAN = re.compile(r'^SCAN (TABLE )?\w+( AS \w+)?$|USE TEMP B-TREE')
+
+
+def feed_queries(user, group, post):
+    """Запросы лент в том виде, в котором их выполняют представления."""
+    position = (post.pub_date, post.pk)
+    per_page = slice(0, 11)
+    follow_feed = FollowFeed(user)
+    return {
+        'index': Post.objects.for_feed()[per_page],
+        'index cursor': seek(Post.objects.for_feed(), position)[per_page],
+        'index cursor back': seek(
+            Post.objects.for_feed(), position, backwards=True)[per_page],
+        'group': group.posts.for_feed()[per_page],
+        'group cursor': seek(group.posts.for_feed(), position)[per_page],
+        'profile': user.posts.for_feed()[per_page],
+        'profile cursor': seek(user.posts.for_feed(), position)[per_page],
+        'follow': follow_feed._pushed().values_list(
+            'pub_date', 'post_id')[per_page],
+        'follow cursor': follow_feed.seek(position)._pushed().values_list(
+            'pub_date', 'post_id')[per_page],
+        'follow celebrities': timeline.celebrities(user),
+        'follow check': Follow.objects.filter(user=user, author=user),
+        'followers': Follow.objects.filter(author=user).values('user_id'),
+        'comments': post.comments.select_related(
+            'author').order_by('created'),
+    }
+
+
+class Command(BaseCommand):
+    help = ('Проверяет через EXPLAIN QUERY PLAN, что запросы лент '
+            'идут по индексам, а не полным проходом с сортировкой.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Проверка планов поддерживается для SQLite.')
+        user = User(pk=1)
+        group = Group(pk=1)
+        post = Post(pk=1, pub_date=timezone.now())
+        failed = []
+        for name, queryset in feed_queries(user, group, post).items():
+            sql, params = queryset.query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+                plan = [row[-1] for row in cursor.fetchall()]
+            bad = [step for step in plan if BAD_PLAN.search(step)]
+            status = 'FAIL' if bad else 'ok'
+            self.stdout.write(f'{status:4} {name}: {"; ".join(plan)}')
+            if bad:
+                failed.append(name)
+        if failed:
+            raise CommandError(
+                'Запросы без индекса: ' + ', '.join(failed))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+
+from posts import media_gc
+
+
+class Command(BaseCommand):
+    help = ('Удаляет картинки, на которые не ссылается ни один пост, '
+            'и миниатюры, о которых не знает хранилище ключей sorl.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, что будет удалено.')
+        parser.add_argument(
+            '--min-age', type=int,
+            help='Не трогать файлы моложе стольких секунд '
+                 '(по умолчанию MEDIA_GC_MIN_AGE).')
+        parser.add_argument(
+            '--chunk-size', type=int, default=500,
+            help='Сколько имен сверять с базой одним запросом.')
+        parser.add_argument(
+            '--max-bytes-per-second', type=int,
+            help='Ограничение скорости удаления в байтах.')
+        parser.add_argument(
+            '--max-files-per-second', type=float,
+            help='Ограничение скорости удаления в файлах.')
+
+    def handle(self, *args, **options):
+        throttle = media_gc.Throttle(
+            options['max_bytes_per_second'], options['max_files_per_second'])
+        verbose = options['verbosity'] > 1 or options['dry_run']
+        found, freed = media_gc.collect(
+            dry_run=options['dry_run'],
+            min_age=options['min_age'],
+            chunk_size=options['chunk_size'],
+            throttle=throttle,
+            report=self.report if verbose else None,
+        )
+        verb = 'Будет удалено' if options['dry_run'] else 'Удалено'
+        self.stdout.write(f'{verb} файлов: {found}, байт: {freed}')
+
+    def report(self, kind, name, size):
+        self.stdout.write(f'{kind} {name} {size}')
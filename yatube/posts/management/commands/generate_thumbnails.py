@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Строит миниатюры изображений постов, загруженных раньше.'
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='').only('image').iterator()
+        done = 0
+        for post in posts:
+            try:
+                thumbnails.generate(post)
+            except Exception as error:
+                self.stderr.write(f'{post.image}: {error}')
+                continue
+            done += 1
+        self.stdout.write(f'Обработано изображений: {done}')
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from posts import search
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает полнотекстовый индекс постов.'
+
+    def handle(self, *args, **options):
+        if not search.enabled():
+            self.stdout.write('FTS5 недоступен, поиск идет по подстроке')
+            return
+        self.stdout.write(f'Проиндексировано постов: {search.rebuild()}')
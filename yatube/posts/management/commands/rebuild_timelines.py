@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from posts import timeline
+from posts.models import Follow, TimelineEntry
+
+
+class Command(BaseCommand):
+    help = 'Заполняет ленты подписок по существующим подпискам и постам.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', action='append', type=int, dest='user_ids',
+            help='id пользователя, ленту которого нужно пересобрать '
+                 '(можно указать несколько раз).')
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids']
+        if not user_ids:
+            followers = Follow.objects.values_list('user_id', flat=True)
+            readers = TimelineEntry.objects.values_list('user_id', flat=True)
+            user_ids = sorted(set(followers) | set(readers.distinct()))
+        rebuilt = 0
+        for user_id in user_ids:
+            timeline.rebuild(user_id)
+            rebuilt += 1
+        self.stdout.write(f'Пересобрано лент: {rebuilt}')
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from posts import counters
+
+LABELS = {
+    'users': 'пользователей',
+    'groups': 'групп',
+    'posts': 'постов',
+}
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счетчики постов, комментариев и подписок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько строк пересчитывать за один проход.')
+
+    def handle(self, *args, **options):
+        fixed = counters.reconcile_all(batch_size=options['batch_size'])
+        for target, count in fixed.items():
+            self.stdout.write(
+                f'Исправлено счетчиков {LABELS[target]}: {count}')
@@ -0,0 +1,129 @@
+"""Поиск и удаление файлов, на которые ничего не ссылается.
+
+Каталоги загрузок и миниатюр обходятся потоком через os.scandir, имена
+сверяются с базой пачками: оригиналы - с полем Post.image, миниатюры -
+с записями хранилища ключей sorl. Файлы моложе min_age не трогаются:
+загрузка могла записать файл, но еще не закоммитить пост.
+"""
+import os
+import time
+from itertools import islice
+
+from django.conf import settings
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from . import storage
+from .models import Post
+
+
+class Throttle:
+    """Ограничивает удаление байтами и файлами в секунду."""
+
+    def __init__(self, bytes_per_second=None, files_per_second=None):
+        self.bytes_per_second = bytes_per_second
+        self.files_per_second = files_per_second
+        self.started = time.monotonic()
+        self.bytes = 0
+        self.files = 0
+
+    def __call__(self, size):
+        self.bytes += size
+        self.files += 1
+        due = 0
+        if self.bytes_per_second:
+            due = max(due, self.bytes / self.bytes_per_second)
+        if self.files_per_second:
+            due = max(due, self.files / self.files_per_second)
+        delay = due - (time.monotonic() - self.started)
+        if delay > 0:
+            time.sleep(delay)
+
+
+def scan(file_storage, directory, min_age=0):
+    """Файлы каталога хранилища как пары (имя, размер), без списка в памяти."""
+    root = file_storage.path('')
+    newest = time.time() - min_age
+    pending = [file_storage.path(directory)]
+    while pending:
+        try:
+            entries = os.scandir(pending.pop())
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                    continue
+                stat = entry.stat(follow_symlinks=False)
+                if stat.st_mtime > newest:
+                    continue
+                name = os.path.relpath(entry.path, root)
+                yield name.replace(os.sep, '/'), stat.st_size
+
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def orphaned_images(min_age, chunk_size):
+    directory = Post._meta.get_field('image').upload_to
+    files = scan(storage.post_images, directory, min_age)
+    for chunk in chunks(files, chunk_size):
+        referenced = set(Post.objects.filter(
+            image__in=[name for name, _ in chunk]
+        ).values_list('image', flat=True))
+        for name, size in chunk:
+            if name not in referenced:
+                yield name, size
+
+
+def orphaned_thumbnails(min_age, chunk_size):
+    files = scan(
+        default.storage, thumbnail_settings.THUMBNAIL_PREFIX, min_age)
+    for chunk in chunks(files, chunk_size):
+        keys = {
+            add_prefix(ImageFile(name, default.storage).key): (name, size)
+            for name, size in chunk
+        }
+        known = set(KVStoreModel.objects.filter(
+            key__in=list(keys)).values_list('key', flat=True))
+        for key, file in keys.items():
+            if key not in known:
+                yield file
+
+
+def collect(dry_run=False, min_age=None, chunk_size=500, throttle=None,
+            report=None):
+    """Удаляет забытые оригиналы и миниатюры.
+
+    Возвращает число файлов и байт, которые удалены (или были бы
+    удалены при dry_run). report(kind, name, size) вызывается для
+    каждого найденного файла.
+    """
+    if min_age is None:
+        min_age = settings.MEDIA_GC_MIN_AGE
+    found = freed = 0
+    sources = (
+        ('image', orphaned_images, storage.delete),
+        ('thumbnail', orphaned_thumbnails, default.storage.delete),
+    )
+    for kind, orphans, delete in sources:
+        for name, size in orphans(min_age, chunk_size):
+            if report:
+                report(kind, name, size)
+            if not dry_run:
+                delete(name)
+                if throttle:
+                    throttle(size)
+            found += 1
+            freed += size
+    return found, freed
@@ -0,0 +1,73 @@
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Count
+
+BATCH_SIZE = 1000
+
+
+def batches(model):
+    last_pk = 0
+    while True:
+        ids = list(
+            model.objects.filter(pk__gt=last_pk)
+            .order_by('pk')
+            .values_list('pk', flat=True)[:BATCH_SIZE]
+        )
+        if not ids:
+            return
+        yield ids
+        last_pk = ids[-1]
+
+
+def count(model, key, ids):
+    return dict(
+        model.objects.filter(**{f'{key}__in': ids})
+        .order_by()
+        .values(key)
+        .annotate(total=Count('pk'))
+        .values_list(key, 'total')
+    )
+
+
+def fill(model, ids, totals):
+    """Записывает в строки model с pk из ids посчитанные значения."""
+    objs = list(model.objects.filter(pk__in=ids))
+    for obj in objs:
+        for field, values in totals.items():
+            setattr(obj, field, values.get(obj.pk, 0))
+    model.objects.bulk_update(objs, list(totals))
+
+
+def backfill(apps, schema_editor):
+    """Счетчики и строки UserStats для данных, созданных до 0013."""
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Group = apps.get_model('posts', 'Group')
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    Follow = apps.get_model('posts', 'Follow')
+    UserStats = apps.get_model('posts', 'UserStats')
+    for ids in batches(User):
+        UserStats.objects.bulk_create(
+            [UserStats(user_id=pk) for pk in ids], ignore_conflicts=True)
+        fill(UserStats, ids, {
+            'posts_count': count(Post, 'author_id', ids),
+            'followers_count': count(Follow, 'author_id', ids),
+            'following_count': count(Follow, 'user_id', ids),
+        })
+    for ids in batches(Group):
+        fill(Group, ids, {'posts_count': count(Post, 'group_id', ids)})
+    for ids in batches(Post):
+        fill(Post, ids, {'comments_count': count(Comment, 'post_id', ids)})
+
+
+class Migration(migrations.Migration):
+    """Счетчики из 0013 для данных, созданных до нее."""
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0017_post_image_metadata'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
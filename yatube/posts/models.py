@@ -1,6 +1,8 @@
 from django.db import models
 from django.contrib.auth import get_user_model
 
+from .storage import post_images
+
 User = get_user_model()
 
 
@@ -15,6 +17,9 @@ class Group(models.Model):
     description = models.TextField(
         verbose_name='Описание',
         help_text='Описание группы')
+    posts_count = models.PositiveIntegerField(
+        default=0, editable=False,
+        verbose_name='Число постов')
 
     class Meta:
         verbose_name_plural = 'Сообщества'
@@ -23,6 +28,20 @@ class Group(models.Model):
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        """Посты для карточек ленты: автор и группа одним JOIN.
+
+        Выбираются только колонки, которые выводят карточки.
+        """
+        return self.select_related('author', 'group').only(
+            'text', 'pub_date', 'image', 'author_id', 'group_id',
+            'image_width', 'image_height', 'image_color', 'image_placeholder',
+            'author__username', 'author__first_name', 'author__last_name',
+            'group__title', 'group__slug',
+        )
+
+
 class Post(models.Model):
     text = models.TextField(
         verbose_name='Текст поста',
@@ -50,12 +69,44 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=post_images,
         blank=True
     )
+    # считаются один раз при загрузке картинки, см. images.metadata
+    image_width = models.PositiveIntegerField(
+        null=True, blank=True, editable=False,
+        verbose_name='Ширина картинки')
+    image_height = models.PositiveIntegerField(
+        null=True, blank=True, editable=False,
+        verbose_name='Высота картинки')
+    image_color = models.CharField(
+        max_length=7, blank=True, editable=False,
+        verbose_name='Основной цвет картинки')
+    image_placeholder = models.TextField(
+        blank=True, editable=False,
+        verbose_name='Размытая заглушка картинки')
+    comments_count = models.PositiveIntegerField(
+        default=0, editable=False,
+        verbose_name='Число комментариев')
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         verbose_name_plural = 'Посты'
         ordering = ('-pub_date',)
+        # индексы по возрастанию: обратный проход по ним дает порядок
+        # (pub_date DESC, id DESC) без сортировки во временном B-дереве
+        indexes = [
+            models.Index(
+                fields=['pub_date'],
+                name='posts_post_pub_date_idx'),
+            models.Index(
+                fields=['author', 'pub_date'],
+                name='posts_post_author_date_idx'),
+            models.Index(
+                fields=['group', 'pub_date'],
+                name='posts_post_group_date_idx'),
+        ]
 
     def __str__(self):
         return self.text[:15]
@@ -77,6 +128,11 @@ class Comment(models.Model):
 
     class Meta:
         verbose_name_plural = 'Комментарии'
+        indexes = [
+            models.Index(
+                fields=['post', 'created'],
+                name='posts_comment_post_idx'),
+        ]
 
     def __str__(self):
         return self.text[:15]
@@ -101,3 +157,68 @@ class Follow(models.Model):
                 fields=['user', 'author'],
                 name='unique_pare'),
         ]
+        indexes = [
+            models.Index(
+                fields=['author', 'user'],
+                name='posts_follow_author_user_idx'),
+        ]
+
+
+class UserStats(models.Model):
+    """Счетчики пользователя, которые обновляются при записи."""
+    user = models.OneToOneField(
+        User,
+        primary_key=True,
+        related_name='stats',
+        on_delete=models.CASCADE
+    )
+    posts_count = models.PositiveIntegerField(
+        default=0, verbose_name='Число постов')
+    followers_count = models.PositiveIntegerField(
+        default=0, verbose_name='Число подписчиков')
+    following_count = models.PositiveIntegerField(
+        default=0, verbose_name='Число подписок')
+
+    class Meta:
+        verbose_name_plural = 'Счетчики пользователей'
+
+    def __str__(self):
+        return str(self.user_id)
+
+
+class TimelineEntry(models.Model):
+    """Пост в материализованной ленте подписок пользователя."""
+    user = models.ForeignKey(
+        User,
+        related_name='timeline',
+        on_delete=models.CASCADE
+    )
+    post = models.ForeignKey(
+        Post,
+        related_name='timeline_entries',
+        on_delete=models.CASCADE
+    )
+    # автор и дата продублированы из поста, чтобы отписка
+    # и выборка страницы ленты обходились без join
+    author = models.ForeignKey(
+        User,
+        related_name='+',
+        on_delete=models.CASCADE
+    )
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        verbose_name_plural = 'Ленты подписок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='unique_timeline_entry'),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='posts_timeline_user_idx'),
+            models.Index(
+                fields=['user', 'author'],
+                name='posts_timeline_author_idx'),
+        ]
@@ -0,0 +1,126 @@
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.core.paginator import InvalidPage, Page, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+class InvalidCursor(InvalidPage):
+    pass
+
+
+def encode_cursor(post, backwards=False):
+    """Упаковывает позицию поста в ленте в непрозрачный токен."""
+    payload = [post.pub_date.isoformat(), post.pk, int(backwards)]
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Возвращает (pub_date, pk, backwards) из токена курсора."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        pub_date, pk, backwards = json.loads(raw.decode())
+        pub_date = parse_datetime(pub_date)
+    except (ValueError, TypeError, binascii.Error, UnicodeDecodeError):
+        raise InvalidCursor('Некорректный курсор')
+    if pub_date is None or not isinstance(pk, int):
+        raise InvalidCursor('Некорректный курсор')
+    return pub_date, pk, bool(backwards)
+
+
+def seek(object_list, position=None, backwards=False,
+         key=('pub_date', 'pk')):
+    """Отбирает посты строго после позиции (pub_date, pk) в порядке обхода.
+
+    Вперед - более старые посты по убыванию ключа,
+    назад - более новые по возрастанию. Ленты, которые не являются
+    QuerySet, реализуют метод seek() с той же сигнатурой.
+    """
+    if hasattr(object_list, 'seek'):
+        return object_list.seek(position, backwards)
+    date_field, pk_field = key
+    if position is not None:
+        pub_date, pk = position
+        lookup = 'gt' if backwards else 'lt'
+        object_list = object_list.filter(
+            Q(**{f'{date_field}__{lookup}': pub_date})
+            | Q(**{date_field: pub_date, f'{pk_field}__{lookup}': pk})
+        )
+    direction = '' if backwards else '-'
+    return object_list.order_by(direction + date_field, direction + pk_field)
+
+
+class CursorPage(Page):
+    """Страница ленты, адресуемая курсором, а не номером."""
+    is_cursor = True
+
+    def __init__(self, object_list, paginator,
+                 next_cursor=None, previous_cursor=None):
+        super().__init__(object_list, None, paginator)
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return '<Cursor page>'
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+class CursorPaginator(Paginator):
+    """Пагинатор по ключу (pub_date, id).
+
+    Вместо OFFSET и COUNT(*) выбирает per_page + 1 записей после курсора,
+    поэтому время отдачи страницы не зависит от ее глубины.
+    """
+
+    def page(self, cursor):
+        position, backwards = None, False
+        if cursor:
+            pub_date, pk, backwards = decode_cursor(cursor)
+            position = (pub_date, pk)
+        object_list = seek(self.object_list, position, backwards)
+        items = list(object_list[:self.per_page + 1])
+        has_more = len(items) > self.per_page
+        items = items[:self.per_page]
+        if backwards:
+            items.reverse()
+        next_cursor = previous_cursor = None
+        if items:
+            if has_more or backwards:
+                next_cursor = encode_cursor(items[-1])
+            if cursor and (has_more or not backwards):
+                previous_cursor = encode_cursor(items[0], backwards=True)
+        return CursorPage(items, self, next_cursor, previous_cursor)
+
+    def get_page(self, cursor):
+        try:
+            return self.page(cursor)
+        except InvalidCursor:
+            return self.page(None)
+
+
+def paginate(request, object_list, count=None):
+    """Возвращает страницу ленты для запроса.
+
+    Параметр ?cursor= включает пагинацию по ключу, ?page= - по номеру.
+    Без параметров режим задает PAGINATOR_CURSOR_MODE. Известное заранее
+    число постов (count) избавляет от запроса COUNT(*).
+    """
+    per_page = settings.PAGINATOR_OBJECTS_PER_PAGE
+    if 'cursor' in request.GET or (
+        'page' not in request.GET and settings.PAGINATOR_CURSOR_MODE
+    ):
+        paginator = CursorPaginator(object_list, per_page)
+        return paginator.get_page(request.GET.get('cursor'))
+    paginator = Paginator(object_list, per_page)
+    if count is not None:
+        paginator.count = count
+    return paginator.get_page(request.GET.get('page'))
@@ -0,0 +1,104 @@
+"""Пул процессов для декодирования и кодирования изображений.
+
+Pillow держит GIL, пока разбирает и сжимает пиксели, поэтому эта
+работа выносится из потоков веб-сервера в отдельные процессы. Очередь
+ограничена: когда в ней IMAGE_PROCESS_QUEUE задач, новая задача не
+ставится, и вызывающий код отдает заглушку. При IMAGE_PROCESS_WORKERS
+равном 0 задачи выполняются в текущем процессе. Если процесс пула
+умер, пул создается заново, а текущая задача получает Busy.
+
+В процессы передаются только байты и пути: базы и хранилища Django
+там нет, результаты записывает вызывающий процесс. Процессы
+запускаются заново (spawn), а не копией веб-сервера: иначе они
+наследуют его открытые временные файлы и удаляют их при выходе.
+"""
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+
+class Busy(Exception):
+    """Пул не принял задачу: очередь заполнена или процесс пула умер."""
+
+
+_pool = None
+_slots = None
+_lock = threading.Lock()
+
+
+def _init_worker():
+    django.setup()
+
+
+def _get_pool():
+    global _pool, _slots
+    with _lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.IMAGE_PROCESS_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker)
+            _slots = threading.BoundedSemaphore(settings.IMAGE_PROCESS_QUEUE)
+        return _pool, _slots
+
+
+def _discard(pool):
+    """Убирает сломанный пул, чтобы следующая задача создала новый."""
+    global _pool, _slots
+    with _lock:
+        if _pool is pool:
+            _pool = _slots = None
+    pool.shutdown(wait=False)
+
+
+def run(func, *args, wait=False):
+    """Выполняет func(*args) в пуле и возвращает результат.
+
+    Без wait при заполненной очереди сразу бросает Busy, с wait ждет
+    места не дольше IMAGE_PROCESS_TIMEOUT. Результат ждется не дольше
+    IMAGE_PROCESS_TIMEOUT, иначе concurrent.futures.TimeoutError.
+    """
+    if not settings.IMAGE_PROCESS_WORKERS:
+        return func(*args)
+    pool, slots = _get_pool()
+    timeout = settings.IMAGE_PROCESS_TIMEOUT
+    acquired = (slots.acquire(timeout=timeout) if wait
+                else slots.acquire(blocking=False))
+    if not acquired:
+        raise Busy
+    try:
+        future = pool.submit(func, *args)
+    except BrokenProcessPool as exc:
+        slots.release()
+        _discard(pool)
+        raise Busy from exc
+    except BaseException:
+        slots.release()
+        raise
+    future.add_done_callback(lambda future: slots.release())
+    try:
+        return future.result(timeout)
+    except BrokenProcessPool as exc:
+        _discard(pool)
+        raise Busy from exc
+
+
+def shutdown():
+    global _pool, _slots
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown()
+        _pool = _slots = None
+
+
+@receiver(setting_changed)
+def _reset(setting, **kwargs):
+    if setting.startswith('IMAGE_PROCESS_'):
+        shutdown()
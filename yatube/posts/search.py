@@ -0,0 +1,171 @@
+"""Полнотекстовый поиск по постам.
+
+На SQLite посты индексируются в виртуальной таблице FTS5, результаты
+ранжируются по bm25 и получают фрагмент текста с подсветкой. На других
+базах или без FTS5 используется поиск по подстроке.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Post
+
+FTS_TABLE = 'posts_post_fts'
+MARK_START, MARK_END = '\x02', '\x03'
+SNIPPET_TOKENS = 24
+FALLBACK_CONTEXT = 80
+
+_enabled = None
+
+
+def enabled():
+    """Есть ли в базе таблица FTS5 (создается миграцией только на SQLite).
+
+    Ответ, в том числе отрицательный, запоминается до следующего migrate.
+    """
+    global _enabled
+    if _enabled is None:
+        _enabled = (
+            connection.vendor == 'sqlite'
+            and FTS_TABLE in connection.introspection.table_names())
+    return _enabled
+
+
+def reset():
+    global _enabled
+    _enabled = None
+
+
+def terms(query):
+    return re.findall(r'\w+', query)
+
+
+def match_expression(query):
+    """Запрос пользователя как выражение MATCH: все слова, по префиксу.
+
+    Каждое слово берется в кавычки, чтобы операторы FTS5 в запросе
+    не приводили к синтаксической ошибке.
+    """
+    return ' '.join(f'"{term}"*' for term in terms(query))
+
+
+def index_post(post):
+    if not enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post.pk])
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, text) VALUES (%s, %s)',
+            [post.pk, post.text])
+
+
+def unindex_post(post_id):
+    if not enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post_id])
+
+
+def rebuild():
+    """Перестраивает индекс по текущим постам, возвращает их число."""
+    if not enabled():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, text) '
+            f'SELECT id, text FROM {Post._meta.db_table}')
+        return cursor.rowcount
+
+
+def filter_posts(queryset, query):
+    """Оставляет в queryset посты, подходящие под запрос."""
+    if enabled():
+        table = queryset.model._meta.db_table
+        return queryset.extra(
+            where=[f'"{table}"."id" IN (SELECT rowid FROM {FTS_TABLE} '
+                   f'WHERE {FTS_TABLE} MATCH %s)'],
+            params=[match_expression(query)])
+    condition = Q()
+    for term in terms(query):
+        condition &= Q(text__icontains=term)
+    return queryset.filter(condition)
+
+
+def _mark(text):
+    text = escape(text)
+    text = text.replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+    return mark_safe(text)
+
+
+def _fallback_snippet(text, query):
+    words = terms(query)
+    if not words:
+        return escape(text[:FALLBACK_CONTEXT * 2])
+    pattern = re.compile('|'.join(re.escape(word) for word in words), re.I)
+    found = pattern.search(text)
+    start = max(found.start() - FALLBACK_CONTEXT, 0) if found else 0
+    fragment = text[start:start + FALLBACK_CONTEXT * 2]
+    fragment = pattern.sub(
+        lambda match: MARK_START + match.group(0) + MARK_END, fragment)
+    prefix = '…' if start else ''
+    suffix = '…' if start + FALLBACK_CONTEXT * 2 < len(text) else ''
+    return _mark(prefix + fragment + suffix)
+
+
+class SearchResults:
+    """Найденные посты по убыванию релевантности.
+
+    Поддерживает count() и срезы, поэтому подходит для Paginator.
+    У каждого поста на странице есть атрибут snippet с подсветкой.
+    """
+
+    def __init__(self, query):
+        self.query = query
+        self.match = match_expression(query)
+
+    def count(self):
+        if not self.match:
+            return 0
+        if enabled():
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'SELECT COUNT(*) FROM {FTS_TABLE} '
+                    f'WHERE {FTS_TABLE} MATCH %s', [self.match])
+                return cursor.fetchone()[0]
+        return filter_posts(Post.objects.all(), self.query).count()
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        if not self.match:
+            return []
+        start = key.start or 0
+        limit = -1 if key.stop is None else key.stop - start
+        if not enabled():
+            posts = list(filter_posts(
+                Post.objects.for_feed(), self.query)[key])
+            for post in posts:
+                post.snippet = _fallback_snippet(post.text, self.query)
+            return posts
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid, snippet({FTS_TABLE}, 0, %s, %s, %s, %s) '
+                f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+                f'ORDER BY rank LIMIT %s OFFSET %s',
+                [MARK_START, MARK_END, '…', SNIPPET_TOKENS,
+                 self.match, limit, start])
+            rows = cursor.fetchall()
+        posts = Post.objects.for_feed().in_bulk([pk for pk, _ in rows])
+        results = []
+        for pk, snippet in rows:
+            if pk in posts:
+                posts[pk].snippet = _mark(snippet)
+                results.append(posts[pk])
+        return results
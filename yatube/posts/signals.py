@@ -0,0 +1,146 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import (
+    post_delete, post_migrate, post_save, pre_save,
+)
+from django.dispatch import receiver
+
+from . import counters, feed_cache, images, search, storage, timeline
+from .models import Comment, Follow, Group, Post, User, UserStats
+
+
+@receiver(post_save, sender=User)
+def user_created(sender, instance, created, raw=False, **kwargs):
+    """Строка счетчиков появляется вместе с пользователем."""
+    if created and not raw:
+        UserStats.objects.bulk_create(
+            [UserStats(user=instance)], ignore_conflicts=True)
+
+
+@receiver(pre_save, sender=Post)
+def remember_previous(sender, instance, raw=False, **kwargs):
+    """Запоминает прежних автора, группу и картинку поста.
+
+    Автор и группа нужны, чтобы перенести счетчики и сбросить ленты,
+    картинка - чтобы удалить файл, если на него больше никто не ссылается.
+    """
+    if instance.pk and not raw:
+        previous = Post.objects.filter(pk=instance.pk).values_list(
+            'author_id', 'group_id', 'image').first()
+        if previous:
+            (instance._previous_author_id, instance._previous_group_id,
+             instance._previous_image) = previous
+
+
+@receiver(pre_save, sender=Post)
+def describe_image(sender, instance, raw=False, **kwargs):
+    """Метаданные картинки считаются один раз, когда она меняется."""
+    if raw:
+        return
+    if instance.image.name != getattr(instance, '_previous_image', None):
+        for field, value in images.metadata(instance.image).items():
+            setattr(instance, field, value)
+
+
+def release_image(name):
+    if name and settings.POST_IMAGE_DELETE_UNREFERENCED:
+        transaction.on_commit(lambda: storage.release(name))
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, **kwargs):
+    """Новый пост сразу попадает в счетчики и ленты подписчиков автора."""
+    if raw:
+        return
+    previous_author_id = getattr(instance, '_previous_author_id', None)
+    previous_group_id = getattr(instance, '_previous_group_id', None)
+    feed_cache.bump_post(instance, previous_group_id, previous_author_id)
+    search.index_post(instance)
+    if created:
+        counters.change_user(instance.author_id, 'posts_count', 1)
+        counters.change_group(instance.group_id, 1)
+        timeline.forget_recent_posts(instance.author_id)
+        timeline.push_post(instance)
+        return
+    if previous_author_id not in (None, instance.author_id):
+        counters.change_user(previous_author_id, 'posts_count', -1)
+        counters.change_user(instance.author_id, 'posts_count', 1)
+        timeline.forget_recent_posts(previous_author_id)
+        timeline.forget_recent_posts(instance.author_id)
+        timeline.move_post(instance)
+    if previous_group_id != instance.group_id:
+        counters.change_group(previous_group_id, -1)
+        counters.change_group(instance.group_id, 1)
+    previous_image = getattr(instance, '_previous_image', None)
+    if previous_image != instance.image.name:
+        release_image(previous_image)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    feed_cache.bump_post(instance)
+    search.unindex_post(instance.pk)
+    counters.change_user(instance.author_id, 'posts_count', -1)
+    counters.change_group(instance.group_id, -1)
+    timeline.forget_recent_posts(instance.author_id)
+    release_image(instance.image.name)
+
+
+@receiver(pre_save, sender=Group)
+def remember_previous_slug(sender, instance, raw=False, **kwargs):
+    if instance.pk and not raw:
+        instance._previous_slug = Group.objects.filter(
+            pk=instance.pk).values_list('slug', flat=True).first()
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, raw=False, **kwargs):
+    """Название и адрес группы выводятся во всех лентах."""
+    if not raw:
+        feed_cache.bump(feed_cache.ALL)
+        feed_cache.forget_group(
+            instance.slug, getattr(instance, '_previous_slug', None))
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    feed_cache.bump(f'post:{instance.post_id}')
+    if created:
+        counters.change_post(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    feed_cache.bump(f'post:{instance.post_id}')
+    counters.change_post(instance.post_id, -1)
+
+
+def bump_follows(follow):
+    """Счетчики подписок и кнопка подписки выводятся в профиле."""
+    feed_cache.bump(f'follows:{follow.author_id}', f'follows:{follow.user_id}')
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        bump_follows(instance)
+        counters.change_user(instance.author_id, 'followers_count', 1)
+        counters.change_user(instance.user_id, 'following_count', 1)
+        timeline.follow(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    bump_follows(instance)
+    counters.change_user(instance.author_id, 'followers_count', -1)
+    counters.change_user(instance.user_id, 'following_count', -1)
+    timeline.unfollow(instance.user_id, instance.author_id)
+
+
+@receiver(post_migrate)
+def migrated(**kwargs):
+    # миграция могла создать или удалить таблицу поиска
+    search.reset()
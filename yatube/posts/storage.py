@@ -0,0 +1,109 @@
+"""Хранилище изображений постов с адресацией по содержимому.
+
+Файл называется по SHA-256 своего содержимого и лежит в подкаталогах
+по первым байтам хеша: posts/ab/cd/abcd....jpg. Одинаковые загрузки
+хранятся один раз, и миниатюры sorl для них тоже общие. Счетчиком
+ссылок служит сама таблица постов: файл удаляется, когда на него не
+ссылается ни один пост.
+
+Повторная загрузка того же файла обновляет его mtime: пока новый пост
+не закоммичен, ссылок на файл в базе нет. Файлы моложе MEDIA_GC_MIN_AGE
+поэтому не удаляются ни при освобождении, ни сборщиком мусора. Перед
+удалением файл переносится в сторону и ссылки проверяются еще раз:
+если пост успел сослаться на файл, он возвращается на место.
+"""
+import hashlib
+import os
+import time
+import uuid
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+
+    @staticmethod
+    def digest(content):
+        sha = hashlib.sha256()
+        content.seek(0)
+        for chunk in content.chunks():
+            sha.update(chunk)
+        content.seek(0)
+        return sha.hexdigest()
+
+    def hashed_name(self, name, digest):
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        return os.path.join(
+            directory, digest[:2], digest[2:4], digest + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, self.digest(content))
+        if self.exists(name):
+            os.utime(self.path(name))
+            return name
+        return super().save(name, content, max_length)
+
+
+post_images = ContentAddressedStorage()
+
+
+def references(name):
+    Post = apps.get_model('posts', 'Post')
+    return Post.objects.filter(image=name).count()
+
+
+def is_fresh(name):
+    """Моложе ли файл MEDIA_GC_MIN_AGE: на него мог сослаться пост,
+    который еще не закоммичен."""
+    try:
+        modified = os.path.getmtime(post_images.path(name))
+    except FileNotFoundError:
+        return False
+    return time.time() - modified < settings.MEDIA_GC_MIN_AGE
+
+
+def release(name, upload_to='posts/'):
+    """Удаляет файл и его миниатюры, если на него больше нет ссылок.
+
+    Файлы вне каталога загрузок (например, заданные вручную пути)
+    не трогаются, свежие файлы остаются сборщику мусора.
+    """
+    if not name or not name.startswith(upload_to):
+        return False
+    if is_fresh(name) or references(name):
+        return False
+    return delete(name)
+
+
+def delete(name):
+    """Удаляет файл, его миниатюры и их записи в хранилище ключей sorl.
+
+    Файл, на который к этому моменту сослался пост, остается.
+    """
+    path = post_images.path(name)
+    aside = f'{path}.{uuid.uuid4().hex}.deleting'
+    try:
+        os.rename(path, aside)
+    except FileNotFoundError:
+        return False
+    if references(name):
+        # пост закоммичен между проверкой ссылок и удалением
+        os.replace(aside, path)
+        return False
+    # по пути path уже может лежать новая копия незакоммиченного поста:
+    # ее не трогаем, удаляем только свою
+    default.kvstore.delete(ImageFile(name, post_images))
+    os.remove(aside)
+    return True
@@ -0,0 +1,29 @@
+from django import template
+from django.conf import settings
+
+from posts import thumbnails
+
+register = template.Library()
+
+
+@register.inclusion_tag('posts/includes/picture.html')
+def post_picture(post, variant='card'):
+    """Адаптивное изображение поста из заранее построенных миниатюр.
+
+    Пока миниатюр нет, отдается оригинал: в шаблоне они не строятся.
+    Размеры и заглушка берутся из полей поста, без чтения файла.
+    """
+    image = post.image
+    return {
+        'post': post,
+        'image': image,
+        'picture': thumbnails.picture(image, variant) if image else None,
+        'sizes': settings.POST_THUMBNAIL_SIZES,
+    }
+
+
+@register.simple_tag
+def prefetch_pictures(posts, variant='card'):
+    """Готовит миниатюры всей страницы ленты одним обращением к кэшу."""
+    thumbnails.prefetch([post.image for post in posts], variant)
+    return ''
@@ -1,11 +1,11 @@
 import shutil
 import tempfile
 from django.conf import settings
-from django.core.files.uploadedfile import SimpleUploadedFile
 from posts.forms import PostForm
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 from ..models import Group, Post, Comment
+from .utils import small_gif
 from django.contrib.auth import get_user_model
 
 
@@ -20,18 +20,7 @@ class PostCreateFormTests(TestCase):
     def setUpClass(cls):
         """Запись в базу данных."""
         super().setUpClass()
-        small_gif = (
-            b'\x47\x49\x46\x38\x39\x61\x01\x00'
-            b'\x01\x00\x00\x00\x00\x21\xf9\x04'
-            b'\x01\x0a\x00\x01\x00\x2c\x00\x00'
-            b'\x00\x00\x01\x00\x01\x00\x00\x02'
-            b'\x02\x4c\x01\x00\x3b'
-        )
-        cls.uploaded = SimpleUploadedFile(
-            name='small.gif',
-            content=small_gif,
-            content_type='image/gif'
-        )
+        cls.uploaded = small_gif()
         cls.user = User.objects.create_user(username='auth')
         cls.group = Group.objects.create(
             title='Тестовая группа',
@@ -142,18 +131,7 @@ class PostCreateFormTests(TestCase):
         запись в базе данных."""
         post_count = Post.objects.count()
         # Подготавливаем данные для передачи в форму
-        small_gif = (
-            b'\x47\x49\x46\x38\x39\x61\x01\x00'
-            b'\x01\x00\x00\x00\x00\x21\xf9\x04'
-            b'\x01\x0a\x00\x01\x00\x2c\x00\x00'
-            b'\x00\x00\x01\x00\x01\x00\x00\x02'
-            b'\x02\x4c\x01\x00\x3b'
-        )
-        uploaded_1 = SimpleUploadedFile(
-            name='small.gif',
-            content=small_gif,
-            content_type='image/gif'
-        )
+        uploaded_1 = small_gif()
         form_data = {
             'text': f'{PostCreateFormTests.post.text} new',
             'group': PostCreateFormTests.group.id,
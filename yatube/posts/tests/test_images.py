@@ -0,0 +1,199 @@
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+from sorl.thumbnail import default
+from posts.forms import PostForm
+from ..models import Post
+
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT, POST_IMAGE_MAX_SIDE=64,
+    POST_IMAGE_MAX_PIXELS=1000 * 1000)
+class ImageIngestTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    @staticmethod
+    def upload(size, format_='JPEG', name='photo.jpg', **options):
+        file = BytesIO()
+        Image.new('RGB', size, (200, 30, 30)).save(file, format_, **options)
+        return SimpleUploadedFile(name, file.getvalue())
+
+    def clean(self, upload):
+        form = PostForm(data={'text': 'Фото'}, files={'image': upload})
+        return form, form.is_valid()
+
+    def test_oversized_image_downscaled_and_exif_stripped(self):
+        """Большой JPEG уменьшается, поворот из EXIF применяется."""
+        exif = Image.Exif()
+        exif[0x0112] = 6  # повернуть на 90 градусов по часовой
+        upload = self.upload((300, 100), exif=exif.tobytes())
+        form, valid = self.clean(upload)
+        self.assertTrue(valid)
+        stored = form.cleaned_data['image']
+        self.assertLess(stored.size, upload.size)
+        with Image.open(stored) as image:
+            self.assertEqual(image.size, (21, 64))
+            self.assertNotIn('exif', image.info)
+
+    def test_png_exif_stripped(self):
+        """У PNG, как и у JPEG, EXIF не сохраняется."""
+        exif = Image.Exif()
+        exif[0x010F] = 'Камера'  # производитель
+        upload = self.upload((300, 100), 'PNG', 'photo.png', exif=exif)
+        form, valid = self.clean(upload)
+        self.assertTrue(valid)
+        with Image.open(form.cleaned_data['image']) as image:
+            image.load()
+            self.assertEqual(image.size, (64, 21))
+            self.assertNotIn('exif', image.info)
+            self.assertFalse(image.getexif())
+
+    def test_animated_webp_keeps_frames(self):
+        """Анимированный WebP уменьшается со всеми кадрами."""
+        frames = [
+            Image.new('RGB', (128, 128), color)
+            for color in ((255, 0, 0), (0, 255, 0), (0, 0, 255))
+        ]
+        file = BytesIO()
+        frames[0].save(
+            file, 'WEBP', save_all=True, append_images=frames[1:],
+            duration=100, loop=0)
+        upload = SimpleUploadedFile('anim.webp', file.getvalue())
+        form, valid = self.clean(upload)
+        self.assertTrue(valid)
+        with Image.open(form.cleaned_data['image']) as image:
+            self.assertEqual(image.size, (64, 64))
+            self.assertEqual(image.n_frames, 3)
+
+    def test_other_formats_converted(self):
+        """BMP и TIFF уменьшаются и переводятся в JPEG или PNG."""
+        cases = (
+            (self.upload((300, 100), 'BMP', 'photo.bmp'), 'JPEG', '.jpg'),
+            (self.upload((20, 20), 'BMP', 'small.bmp'), 'JPEG', '.jpg'),
+            (self.upload((300, 100), 'TIFF', 'scan.tiff'), 'JPEG', '.jpg'),
+        )
+        file = BytesIO()
+        Image.new('RGBA', (300, 100), (0, 0, 0, 0)).save(file, 'TIFF')
+        cases += (
+            (SimpleUploadedFile('alpha.tiff', file.getvalue()), 'PNG',
+             '.png'),
+        )
+        for upload, format_, extension in cases:
+            with self.subTest(name=upload.name):
+                form, valid = self.clean(upload)
+                self.assertTrue(valid)
+                stored = form.cleaned_data['image']
+                self.assertTrue(stored.name.endswith(extension))
+                with Image.open(stored) as image:
+                    self.assertEqual(image.format, format_)
+                    self.assertLessEqual(max(image.size), 64)
+
+    def test_animated_gif_downscaled_with_frames(self):
+        """Большой анимированный GIF уменьшается со всеми кадрами."""
+        frames = [
+            Image.new('RGB', (300, 100), color)
+            for color in ((255, 0, 0), (0, 255, 0))
+        ]
+        file = BytesIO()
+        frames[0].save(
+            file, 'GIF', save_all=True, append_images=frames[1:],
+            duration=100, loop=0)
+        form, valid = self.clean(
+            SimpleUploadedFile('anim.gif', file.getvalue()))
+        self.assertTrue(valid)
+        with Image.open(form.cleaned_data['image']) as image:
+            self.assertEqual(image.format, 'GIF')
+            self.assertEqual(image.size, (64, 21))
+            self.assertEqual(image.n_frames, 2)
+
+    def test_small_image_kept_as_is(self):
+        """Небольшое изображение без EXIF сохраняется без перекодирования."""
+        upload = self.upload((20, 20), 'PNG', 'small.png')
+        form, valid = self.clean(upload)
+        self.assertTrue(valid)
+        self.assertIs(form.cleaned_data['image'], upload)
+
+    def test_too_many_pixels_rejected(self):
+        """Изображение больше предела пикселей не принимается."""
+        form, valid = self.clean(self.upload((2000, 600), 'PNG', 'big.png'))
+        self.assertFalse(valid)
+        self.assertIn('image', form.errors)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, IMAGE_PROCESS_WORKERS=0)
+class ImageMetadataTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        default.kvstore.local.clear()
+
+    @staticmethod
+    def upload(size=(40, 20), color=(0, 128, 255), name='blue.png'):
+        file = BytesIO()
+        Image.new('RGB', size, color).save(file, 'PNG')
+        return SimpleUploadedFile(name, file.getvalue())
+
+    def test_metadata_stored_on_upload(self):
+        """Размеры, цвет и заглушка сохраняются вместе с постом."""
+        post = Post.objects.create(
+            text='Синий', author=self.user, image=self.upload())
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_height), (40, 20))
+        self.assertEqual(post.image_color, '#0080ff')
+        self.assertTrue(post.image_placeholder.startswith('data:image/'))
+
+    def test_feed_renders_metadata_without_file_io(self):
+        """Лента выводит размеры и заглушку, не открывая файл."""
+        post = Post.objects.create(
+            text='Синий', author=self.user, image=self.upload())
+        with mock.patch('posts.images.Image.open') as image_open:
+            response = self.client.get(reverse('posts:index'))
+            image_open.assert_not_called()
+        self.assertContains(response, 'width="40" height="20"')
+        self.assertContains(response, post.image_placeholder)
+
+    def test_unreadable_image_leaves_fields_empty(self):
+        """Для недоступного файла поля остаются пустыми."""
+        post = Post.objects.create(
+            text='Нет файла', author=self.user, image='posts/missing.jpg')
+        self.assertIsNone(post.image_width)
+        self.assertEqual(post.image_placeholder, '')
+
+    def test_backfill_command(self):
+        """Команда заполняет метаданные старых постов."""
+        post = Post.objects.create(
+            text='Старый', author=self.user, image=self.upload(name='o.png'))
+        Post.objects.filter(pk=post.pk).update(
+            image_width=None, image_height=None, image_color='')
+        out = StringIO()
+        call_command('backfill_image_metadata', stdout=out)
+        self.assertIn('Заполнено постов: 1', out.getvalue())
+        post.refresh_from_db()
+        self.assertEqual(post.image_width, 40)
+        self.assertEqual(post.image_color, '#0080ff')
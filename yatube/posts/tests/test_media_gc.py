@@ -0,0 +1,93 @@
+import os
+import shutil
+import tempfile
+import time
+from io import StringIO
+from unittest import mock
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from sorl.thumbnail import default
+from posts import media_gc
+from posts.storage import post_images
+from ..models import Post
+from .utils import SMALL_GIF, small_gif
+
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, IMAGE_PROCESS_WORKERS=0)
+class MediaGarbageTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    def tearDown(self):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    @staticmethod
+    def age(name, file_storage=post_images):
+        old = time.time() - 7200
+        os.utime(file_storage.path(name), (old, old))
+
+    def collect(self, *args):
+        out = StringIO()
+        call_command('collect_media_garbage', *args, stdout=out)
+        return out.getvalue()
+
+    def test_orphans_collected(self):
+        """Удаляются только старые файлы без ссылок и чужие миниатюры."""
+        post = Post.objects.create(
+            text='Живой', author=self.user, image=small_gif(
+                'live.gif', SMALL_GIF + b'l'))
+        thumbnail = default.backend.build(post.image, '96x34')
+        orphan = post_images.save(
+            'posts/orphan.gif', ContentFile(SMALL_GIF + b'o'))
+        fresh = post_images.save(
+            'posts/fresh.gif', ContentFile(SMALL_GIF + b'f'))
+        stray = default.storage.save(
+            'cache/aa/bb/stray.jpg', ContentFile(b'stray'))
+        for name in (post.image.name, orphan):
+            self.age(name)
+        for name in (thumbnail.name, stray):
+            self.age(name, default.storage)
+
+        report = self.collect('--dry-run')
+        self.assertIn(f'image {orphan}', report)
+        self.assertIn(f'thumbnail {stray}', report)
+        self.assertIn('Будет удалено файлов: 2', report)
+        self.assertTrue(post_images.exists(orphan))
+
+        self.collect()
+        self.assertFalse(post_images.exists(orphan))
+        self.assertFalse(default.storage.exists(stray))
+        self.assertTrue(post_images.exists(post.image.name))
+        self.assertTrue(post_images.exists(fresh))
+        self.assertTrue(thumbnail.exists())
+
+    @override_settings(POST_IMAGE_DELETE_UNREFERENCED=False)
+    @mock.patch('posts.signals.transaction.on_commit', lambda func: func())
+    def test_delete_hook_can_be_disabled(self):
+        """Без хука файл удаленного поста остается до сборки мусора."""
+        post = Post.objects.create(
+            text='Удалю', author=self.user, image=small_gif(
+                'gone.gif', SMALL_GIF + b'g'))
+        name = post.image.name
+        post.delete()
+        self.assertTrue(post_images.exists(name))
+        self.age(name)
+        self.collect()
+        self.assertFalse(post_images.exists(name))
+
+    def test_throttle_limits_rate(self):
+        """Ограничение скорости выдерживается паузами."""
+        throttle = media_gc.Throttle(bytes_per_second=1000)
+        with mock.patch('posts.media_gc.time.sleep') as sleep:
+            throttle(500)
+        self.assertAlmostEqual(sleep.call_args.args[0], 0.5, places=1)
@@ -1,7 +1,13 @@
+from importlib import import_module
+from io import StringIO
+
+from django.apps import apps
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
 from django.test import TestCase
 
-from ..models import Group, Post
+from .. import counters, feed_cache
+from ..models import Comment, Follow, Group, Post, UserStats
 
 User = get_user_model()
 
@@ -93,3 +99,97 @@ class GroupModelTest(TestCase):
             with self.subTest(value=value):
                 self.assertEqual(
                     group._meta.get_field(value).help_text, expected)
+
+
+class CountersTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        self.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        self.other_group = Group.objects.create(
+            title='Другая', slug='other', description='Описание')
+
+    def test_counters_follow_writes(self):
+        """Счетчики меняются при записи постов, комментариев и подписок."""
+        post = Post.objects.create(
+            author=self.author, text='пост', group=self.group)
+        Comment.objects.create(post=post, author=self.reader, text='да')
+        Follow.objects.create(user=self.reader, author=self.author)
+        post.refresh_from_db()
+        self.group.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(self.group.posts_count, 1)
+        stats = counters.user_stats(self.author.pk)
+        self.assertEqual(stats.posts_count, 1)
+        self.assertEqual(stats.followers_count, 1)
+        self.assertEqual(
+            counters.user_stats(self.reader.pk).following_count, 1)
+
+        post.group = self.other_group
+        post.save()
+        self.other_group.refresh_from_db()
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 0)
+        self.assertEqual(self.other_group.posts_count, 1)
+
+        post.delete()
+        Follow.objects.all().delete()
+        stats.refresh_from_db()
+        self.other_group.refresh_from_db()
+        self.assertEqual(stats.posts_count, 0)
+        self.assertEqual(stats.followers_count, 0)
+        self.assertEqual(self.other_group.posts_count, 0)
+
+    def test_author_change_moves_counters(self):
+        """Смена автора переносит счетчик постов и сбрасывает оба профиля."""
+        post = Post.objects.create(author=self.author, text='пост')
+        before = feed_cache.generations(
+            f'profile:{self.author.pk}', f'profile:{self.reader.pk}')
+        post.author = self.reader
+        post.save()
+        after = feed_cache.generations(
+            f'profile:{self.author.pk}', f'profile:{self.reader.pk}')
+        self.assertNotEqual(before[1], after[1])
+        self.assertNotEqual(before[2], after[2])
+        self.assertEqual(counters.user_stats(self.author.pk).posts_count, 0)
+        self.assertEqual(counters.user_stats(self.reader.pk).posts_count, 1)
+
+    def test_stats_row_created_with_user(self):
+        """Строка счетчиков создается с пользователем, чтение не пишет."""
+        self.assertTrue(UserStats.objects.filter(user=self.author).exists())
+        Post.objects.create(author=self.reader, text='пост')
+        UserStats.objects.filter(user=self.reader).delete()
+        with self.assertNumQueries(4):
+            stats = counters.user_stats(self.reader.pk)
+        self.assertEqual(stats.posts_count, 1)
+        self.assertFalse(UserStats.objects.filter(user=self.reader).exists())
+
+    def test_backfill_fills_existing_data(self):
+        """Миграция заполняет счетчики данных, созданных до них."""
+        Post.objects.create(author=self.author, text='пост', group=self.group)
+        Group.objects.update(posts_count=0)
+        UserStats.objects.all().delete()
+        migration = import_module('posts.migrations.0018_backfill_counters')
+        migration.backfill(apps, None)
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 1)
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).posts_count, 1)
+        self.assertTrue(UserStats.objects.filter(user=self.reader).exists())
+
+    def test_reconcile_counters(self):
+        """Команда reconcile_counters чинит разошедшиеся счетчики."""
+        post = Post.objects.create(
+            author=self.author, text='пост', group=self.group)
+        Comment.objects.create(post=post, author=self.reader, text='да')
+        Group.objects.update(posts_count=7)
+        Post.objects.update(comments_count=0)
+        UserStats.objects.all().delete()
+        call_command('reconcile_counters', batch_size=1, stdout=StringIO())
+        post.refresh_from_db()
+        self.group.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(self.group.posts_count, 1)
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).posts_count, 1)
@@ -0,0 +1,69 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+from sorl.thumbnail import default
+from posts import processing
+from posts.storage import post_images
+from .utils import SMALL_GIF
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT, IMAGE_PROCESS_WORKERS=1,
+    IMAGE_PROCESS_QUEUE=1, IMAGE_PROCESS_TIMEOUT=5)
+class ImageProcessingTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        default.kvstore.local.clear()
+
+    def test_run_in_process_pool(self):
+        """Задача выполняется в отдельном процессе."""
+        self.assertNotEqual(processing.run(os.getpid), os.getpid())
+
+    def test_full_queue_is_busy(self):
+        """При заполненной очереди задача не ставится."""
+        worker = threading.Thread(target=processing.run, args=(time.sleep, 1))
+        worker.start()
+        time.sleep(0.1)
+        with self.assertRaises(processing.Busy):
+            processing.run(pow, 2, 10)
+        worker.join()
+        self.assertEqual(processing.run(pow, 2, 10), 1024)
+
+    def test_pool_recovers_after_worker_death(self):
+        """Умерший процесс пула - Busy, следующая задача идет в новый пул."""
+        with self.assertRaises(processing.Busy):
+            processing.run(os._exit, 1)
+        self.assertEqual(processing.run(pow, 2, 10), 1024)
+
+    def test_thumbnail_built_in_pool(self):
+        """Миниатюра строится в пуле и записывается в хранилище."""
+        name = post_images.save(
+            'posts/pool.gif', ContentFile(SMALL_GIF + b'p'))
+        thumbnail = default.backend.build(name, '96x34', crop='center')
+        self.assertEqual((thumbnail.width, thumbnail.height), (96, 34))
+        self.assertTrue(thumbnail.exists())
+
+    def test_placeholder_while_busy(self):
+        """Пока пул занят, вместо миниатюры отдается оригинал."""
+        name = post_images.save(
+            'posts/busy.gif', ContentFile(SMALL_GIF + b'b'))
+        with mock.patch('posts.processing.run', side_effect=processing.Busy):
+            thumbnail = default.backend.get_thumbnail(name, '960x339')
+        self.assertEqual(thumbnail.name, name)
+        self.assertEqual((thumbnail.width, thumbnail.height), (960, 339))
+        self.assertIsNone(default.backend.lookup(name, '960x339'))
@@ -0,0 +1,99 @@
+import os
+import shutil
+import tempfile
+import time
+from unittest import mock
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+from posts import storage
+from posts.storage import post_images
+from ..models import Post
+from .utils import SMALL_GIF, small_gif
+
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+@mock.patch('posts.signals.transaction.on_commit', lambda func: func())
+class ContentAddressedStorageTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def create(self, content, name='meme.gif'):
+        return Post.objects.create(
+            text='Мем', author=self.user, image=small_gif(name, content))
+
+    @staticmethod
+    def age(name):
+        old = time.time() - 7200
+        os.utime(post_images.path(name), (old, old))
+
+    def test_identical_uploads_stored_once(self):
+        """Одинаковые файлы хранятся один раз под именем по хешу."""
+        first = self.create(SMALL_GIF, 'one.gif')
+        second = self.create(SMALL_GIF, 'two.gif')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(
+            first.image.name, r'^posts/(\w\w)/(\w\w)/\1\2\w{60}\.gif$')
+        directory = os.path.dirname(first.image.path)
+        self.assertEqual(len(os.listdir(directory)), 1)
+
+    def test_file_deleted_with_last_reference(self):
+        """Файл удаляется вместе с последним постом, который на него
+        ссылается."""
+        first = self.create(SMALL_GIF + b'1')
+        second = self.create(SMALL_GIF + b'1')
+        path = first.image.path
+        self.age(first.image.name)
+        first.delete()
+        self.assertTrue(os.path.exists(path))
+        second.delete()
+        self.assertFalse(os.path.exists(path))
+
+    def test_duplicate_survives_release_before_commit(self):
+        """Дубликат нового поста не удаляется вместе со старым постом."""
+        first = self.create(SMALL_GIF + b'd')
+        self.age(first.image.name)
+        # загрузка второго поста, который еще не закоммичен
+        name = post_images.save(
+            'posts/dup.gif', ContentFile(SMALL_GIF + b'd'))
+        first.delete()
+        self.assertTrue(post_images.exists(name))
+
+    def test_duplicate_upload_refreshes_mtime(self):
+        """Повторная загрузка делает файл снова молодым для сборщика."""
+        name = post_images.save(
+            'posts/again.gif', ContentFile(SMALL_GIF + b'a'))
+        old = time.time() - 7200
+        os.utime(post_images.path(name), (old, old))
+        post_images.save(
+            'posts/again.gif', ContentFile(SMALL_GIF + b'a'))
+        self.assertGreater(os.path.getmtime(post_images.path(name)), old)
+
+    def test_referenced_file_survives_delete(self):
+        """Файл, на который сослался пост, удаление не трогает."""
+        post = self.create(SMALL_GIF + b'r')
+        self.assertFalse(storage.delete(post.image.name))
+        self.assertTrue(os.path.exists(post.image.path))
+
+    def test_replaced_image_released(self):
+        """Замененная картинка удаляется, если больше нигде не нужна."""
+        post = self.create(SMALL_GIF + b'2')
+        path = post.image.path
+        self.age(post.image.name)
+        post.image = small_gif('meme.gif', SMALL_GIF + b'3')
+        post.save()
+        self.assertFalse(os.path.exists(path))
+        self.assertTrue(os.path.exists(post.image.path))
@@ -0,0 +1,137 @@
+import shutil
+import tempfile
+from unittest import mock
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from sorl.thumbnail import default
+from posts import thumbnails
+from ..models import Post
+from .utils import small_gif
+
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, POST_THUMBNAIL_WORKERS=0)
+@mock.patch('posts.thumbnails.transaction.on_commit', lambda func: func())
+class ThumbnailTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        # хранилище ключей sorl кэширует миниатюры одинаковых файлов
+        cache.clear()
+        default.kvstore.local.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def upload(self, name='thumb.gif'):
+        return small_gif(name)
+
+    def test_create_builds_thumbnails(self):
+        """Миниатюры строятся при сохранении поста, а не в шаблоне."""
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'С картинкой', 'image': self.upload()})
+        post = Post.objects.get(text='С картинкой')
+        thumbnail = thumbnails.lookup(post.image, 'card')
+        self.assertIsNotNone(thumbnail)
+        self.assertEqual((thumbnail.width, thumbnail.height), (960, 339))
+        response = self.authorized_client.get(
+            reverse('posts:profile', kwargs={'username': 'auth'}))
+        self.assertContains(response, thumbnail.url)
+
+    def test_responsive_variants(self):
+        """Строится лестница ширин в WebP, шаблон отдает srcset и sizes."""
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Адаптивная', 'image': self.upload('wide.gif')})
+        post = Post.objects.get(text='Адаптивная')
+        picture = thumbnails.picture(post.image, 'card')
+        self.assertEqual(picture['src'].width, 960)
+        self.assertEqual(
+            [source['type'] for source in picture['sources']],
+            ['image/webp'] if 'AVIF' not in thumbnails.formats()
+            else ['image/avif', 'image/webp'])
+        webp = picture['sources'][-1]['srcset']
+        for width in settings.POST_THUMBNAIL_WIDTHS:
+            self.assertIn(f'.webp {width}w', webp)
+            self.assertIn(f'.jpg {width}w', picture['srcset'])
+        response = self.authorized_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}))
+        self.assertContains(response, f'srcset="{webp}"')
+        self.assertContains(response, 'width="960" height="339"')
+
+    @override_settings(POST_THUMBNAIL_FORMATS=('NOPE', 'JPEG'))
+    def test_unsupported_formats_skipped(self):
+        """Форматы, которых не умеет Pillow, не строятся."""
+        self.assertEqual(thumbnails.formats(), ['JPEG'])
+
+    def test_feed_page_prefetched_in_one_round_trip(self):
+        """Миниатюры страницы ленты ищутся одним обращением к кэшу."""
+        for number in range(10):
+            self.authorized_client.post(
+                reverse('posts:post_create'),
+                data={'text': f'Пост {number}',
+                      'image': self.upload(f'{number}.gif')})
+        default.kvstore.local.clear()
+        kvstore_cache = default.kvstore.cache
+        with mock.patch.object(kvstore_cache, 'get_many',
+                               wraps=kvstore_cache.get_many) as get_many, \
+                mock.patch('posts.kvstore.cached_db_kvstore.KVStore._get_raw',
+                           return_value=None) as get_raw:
+            response = self.authorized_client.get(reverse('posts:index'))
+        thumbnail_get_many = [
+            call for call in get_many.call_args_list
+            if any(key.startswith('sorl-thumbnail') for key in call.args[0])
+        ]
+        self.assertEqual(len(thumbnail_get_many), 1)
+        get_raw.assert_not_called()
+        self.assertContains(response, '<picture>', count=10)
+
+    def test_generate_reads_and_writes_kvstore_in_bulk(self):
+        """Лестница миниатюр не обращается к таблице sorl по ключу."""
+        post = Post.objects.create(
+            text='Лестница', author=self.user, image=self.upload('ladder.gif'))
+        with self.assertNumQueries(3):
+            thumbnails.generate(post)
+        default.kvstore.local.clear()
+        cache.clear()
+        self.assertEqual(
+            len(thumbnails.picture(post.image, 'card')['sources']),
+            len(thumbnails.formats()) - 1)
+
+    def test_edit_rebuilds_only_changed_image(self):
+        """Правка без новой картинки не ставит миниатюры в очередь."""
+        post = Post.objects.create(
+            text='Без картинки', author=self.user, image=self.upload())
+        url = reverse('posts:post_edit', kwargs={'post_id': post.pk})
+        with mock.patch('posts.thumbnails.generate') as generate:
+            self.authorized_client.post(url, data={'text': 'Новый текст'})
+            generate.assert_not_called()
+            self.authorized_client.post(
+                url, data={'text': 'Новый текст', 'image': self.upload()})
+            generate.assert_called_once()
+
+    def test_template_falls_back_to_original(self):
+        """Пока миниатюры нет, шаблон отдает оригинал и не строит ее."""
+        post = Post.objects.create(
+            text='Старый пост', author=self.user,
+            image=self.upload('old.gif'))
+        with mock.patch('posts.thumbnails.default.engine') as engine:
+            response = self.authorized_client.get(
+                reverse('posts:post_detail', kwargs={'post_id': post.pk}))
+            engine.get_image.assert_not_called()
+        self.assertContains(response, post.image.url)
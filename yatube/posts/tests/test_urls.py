@@ -1,3 +1,4 @@
+from django.core.cache import cache
 from django.test import TestCase, Client
 from django.contrib.auth import get_user_model
 from ..models import Group, Post
@@ -26,6 +27,7 @@ class PostURLTest(TestCase):
 
     def setUp(self):
         """Создаеем пользователей."""
+        cache.clear()
         self.guest_client = Client()
         self.user = PostURLTest.user_1
         self.authorized_client = Client()
@@ -1,14 +1,23 @@
 import shutil
 import tempfile
+import time
+from io import StringIO
+from unittest import mock
 from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase, Client, override_settings
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from django import forms
-from ..models import Group, Post, Follow, Comment
+from ..models import (
+    Group, Post, Follow, Comment, TimelineEntry, UserStats,
+)
+from .. import feed_cache, search
+from core.query_budget import assert_within_budget
 from django.core.cache import cache
 from django.contrib.auth.models import User
-from django.core.files.uploadedfile import SimpleUploadedFile
+from .utils import small_gif
 
 
 User = get_user_model()
@@ -22,18 +31,7 @@ class PostPagesTest(TestCase):
     def setUpClass(cls):
         """Создаем запись в БД."""
         super().setUpClass()
-        small_gif = (
-            b'\x47\x49\x46\x38\x39\x61\x01\x00'
-            b'\x01\x00\x00\x00\x00\x21\xf9\x04'
-            b'\x01\x0a\x00\x01\x00\x2c\x00\x00'
-            b'\x00\x00\x01\x00\x01\x00\x00\x02'
-            b'\x02\x4c\x01\x00\x3b'
-        )
-        cls.uploaded = SimpleUploadedFile(
-            name='small.gif',
-            content=small_gif,
-            content_type='image/gif'
-        )
+        cls.uploaded = small_gif()
         cls.user = User.objects.create_user(username='auth')
         cls.group = Group.objects.create(
             title='Тестовая группа',
@@ -54,6 +52,7 @@ class PostPagesTest(TestCase):
 
     def setUp(self):
         """Создаем пользователей."""
+        cache.clear()
         self.guest_client = Client()
         self.user = User.objects.create_user(username='StasBasov')
         self.authorized_client = Client()
@@ -193,6 +192,7 @@ class PostPaginatorTest(TestCase):
 
     def setUp(self):
         """Создаем пользователей."""
+        cache.clear()
         self.guest_client = Client()
         self.user = User.objects.create_user(username='StasBasov')
         self.authorized_client = Client()
@@ -237,6 +237,41 @@ class PostPaginatorTest(TestCase):
                 second_p = len(response.context['page_obj'])
                 self.assertEqual(second_p, page_exp)
 
+    def test_cursor_pages(self):
+        """Курсорная пагинация проходит ленту вперед и назад."""
+        url = reverse('posts:index')
+        first = self.guest_client.get(url + '?cursor=').context['page_obj']
+        self.assertEqual(len(first), 10)
+        self.assertFalse(first.has_previous())
+        second = self.guest_client.get(
+            url + '?cursor=' + first.next_cursor).context['page_obj']
+        self.assertEqual(len(second), 3)
+        self.assertFalse(second.has_next())
+        self.assertEqual(
+            [post.text for post in second],
+            ['text %s' % i for i in range(3, 0, -1)]
+        )
+        back = self.guest_client.get(
+            url + '?cursor=' + second.previous_cursor).context['page_obj']
+        self.assertEqual(list(back), list(first))
+
+    def test_cursor_same_pub_date(self):
+        """Посты с одинаковой датой не теряются на границе страниц."""
+        same_date = Post.objects.first().pub_date
+        Post.objects.update(pub_date=same_date)
+        url = reverse('posts:profile', kwargs={'username': 'auth'})
+        first = self.guest_client.get(url + '?cursor=').context['page_obj']
+        second = self.guest_client.get(
+            url + '?cursor=' + first.next_cursor).context['page_obj']
+        seen = [post.pk for post in first] + [post.pk for post in second]
+        self.assertEqual(len(set(seen)), 13)
+
+    def test_invalid_cursor_opens_first_page(self):
+        """Испорченный курсор открывает первую страницу."""
+        response = self.guest_client.get(
+            reverse('posts:index') + '?cursor=broken')
+        self.assertEqual(len(response.context['page_obj']), 10)
+
 
 class FollowUserTest(TestCase):
     def setUp(self):
@@ -301,6 +336,95 @@ class FollowUserTest(TestCase):
         self.assertNotEqual(check_content, post_unfollow.text)
         self.assertIn("New post for test following", response.content.decode())
 
+    def test_timeline_follows_writes(self):
+        """Лента подписок обновляется при постах, подписках и отписках."""
+        Follow.objects.create(user=self.user_1, author=self.user_2)
+        post = Post.objects.create(text='fan-out', author=self.user_2)
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.user_1, post=post).exists())
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(list(response.context['page_obj']), [post])
+        Follow.objects.filter(user=self.user_1, author=self.user_2).delete()
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(len(response.context['page_obj']), 0)
+
+    @override_settings(FEED_CELEBRITY_FOLLOWERS=2)
+    def test_celebrity_posts_merged_on_read(self):
+        """Посты популярного автора подмешиваются в ленту при чтении."""
+        Follow.objects.create(user=self.user_1, author=self.user_2)
+        Follow.objects.create(user=self.user_1, author=self.user_3)
+        Follow.objects.create(user=self.user_3, author=self.user_2)
+        posts = [
+            Post.objects.create(text=f'post {i}', author=author)
+            for i, author in enumerate(
+                [self.user_2, self.user_3, self.user_2, self.user_3])
+        ]
+        self.assertFalse(
+            TimelineEntry.objects.filter(author=self.user_2).exists())
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            list(response.context['page_obj']), posts[::-1])
+        page = self.authorized_client.get(
+            reverse('posts:follow_index') + '?cursor=').context['page_obj']
+        self.assertEqual(list(page), posts[::-1])
+
+    @override_settings(FEED_CELEBRITY_FOLLOWERS=2)
+    def test_author_below_threshold_is_pushed_again(self):
+        """Автор, потерявший подписчиков, снова раскладывается по лентам."""
+        Follow.objects.create(user=self.user_1, author=self.user_2)
+        Follow.objects.create(user=self.user_3, author=self.user_2)
+        post = Post.objects.create(text='celebrity', author=self.user_2)
+        Follow.objects.filter(user=self.user_3).delete()
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.user_1, post=post).exists())
+
+    @override_settings(FEED_CELEBRITY_FOLLOWERS=3)
+    def test_demotion_detected_after_counter_drift(self):
+        """Выход из популярных замечается, даже если счетчик сбился."""
+        for follower in (self.user_1, self.user_3):
+            Follow.objects.create(user=follower, author=self.user_2)
+        UserStats.objects.filter(user=self.user_2).update(followers_count=5)
+        post = Post.objects.create(text='celebrity', author=self.user_2)
+        UserStats.objects.filter(user=self.user_2).update(followers_count=1)
+        Follow.objects.filter(user=self.user_3).delete()
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.user_1, post=post).exists())
+
+    @override_settings(FEED_AUTHOR_RECENT_POSTS=2)
+    def test_follow_copies_only_recent_posts(self):
+        """Подписка копирует в ленту только последние посты автора."""
+        posts = [
+            Post.objects.create(text=f'post {i}', author=self.user_2)
+            for i in range(3)
+        ]
+        Follow.objects.create(user=self.user_1, author=self.user_2)
+        self.assertEqual(
+            set(TimelineEntry.objects.filter(
+                user=self.user_1).values_list('post_id', flat=True)),
+            {post.pk for post in posts[1:]})
+
+    def test_author_change_moves_timeline_entries(self):
+        """Пост, сменивший автора, переезжает в ленты его подписчиков."""
+        Follow.objects.create(user=self.user_1, author=self.user_2)
+        Follow.objects.create(user=self.user_3, author=self.user_1)
+        post = Post.objects.create(text='Чужой пост', author=self.user_2)
+        post.author = self.user_1
+        post.save()
+        self.assertEqual(
+            list(TimelineEntry.objects.filter(post=post).values_list(
+                'user_id', 'author_id')),
+            [(self.user_3.pk, self.user_1.pk)])
+
+    def test_rebuild_timelines(self):
+        """Команда rebuild_timelines восстанавливает ленты."""
+        Follow.objects.create(user=self.user_1, author=self.user_2)
+        for i in range(3):
+            Post.objects.create(text=f'post {i}', author=self.user_2)
+        TimelineEntry.objects.all().delete()
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.user_1).count(), 3)
+
 
 class TestCacheIndex(TestCase):
     def setUp(self):
@@ -320,13 +444,35 @@ class TestCacheIndex(TestCase):
         )
         response_1 = self.authorized_client.get(reverse('posts:index'))
         first_render = response_1.content
-        Post.objects.filter(text='test text').delete()
+        # update() не отправляет сигналы, фрагмент остается в кэше
+        Post.objects.filter(text='test text').update(text='changed')
         response_2 = self.authorized_client.get(reverse('posts:index'))
         self.assertEqual(first_render, response_2.content)
         cache.clear()
         response_3 = self.authorized_client.get(reverse('posts:index'))
         self.assertNotEqual(first_render, response_3.content)
 
+    def test_cache_invalidated_on_write(self):
+        """Новый или удаленный пост сразу виден на главной странице."""
+        response_1 = self.authorized_client.get(reverse('posts:index'))
+        post = Post.objects.create(text='fresh post', author=self.user)
+        response_2 = self.authorized_client.get(reverse('posts:index'))
+        self.assertNotEqual(response_1.content, response_2.content)
+        self.assertIn('fresh post', response_2.content.decode())
+        post.delete()
+        response_3 = self.authorized_client.get(reverse('posts:index'))
+        self.assertEqual(response_1.content, response_3.content)
+
+    def test_cache_is_page_aware(self):
+        """Вторая страница не отдает закэшированную первую."""
+        for i in range(settings.PAGINATOR_OBJECTS_PER_PAGE):
+            Post.objects.create(text=f'page post {i}', author=self.user)
+        first = self.authorized_client.get(reverse('posts:index'))
+        second = self.authorized_client.get(
+            reverse('posts:index') + '?page=2')
+        self.assertIn('lalala', second.content.decode())
+        self.assertNotIn('lalala', first.content.decode())
+
 
 class CommentTest(TestCase):
     def setUp(self):
@@ -361,3 +507,364 @@ class CommentTest(TestCase):
         comment_obj = Comment.objects.filter(author=self.user1,
                                              post=self.post.pk).count()
         self.assertEqual(comment_obj, 1)
+
+
+class FeedQueriesTest(TestCase):
+    """Число запросов на страницу ленты не зависит от числа постов."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(
+            username='author', first_name='Лев', last_name='Толстой')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        for i in range(15):
+            Post.objects.create(
+                text=f'post {i}', author=cls.author, group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(FeedQueriesTest.reader)
+
+    def test_feed_query_count(self):
+        # у группы и профиля один запрос уходит на валидатор ETag
+        pages = {
+            reverse('posts:index'): 2,
+            reverse('posts:index') + '?cursor=': 1,
+            reverse('posts:group_list', kwargs={'slug': 'group'}): 3,
+            reverse('posts:profile', kwargs={'username': 'author'}): 4,
+        }
+        for url, queries in pages.items():
+            with self.subTest(url=url):
+                with self.assertNumQueries(queries):
+                    self.guest_client.get(url)
+
+    def test_follow_feed_query_count(self):
+        # сессия и пользователь + популярные авторы, COUNT,
+        # срез ленты и посты страницы
+        with self.assertNumQueries(6):
+            self.authorized_client.get(reverse('posts:follow_index'))
+
+    def test_feed_queries_use_indexes(self):
+        """Запросы лент идут по индексам без временной сортировки."""
+        call_command('check_feed_indexes', stdout=StringIO())
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class QueryBudgetTest(TestCase):
+    """Страницы укладываются в бюджеты запросов представлений."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        # автор, созданный в обход сигналов, без строки счетчиков
+        cls.fresh = User.objects.create_user(username='fresh')
+        UserStats.objects.filter(user=cls.fresh).delete()
+        User.objects.create_user(username='other')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        for i in range(15):
+            cls.post = Post.objects.create(
+                text=f'post {i}', author=cls.author, group=cls.group)
+            Comment.objects.create(
+                post=cls.post, author=cls.reader, text='Комментарий')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(QueryBudgetTest.reader)
+
+    def test_pages_within_budget(self):
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'group'}),
+            reverse('posts:profile', kwargs={'username': 'author'}),
+            reverse('posts:profile', kwargs={'username': 'fresh'}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+            reverse('posts:follow_index'),
+            reverse('posts:search') + '?q=post',
+        )
+        for url in urls:
+            for client in (self.client, self.authorized_client):
+                with self.subTest(url=url):
+                    cache.clear()
+                    assert_within_budget(client, url)
+
+    @mock.patch('posts.thumbnails.transaction.on_commit', lambda func: func())
+    def test_writes_within_budget(self):
+        """Создание поста с миниатюрами и подписка укладываются в бюджет."""
+        image = small_gif('budget.gif')
+        assert_within_budget(
+            self.authorized_client, reverse('posts:post_create'),
+            data={'text': 'С картинкой', 'image': image})
+        for username in ('author', 'other'):
+            with self.subTest(username=username):
+                assert_within_budget(
+                    self.authorized_client, reverse(
+                        'posts:profile_follow',
+                        kwargs={'username': username}))
+
+
+class ConditionalGetTest(TestCase):
+    """Неизменившиеся страницы отдают 304 без отрисовки."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        cls.post = Post.objects.create(
+            text='Пост', author=cls.author, group=cls.group)
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(ConditionalGetTest.reader)
+
+    def revalidate(self, url, response, client=None):
+        client = client or self.client
+        return client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_unchanged_pages_not_modified(self):
+        """Повторный запрос с тем же ETag получает 304."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'group'}),
+            reverse('posts:profile', kwargs={'username': 'author'}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(
+                    self.revalidate(url, response).status_code, 304)
+
+    def test_not_modified_costs_at_most_one_query(self):
+        """Для 304 нужен только крошечный запрос валидатора."""
+        url = reverse('posts:index')
+        response = self.client.get(url)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.revalidate(url, response).status_code, 304)
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        response = self.client.get(url)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.revalidate(url, response).status_code, 304)
+
+    def test_write_changes_validator(self):
+        """После записи страница отдается заново."""
+        detail = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        profile = reverse('posts:profile', kwargs={'username': 'author'})
+        index = reverse('posts:index')
+        responses = {url: self.client.get(url)
+                     for url in (detail, profile, index)}
+        Comment.objects.create(post=self.post, author=self.reader, text='!')
+        Follow.objects.create(user=self.reader, author=self.author)
+        Post.objects.create(text='Новый', author=self.reader)
+        for url, response in responses.items():
+            with self.subTest(url=url):
+                self.assertEqual(
+                    self.revalidate(url, response).status_code, 200)
+
+    def test_etag_depends_on_user(self):
+        """Гость и пользователь не получают чужую версию страницы."""
+        url = reverse('posts:index')
+        response = self.client.get(url)
+        revalidated = self.revalidate(url, response, self.authorized_client)
+        self.assertEqual(revalidated.status_code, 200)
+
+    def test_etag_depends_on_csrf_token(self):
+        """После смены CSRF-токена форма комментария отдается заново."""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        response = self.authorized_client.get(url)
+        self.assertEqual(self.revalidate(
+            url, response, self.authorized_client).status_code, 304)
+        self.authorized_client.cookies[settings.CSRF_COOKIE_NAME] = 'a' * 64
+        self.assertEqual(self.revalidate(
+            url, response, self.authorized_client).status_code, 200)
+
+    def later(self, now):
+        return mock.patch('posts.feed_cache.time.time', return_value=now)
+
+    def test_last_modified_for_guests(self):
+        """Гостям отдается Last-Modified, и If-Modified-Since работает."""
+        url = reverse('posts:index')
+        self.client.get(url)
+        with self.later(time.time() + 2):
+            response = self.client.get(url)
+            self.assertIn('Last-Modified', response)
+            revalidated = self.client.get(
+                url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+            self.assertEqual(revalidated.status_code, 304)
+            self.assertNotIn(
+                'Last-Modified', self.authorized_client.get(url))
+
+    def test_last_modified_waits_for_second_to_end(self):
+        """Вторая запись в ту же секунду не прячется за прежней датой."""
+        with self.later(1000.2):
+            feed_cache.bump('index')
+            self.assertIsNone(feed_cache.last_modified('index'))
+        with self.later(1001.5):
+            first = feed_cache.last_modified('index')
+            feed_cache.bump('index')
+            self.assertIsNone(feed_cache.last_modified('index'))
+        with self.later(1003):
+            self.assertGreater(feed_cache.last_modified('index'), first)
+
+
+class PageCacheTest(TestCase):
+    """Страницы лент отрисовываются один раз для всех посетителей."""
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        Post.objects.create(text='Первый пост', author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(PageCacheTest.reader)
+
+    def test_page_rendered_once(self):
+        """Второй запрос берет страницу из кэша, пользователь - свою шапку."""
+        url = reverse('posts:index')
+        self.client.get(url)
+        response = self.authorized_client.get(url)
+        self.assertTemplateNotUsed(response, 'posts/index.html')
+        self.assertTemplateUsed(response, 'includes/header_user.html')
+        content = response.content.decode()
+        self.assertIn('Пользователь: reader', content)
+        self.assertIn('Первый пост', content)
+        self.assertNotIn('<!--hole:', content)
+        guest_content = self.client.get(url).content.decode()
+        self.assertNotIn('Пользователь:', guest_content)
+
+    def test_follow_button_is_personal(self):
+        """Кнопка подписки в общей странице профиля своя у каждого."""
+        url = reverse('posts:profile', kwargs={'username': 'author'})
+        self.assertContains(self.authorized_client.get(url), 'Отписаться')
+        response = self.client.get(url)
+        self.assertTemplateNotUsed(response, 'posts/profile.html')
+        self.assertContains(response, 'Подписаться')
+
+    def test_write_renders_page_again(self):
+        """После записи в ленту страница отрисовывается заново."""
+        url = reverse('posts:index')
+        self.client.get(url)
+        Post.objects.create(text='Второй пост', author=self.author)
+        response = self.client.get(url)
+        self.assertTemplateUsed(response, 'posts/index.html')
+        self.assertContains(response, 'Второй пост')
+
+    def test_feeds_with_equal_generations_not_mixed(self):
+        """Ленты с одинаковыми поколениями не делят фрагмент."""
+        first = Group.objects.create(title='А', slug='a', description='')
+        second = Group.objects.create(title='Б', slug='b', description='')
+        Post.objects.create(text='Пост группы А', author=self.author,
+                            group=first)
+        Post.objects.create(text='Пост группы Б', author=self.author,
+                            group=second)
+        cache.set_many({f'posts:gen:group:{group.pk}': 1000
+                        for group in (first, second)}, None)
+        self.client.get(reverse('posts:group_list', kwargs={'slug': 'a'}))
+        response = self.client.get(
+            reverse('posts:group_list', kwargs={'slug': 'b'}))
+        self.assertContains(response, 'Пост группы Б')
+        self.assertNotContains(response, 'Пост группы А')
+
+
+class GroupLookupTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+
+    def test_group_id_cached_until_slug_changes(self):
+        """Группа по slug ищется в базе один раз и забывается при правке."""
+        self.assertEqual(feed_cache.group_id('group'), self.group.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(feed_cache.group_id('group'), self.group.pk)
+        self.group.slug = 'renamed'
+        self.group.save()
+        self.assertIsNone(feed_cache.group_id('group'))
+        self.assertEqual(feed_cache.group_id('renamed'), self.group.pk)
+
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='writer')
+        cls.post_1 = Post.objects.create(
+            text='Самурай идет по пути меча', author=cls.user)
+        cls.post_2 = Post.objects.create(
+            text='Самурай, самурай и снова <b>самурай</b>', author=cls.user)
+        cls.post_3 = Post.objects.create(
+            text='Совсем другая история', author=cls.user)
+
+    def setUp(self):
+        self.guest_client = Client()
+
+    def search(self, query):
+        response = self.guest_client.get(
+            reverse('posts:search'), {'q': query})
+        return response.context['page_obj']
+
+    def test_search_ranked_with_snippets(self):
+        """Поиск находит посты по релевантности и подсвечивает слова."""
+        page = self.search('самурай')
+        self.assertEqual(list(page), [self.post_2, self.post_1])
+        self.assertIn('<mark>Самурай</mark>', page[1].snippet)
+        self.assertIn('&lt;b&gt;', page[0].snippet)
+
+    def test_search_index_follows_writes(self):
+        """Правка и удаление поста сразу видны в поиске."""
+        self.post_3.text = 'История самурая'
+        self.post_3.save()
+        self.assertIn(self.post_3, list(self.search('самура')))
+        self.post_3.delete()
+        self.assertNotIn(self.post_3, list(self.search('самура')))
+
+    def test_search_operators_are_escaped(self):
+        """Операторы FTS5 в запросе не ломают поиск."""
+        self.assertEqual(len(self.search('"меча* (')), 1)
+        self.assertEqual(len(self.search('')), 0)
+
+    def test_admin_search_uses_index(self):
+        """Поиск в админке идет по тому же индексу."""
+        admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password')
+        self.guest_client.force_login(admin)
+        response = self.guest_client.get(
+            '/admin/posts/post/', {'q': 'самурай'})
+        self.assertEqual(response.context['cl'].result_count, 2)
+
+    def test_search_fallback(self):
+        """Без FTS5 поиск идет по подстроке."""
+        with mock.patch('posts.search.enabled', return_value=False):
+            page = self.search('меча')
+        self.assertEqual(list(page), [self.post_1])
+        self.assertIn('<mark>меча</mark>', page[0].snippet)
+
+    def test_missing_index_checked_once(self):
+        """Отсутствие таблицы поиска тоже запоминается."""
+        search.reset()
+        self.addCleanup(search.reset)
+        with mock.patch.object(connection.introspection, 'table_names',
+                               return_value=[]) as table_names:
+            self.assertFalse(search.enabled())
+            self.assertFalse(search.enabled())
+        table_names.assert_called_once()
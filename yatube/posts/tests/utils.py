@@ -0,0 +1,15 @@
+from django.core.files.uploadedfile import SimpleUploadedFile
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x01\x00'
+    b'\x01\x00\x00\x00\x00\x21\xf9\x04'
+    b'\x01\x0a\x00\x01\x00\x2c\x00\x00'
+    b'\x00\x00\x01\x00\x01\x00\x00\x02'
+    b'\x02\x4c\x01\x00\x3b'
+)
+
+
+def small_gif(name='small.gif', content=SMALL_GIF):
+    """Загружаемая картинка GIF размером 1x1 для тестов."""
+    return SimpleUploadedFile(
+        name=name, content=content, content_type='image/gif')
@@ -0,0 +1,302 @@
+"""Миниатюры изображений постов, подготовленные заранее.
+
+Варианты из settings.POST_THUMBNAIL_VARIANTS строятся после сохранения
+поста в фоновом пуле потоков. Для каждого варианта строится лестница
+ширин POST_THUMBNAIL_WIDTHS в форматах POST_THUMBNAIL_FORMATS, которые
+поддерживает Pillow. Шаблоны только ищут готовые файлы в хранилище
+ключей sorl и не декодируют изображения во время запроса. Сами пиксели
+обрабатываются в пуле процессов posts.processing.
+"""
+import logging
+import threading
+import time
+from concurrent import futures
+from io import BytesIO
+
+from django.conf import settings
+from django.db import connections, transaction
+from PIL import Image
+from sorl.thumbnail import base, default
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.helpers import serialize, tokey
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.parsers import parse_geometry
+
+from core import metrics
+
+from . import feed_cache, processing
+
+logger = logging.getLogger(__name__)
+
+MIME_TYPES = {
+    'AVIF': 'image/avif',
+    'WEBP': 'image/webp',
+    'JPEG': 'image/jpeg',
+    'PNG': 'image/png',
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class _Output:
+    def write(self, raw):
+        self.raw = raw
+
+
+def render(data, geometry_string, options):
+    """Строит миниатюру из байтов оригинала в пуле процессов.
+
+    Возвращает байты миниатюры, ее размер и размер оригинала.
+    """
+    engine = default.engine
+    image = engine.get_image(BytesIO(data))
+    try:
+        options = dict(options, image_info=engine.get_image_info(image))
+        ratio = engine.get_image_ratio(image, options)
+        thumbnail = engine.create(
+            image, parse_geometry(geometry_string, ratio), options)
+        output = _Output()
+        engine.write(thumbnail, options, output)
+        return (output.raw, engine.get_image_size(thumbnail),
+                engine.get_image_size(image))
+    finally:
+        engine.cleanup(image)
+
+
+class ThumbnailBackend(base.ThumbnailBackend):
+    """Бэкенд sorl, который обрабатывает изображения в пуле процессов
+    и умеет искать миниатюру, не создавая ее."""
+
+    def _options(self, source, options):
+        # те же умолчания, что и в get_thumbnail, иначе имя не совпадет
+        if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(thumbnail_settings, attr)
+            if value != getattr(default_settings, attr):
+                options.setdefault(key, value)
+        return options
+
+    def target(self, file_, geometry_string, **options):
+        """Файл, под которым будет лежать миниатюра; без обращения к нему."""
+        source = ImageFile(file_)
+        options = self._options(source, options)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return ImageFile(name, default.storage)
+
+    def lookup(self, file_, geometry_string, **options):
+        """Готовая миниатюра из хранилища ключей или None."""
+        return default.kvstore.get(
+            self.target(file_, geometry_string, **options))
+
+    def get_thumbnail(self, file_, geometry_string, **options):
+        return self.build(file_, geometry_string, wait=False, **options)
+
+    def build(self, file_, geometry_string, wait=True, **options):
+        """То же, что get_thumbnail в sorl, но пиксели - в пуле процессов.
+
+        Если пул занят или не успел за IMAGE_PROCESS_TIMEOUT, без wait
+        возвращается заглушка, а с wait исключение уходит выше.
+        """
+        source = ImageFile(file_)
+        options = self._options(source, options)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        thumbnail = ImageFile(name, default.storage)
+        cached = default.kvstore.get(thumbnail)
+        if cached:
+            return cached
+        if (thumbnail_settings.THUMBNAIL_FORCE_OVERWRITE
+                or not thumbnail.exists()):
+            try:
+                data = source.read()
+            except Exception:
+                logger.exception('Нет исходного файла %s', source)
+                return thumbnail
+            start = time.perf_counter()
+            try:
+                raw, size, source_size = processing.run(
+                    render, data, geometry_string, options, wait=wait)
+            except (processing.Busy, futures.TimeoutError):
+                if wait:
+                    raise
+                return self.placeholder(source, geometry_string)
+            metrics.THUMBNAIL_SECONDS.observe(
+                time.perf_counter() - start, format=options['format'])
+            thumbnail.write(raw)
+            thumbnail.set_size(size)
+            source.set_size(source_size)
+        default.kvstore.get_or_set(source)
+        default.kvstore.set(thumbnail, source)
+        return thumbnail
+
+    def placeholder(self, source, geometry_string):
+        """Оригинал с размерами миниатюры, пока она не построена.
+
+        В хранилище ключей заглушка не попадает, и следующий запрос
+        снова попробует построить миниатюру.
+        """
+        image = ImageFile(source.name, source.storage)
+        width, height = parse_geometry(geometry_string)
+        if width and height:
+            image.set_size((width, height))
+        return image
+
+    def _get_thumbnail_filename(self, source, geometry_string, options):
+        if options['format'] in base.EXTENSIONS:
+            return super()._get_thumbnail_filename(
+                source, geometry_string, options)
+        # AVIF и другие форматы, которых sorl не знает
+        key = tokey(source.key, geometry_string, serialize(options))
+        path = f'{key[:2]}/{key[2:4]}/{key}'
+        extension = options['format'].lower()
+        return f'{thumbnail_settings.THUMBNAIL_PREFIX}{path}.{extension}'
+
+
+def variants():
+    return settings.POST_THUMBNAIL_VARIANTS
+
+
+def formats():
+    """Форматы из настроек, которые умеет сохранять установленный Pillow."""
+    Image.init()
+    return [
+        format_ for format_ in settings.POST_THUMBNAIL_FORMATS
+        if format_ in Image.SAVE
+    ]
+
+
+def ladder(variant):
+    """Пары (ширина, геометрия) лестницы размеров варианта."""
+    geometry, _ = variants()[variant]
+    width, height = (int(side) for side in geometry.split('x'))
+    widths = {w for w in settings.POST_THUMBNAIL_WIDTHS if w < width}
+    return [
+        (w, f'{w}x{round(height * w / width)}')
+        for w in sorted(widths | {width})
+    ]
+
+
+def _arguments(variant, geometry=None, format_=None):
+    base_geometry, options = variants()[variant]
+    if format_:
+        options = dict(options, format=format_)
+    return geometry or base_geometry, options
+
+
+def lookup(image, variant, geometry=None, format_=None):
+    geometry, options = _arguments(variant, geometry, format_)
+    return default.backend.lookup(image, geometry, **options)
+
+
+def _targets(image, variant):
+    """Файлы основной миниатюры варианта и всей его лестницы."""
+    geometry, options = _arguments(variant)
+    targets = [default.backend.target(image, geometry, **options)]
+    for format_ in formats():
+        for _, size in ladder(variant):
+            geometry, options = _arguments(variant, size, format_)
+            targets.append(default.backend.target(image, geometry, **options))
+    return targets
+
+
+def prefetch(images, variant):
+    """Загружает записи всех миниатюр страницы одним обращением к кэшу."""
+    targets = []
+    for image in images:
+        if image:
+            targets.extend(_targets(image, variant))
+    default.kvstore.prefetch(targets)
+
+
+def picture(image, variant):
+    """Готовые файлы варианта для <picture>, или None, если их еще нет.
+
+    Основной файл варианта идет в src, лестница его формата - в srcset
+    тега img, остальные форматы - в теги source.
+    """
+    fallback = lookup(image, variant)
+    if fallback is None:
+        return None
+    _, options = variants()[variant]
+    fallback_format = options.get(
+        'format', thumbnail_settings.THUMBNAIL_FORMAT)
+    result = {
+        'src': fallback,
+        'srcset': f'{fallback.url} {fallback.width}w',
+        'sources': [],
+    }
+    for format_ in formats():
+        found = []
+        for width, geometry in ladder(variant):
+            thumbnail = lookup(image, variant, geometry, format_)
+            if thumbnail is not None:
+                found.append(f'{thumbnail.url} {width}w')
+        if not found:
+            continue
+        if format_ == fallback_format:
+            result['srcset'] = ', '.join(found)
+        else:
+            result['sources'].append(
+                {'type': MIME_TYPES[format_], 'srcset': ', '.join(found)})
+    return result
+
+
+def generate(post):
+    """Строит все варианты миниатюр изображения поста.
+
+    Записи всей лестницы читаются из хранилища ключей одним запросом и
+    пишутся в него одной вставкой.
+    """
+    # файл поля, а не имя: ключ sorl зависит от хранилища
+    image = post.image
+    default.kvstore.prefetch(
+        [target for variant in variants() for target in _targets(
+            image, variant)],
+        sources=[ImageFile(image)])
+    with default.kvstore.batch():
+        for variant, (geometry, options) in variants().items():
+            default.backend.build(image, geometry, **options)
+            for format_ in formats():
+                for _, size in ladder(variant):
+                    default.backend.build(
+                        image, size, **dict(options, format=format_))
+
+
+def _generate(post):
+    try:
+        generate(post)
+    except Exception:
+        logger.exception('Не удалось построить миниатюры %s', post.image)
+        return
+    finally:
+        connections.close_all()
+    # фрагменты лент, отрисованные до готовности миниатюр,
+    # ссылаются на оригинал
+    feed_cache.bump_post(post)
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = futures.ThreadPoolExecutor(
+                max_workers=settings.POST_THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails')
+        return _executor
+
+
+def _submit(post):
+    if settings.POST_THUMBNAIL_WORKERS:
+        _get_executor().submit(_generate, post)
+    else:
+        generate(post)
+
+
+def schedule(post):
+    """Ставит построение миниатюр в очередь после коммита транзакции."""
+    if post.image:
+        transaction.on_commit(lambda: _submit(post))
@@ -0,0 +1,144 @@
+"""Запись в материализованные ленты подписок (fan-out on write).
+
+Посты авторов, у которых подписчиков не меньше
+FEED_CELEBRITY_FOLLOWERS, по лентам не раскладываются: лента подписок
+подмешивает их при чтении из списков последних постов автора. При
+подписке и при выходе автора из популярных в ленты копируются только
+его последние FEED_AUTHOR_RECENT_POSTS постов - столько же, сколько
+подмешивается при чтении.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from core import stampede
+
+from . import counters
+from .models import Follow, Post, TimelineEntry, UserStats
+
+BATCH_SIZE = 500
+RECENT_POSTS_TIMEOUT = 60 * 60
+
+
+def _insert(entries):
+    TimelineEntry.objects.bulk_create(
+        entries, batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+
+def followers_count(author_id):
+    return counters.user_stats(author_id).followers_count
+
+
+def is_celebrity(author_id):
+    """Посты автора подмешиваются при чтении, а не раскладываются."""
+    return followers_count(author_id) >= settings.FEED_CELEBRITY_FOLLOWERS
+
+
+def celebrities(user):
+    """id авторов из подписок пользователя, которых лента читает сама."""
+    author_ids = Follow.objects.filter(user=user).values('author_id')
+    return UserStats.objects.filter(
+        user_id__in=author_ids,
+        followers_count__gte=settings.FEED_CELEBRITY_FOLLOWERS,
+    ).values_list('user_id', flat=True)
+
+
+def recent_posts_key(author_id):
+    return f'posts:recent:{author_id}'
+
+
+def recent_posts(author_id):
+    """Последние посты автора как список (pub_date, id) по убыванию."""
+    return stampede.get_or_compute(
+        recent_posts_key(author_id),
+        lambda: list(
+            Post.objects.filter(author_id=author_id)
+            .order_by('-pub_date', '-pk')
+            .values_list('pub_date', 'pk')
+            [:settings.FEED_AUTHOR_RECENT_POSTS]
+        ),
+        RECENT_POSTS_TIMEOUT)
+
+
+def forget_recent_posts(author_id):
+    cache.delete(recent_posts_key(author_id))
+
+
+def push_post(post):
+    """Раскладывает новый пост в ленты всех подписчиков автора."""
+    if is_celebrity(post.author_id):
+        return
+    follower_ids = Follow.objects.filter(
+        author_id=post.author_id).values_list('user_id', flat=True)
+    batch = []
+    for user_id in follower_ids.iterator():
+        batch.append(TimelineEntry(
+            user_id=user_id, post_id=post.pk,
+            author_id=post.author_id, pub_date=post.pub_date))
+        if len(batch) >= BATCH_SIZE:
+            _insert(batch)
+            batch = []
+    if batch:
+        _insert(batch)
+
+
+def move_post(post):
+    """Переносит пост, сменивший автора, в ленты подписчиков нового."""
+    TimelineEntry.objects.filter(post_id=post.pk).delete()
+    push_post(post)
+
+
+def add_author(user_ids, author_id):
+    """Добавляет в ленты пользователей последние посты автора."""
+    posts = list(
+        Post.objects.filter(author_id=author_id)
+        .order_by('-pub_date', '-pk')
+        .values_list('pk', 'pub_date')
+        [:settings.FEED_AUTHOR_RECENT_POSTS])
+    if not posts:
+        return
+    batch = []
+    for user_id in user_ids:
+        for post_id, pub_date in posts:
+            batch.append(TimelineEntry(
+                user_id=user_id, post_id=post_id,
+                author_id=author_id, pub_date=pub_date))
+            if len(batch) >= BATCH_SIZE:
+                _insert(batch)
+                batch = []
+    if batch:
+        _insert(batch)
+
+
+def follow(user_id, author_id):
+    if is_celebrity(author_id):
+        return
+    add_author([user_id], author_id)
+
+
+def unfollow(user_id, author_id):
+    """Убирает посты автора из ленты отписавшегося пользователя.
+
+    Если автор ниже порога, а его постов нет ни в одной ленте, значит,
+    раньше они подмешивались при чтении: теперь они раскладываются по
+    лентам оставшихся подписчиков. Проверка не зависит от того, на
+    сколько сразу уменьшился счетчик.
+    """
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+    if is_celebrity(author_id):
+        return
+    if TimelineEntry.objects.filter(author_id=author_id).exists():
+        return
+    follower_ids = Follow.objects.filter(
+        author_id=author_id).values_list('user_id', flat=True)
+    add_author(list(follower_ids), author_id)
+
+
+def rebuild(user_id):
+    """Пересобирает ленту пользователя по текущим подпискам."""
+    author_ids = Follow.objects.filter(
+        user_id=user_id).values_list('author_id', flat=True)
+    with transaction.atomic():
+        TimelineEntry.objects.filter(user_id=user_id).delete()
+        for author_id in list(author_ids):
+            follow(user_id, author_id)
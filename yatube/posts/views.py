@@ -1,65 +1,124 @@
+from urllib.parse import urlencode
+
+from django.conf import settings
 from django.core.paginator import Paginator
 from django.shortcuts import render, get_object_or_404
 from .models import Post, Group, User, Follow
 from .forms import PostForm, CommentForm
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import redirect
-from django.conf import settings
+from django.db import transaction
+from core.query_budget import query_budget
+from . import counters, feed_cache, search, thumbnails
+from .feeds import FollowFeed
+from .paginators import paginate
+
+
+def _group_feeds(request, slug):
+    group_id = feed_cache.group_id(slug)
+    if group_id is not None:
+        return (f'group:{group_id}',)
+
+
+def _profile_feeds(request, username):
+    user_id = User.objects.filter(
+        username=username).values_list('pk', flat=True).first()
+    if user_id is not None:
+        return (f'profile:{user_id}', f'follows:{user_id}')
+
+
+def _post_feeds(request, post_id):
+    author_id = Post.objects.filter(
+        pk=post_id).values_list('author_id', flat=True).first()
+    if author_id is not None:
+        return (f'post:{post_id}', f'profile:{author_id}')
 
 
+def follow_button(request, username):
+    """Контекст кнопки подписки: страница профиля общая для всех."""
+    following = request.user.is_authenticated and Follow.objects.filter(
+        user=request.user, author__username=username).exists()
+    return {'following': following}
+
+
+@query_budget(queries=6)
+@feed_cache.conditional(lambda request: ('index',))
+@feed_cache.cache_page(lambda request: ('index',))
 def index(request):
-    posts = Post.objects.all()
-    paginator = Paginator(posts, settings.PAGINATOR_OBJECTS_PER_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    posts = Post.objects.for_feed()
+    page_obj = paginate(request, posts)
     title = 'Последние обновления на сайте'
     context = {
         'title': title,
         'posts': posts,
         'page_obj': page_obj,
+        'feed_cache_key': feed_cache.fragment_key(request, 'index'),
     }
     return render(request, 'posts/index.html', context)
 
 
+@query_budget(queries=6)
+@feed_cache.conditional(_group_feeds)
+@feed_cache.cache_page(_group_feeds)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
-    paginator = Paginator(posts, settings.PAGINATOR_OBJECTS_PER_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    posts = group.posts.for_feed()
+    page_obj = paginate(request, posts, count=group.posts_count)
     title = f'Записи сообщества {group.title}'
     context = {
         'title': title,
         'group': group,
         'posts': posts,
         'page_obj': page_obj,
+        'feed_cache_key': feed_cache.fragment_key(
+            request, f'group:{group.pk}'),
     }
     return render(request, 'posts/group_list.html', context)
 
 
+@query_budget(queries=8)
+@feed_cache.conditional(_profile_feeds)
+@feed_cache.cache_page(_profile_feeds)
 def profile(request, username):
     user = get_object_or_404(User, username=username)
-    post_list = user.posts.all()
-    paginator = Paginator(post_list, settings.PAGINATOR_OBJECTS_PER_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    following = Follow.objects.filter(user__username=request.user,
-                                      author=user).exists()
+    post_list = user.posts.for_feed()
+    stats = counters.user_stats(user.pk)
+    page_obj = paginate(request, post_list, count=stats.posts_count)
     context = {
         'page_obj': page_obj,
         'author': user,
+        'stats': stats,
         'post_list': post_list,
-        'following': following,
+        'feed_cache_key': feed_cache.fragment_key(
+            request, f'profile:{user.pk}'),
     }
     return render(request, 'posts/profile.html', context)
 
 
+@query_budget(queries=6)
+def post_search(request):
+    query = request.GET.get('q', '').strip()
+    results = search.SearchResults(query)
+    paginator = Paginator(results, settings.PAGINATOR_OBJECTS_PER_PAGE)
+    page_obj = paginator.get_page(request.GET.get('page'))
+    context = {
+        'title': f'Поиск: {query}' if query else 'Поиск',
+        'query': query,
+        'page_obj': page_obj,
+        'page_query': urlencode({'q': query}) + '&',
+    }
+    return render(request, 'posts/search.html', context)
+
+
+@query_budget(queries=8)
+@feed_cache.conditional(_post_feeds)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
-    author_posts_count = Post.objects.filter(author_id=post.author_id).count()
+    post = get_object_or_404(
+        Post.objects.select_related('author', 'group'), id=post_id)
+    author_posts_count = counters.user_stats(post.author_id).posts_count
     title = str(post)
     form = CommentForm(request.POST or None)
-    comments = post.comments.all()
+    comments = post.comments.select_related('author').order_by('created')
     context = {
         'post': post,
         'author_posts_count': author_posts_count,
@@ -71,6 +130,7 @@ def post_detail(request, post_id):
 
 
 @login_required
+@transaction.atomic
 def post_delete(request, post_id):
     post = get_object_or_404(Post, id=post_id)
     context = {
@@ -82,7 +142,11 @@ def post_delete(request, post_id):
     return render(request, 'posts/post_delete.html', context)
 
 
+# полнотекстовый индекс, счетчики и ленты подписчиков; при
+# POST_THUMBNAIL_WORKERS = 0 еще три запроса миниатюр после коммита
+@query_budget(queries=12)
 @login_required
+@transaction.atomic
 def post_create(request):
     form = PostForm(request.POST, files=request.FILES or None)
     if request.method != 'POST':
@@ -94,10 +158,12 @@ def post_create(request):
     form = form.save(commit=False)
     form.author = request.user
     form.save()
+    thumbnails.schedule(form)
     return redirect('posts:profile', username=form.author)
 
 
 @login_required
+@transaction.atomic
 def post_edit(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
     is_edit = True
@@ -109,6 +175,8 @@ def post_edit(request, post_id):
         return redirect('posts:post_detail', post_id=post.pk)
     if form.is_valid():
         form.save()
+        if 'image' in form.changed_data:
+            thumbnails.schedule(post)
         return redirect('posts:post_detail', post_id=post.pk)
     return render(request, 'posts/create_post.html',
                   {'form': form, 'username': request.user,
@@ -116,6 +184,7 @@ def post_edit(request, post_id):
 
 
 @login_required
+@transaction.atomic
 def add_comment(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
     form = CommentForm(request.POST or None)
@@ -127,12 +196,11 @@ def add_comment(request, post_id):
     return redirect('posts:post_detail', post_id=post_id)
 
 
+@query_budget(queries=8)
 @login_required
 def follow_index(request):
-    follow_post = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(follow_post, settings.PAGINATOR_OBJECTS_PER_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    follow_post = FollowFeed(request.user)
+    page_obj = paginate(request, follow_post)
     title = 'Посты мои подписок'
     context = {
         'title': title,
@@ -142,7 +210,10 @@ def follow_index(request):
     return render(request, 'posts/follow.html', context)
 
 
+# подписка обновляет счетчики обоих и раскладывает посты автора по ленте
+@query_budget(queries=12)
 @login_required
+@transaction.atomic
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
     if author != request.user:
@@ -151,6 +222,7 @@ def profile_follow(request, username):
 
 
 @login_required
+@transaction.atomic
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
     follower = Follow.objects.filter(user=request.user, author=author)
@@ -48,12 +48,16 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.slow_queries.SlowQueryMiddleware',
+    'core.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.query_budget.QueryBudgetMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'core.profiling.ProfilingMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -65,7 +69,7 @@ STATICFILES_DIRS = (os.path.join(BASE_DIR, 'static'),)
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.metrics.DjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -138,11 +142,101 @@ EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 # указываем директорию, в которую будут складываться файлы писем
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 PAGINATOR_OBJECTS_PER_PAGE = 10
+# лента по курсору (pub_date, id) вместо номеров страниц по умолчанию
+PAGINATOR_CURSOR_MODE = False
+# с этого числа подписчиков посты автора не раскладываются по лентам
+# подписок, а подмешиваются при чтении
+FEED_CELEBRITY_FOLLOWERS = 1000
+# длина кэшируемого списка последних постов такого автора
+FEED_AUTHOR_RECENT_POSTS = 100
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
+# оригиналы изображений больше этой стороны уменьшаются при загрузке,
+# больше этого числа пикселей - отклоняются
+POST_IMAGE_MAX_SIDE = 2048
+POST_IMAGE_MAX_PIXELS = 50_000_000
+POST_IMAGE_QUALITY = 85
+# удалять файл картинки, когда на него перестает ссылаться последний
+# пост; остальное подбирает команда collect_media_garbage
+POST_IMAGE_DELETE_UNREFERENCED = True
+# файлы моложе стольких секунд не удаляются ни при освобождении, ни
+# сборщиком: повторная загрузка могла сослаться на файл до коммита поста
+MEDIA_GC_MIN_AGE = 3600
+# сторона размытой заглушки, которая видна, пока грузится картинка
+POST_IMAGE_PLACEHOLDER_SIZE = 16
+# процессов для обработки изображений (0 - в процессе веб-сервера),
+# длина очереди к ним и сколько секунд ждать места в очереди и результата
+IMAGE_PROCESS_WORKERS = 2
+IMAGE_PROCESS_QUEUE = 16
+IMAGE_PROCESS_TIMEOUT = 30
+# миниатюры строятся после сохранения поста, шаблоны берут готовые
+THUMBNAIL_BACKEND = 'posts.thumbnails.ThumbnailBackend'
+POST_THUMBNAIL_VARIANTS = {
+    'card': ('960x339', {'crop': 'center', 'upscale': True}),
+}
+# ширины адаптивной лестницы и форматы в порядке предпочтения;
+# форматы, которых не умеет установленный Pillow, пропускаются
+POST_THUMBNAIL_WIDTHS = (320, 480, 640, 960)
+POST_THUMBNAIL_FORMATS = ('AVIF', 'WEBP', 'JPEG')
+POST_THUMBNAIL_SIZES = '(max-width: 992px) 100vw, 960px'
+# записи хранилища миниатюр, которые держатся в памяти процесса
+THUMBNAIL_KVSTORE = 'posts.kvstore.KVStore'
+THUMBNAIL_LOCAL_CACHE_SIZE = 4096
+THUMBNAIL_LOCAL_CACHE_TTL = 300
+# потоков в пуле построения миниатюр, 0 - строить сразу после коммита
+POST_THUMBNAIL_WORKERS = 2
+# горячие ключи - в памяти процесса (L1), остальное и журнал сбросов L1 -
+# в одном файле кэша на все процессы сервера, с вытеснением по LRU
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+        'BACKEND': 'core.tiered_cache.TieredCache',
+        'OPTIONS': {
+            'L2': 'shared',
+            'L1_PREFIXES': ('posts:gen:', 'posts:modified:', 'posts:group:'),
+            'L1_SIZE': 1024,
+            'L1_TTL': 60,
+            'POLL_INTERVAL': 0.5,
+            'METRICS_LABEL': 'default',
+        },
+    },
+    'shared': {
+        'BACKEND': 'core.sqlite_cache.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100_000,
+            'MAX_SIZE': 256 * 2**20,
+            'METRICS_LABEL': 'shared',
+        },
+    },
 }
+# файлы метрик процессов сервера, None - метрики не собираются.
+# /metrics отвечает только с заголовком Authorization: Bearer
+# METRICS_TOKEN (bearer_token в настройках Prometheus), None - не отвечает
+METRICS_DIR = os.path.join(BASE_DIR, 'metrics')
+METRICS_TOKEN = None
+# доля запросов, которые профилируются без просьбы сотрудника, как часто
+# снимается стек профилируемого запроса и сколько профилей хранить
+PROFILING_SAMPLE_RATE = 0
+PROFILING_INTERVAL = 0.005
+PROFILING_KEEP = 200
+# запросы дольше стольких миллисекунд попадают в журнал медленных
+# запросов с планом выполнения; None - журнал выключен
+SLOW_QUERY_MS = 100
+# бюджет запросов к базе на запрос к сайту без загрузки сессии и
+# пользователя, если у представления нет своего, и сколько одинаковых
+# запросов считать N+1
+QUERY_BUDGET_QUERIES = 20
+QUERY_BUDGET_MS = 200
+QUERY_REPEAT_THRESHOLD = 5
+# истекшее значение еще столько секунд отдается, пока один запрос его
+# пересчитывает; аренда пересчета живет CACHE_LEASE_TIMEOUT секунд, а
+# без прежнего значения остальные ждут результата CACHE_LEASE_WAIT
+CACHE_STALE_TIMEOUT = 300
+CACHE_LEASE_TIMEOUT = 30
+CACHE_LEASE_WAIT = 2
+# больше 1 - пересчитывать горячие ключи раньше истечения
+CACHE_EARLY_BETA = 1.0
+# сколько секунд хранится общая для гостей и пользователей страница;
+# после записи ключ страницы меняется сам, так что срок - запасной
+PAGE_CACHE_TIMEOUT = 600
@@ -0,0 +1,20 @@
+"""Настройки тестов: боевые настройки с отличиями ниже.
+
+pytest берет их из pytest.ini, manage.py test - по умолчанию.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import CACHES
+
+# тесты не должны видеть кэш запущенного сервера и прошлых прогонов;
+# сам SQLiteCache проверяют свои тесты во временном файле
+CACHES = dict(CACHES, shared={
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+})
+# миниатюры строятся сразу, чтобы фоновый поток не писал во временный
+# MEDIA_ROOT, который тест уже удаляет
+POST_THUMBNAIL_WORKERS = 0
+# метрики и журнал медленных запросов тесты включают сами через
+# override_settings: иначе они пишут в каталог сервера и добавляют
+# запросы к базе в тесты, которые их считают
+METRICS_DIR = None
+SLOW_QUERY_MS = None